@@ -0,0 +1,174 @@
+"""
+Benchmarks the decoding of marshalled p4 records, comparing the original
+approach (marshal.load on the stream followed by a per-record conversion)
+against xpf.marshalling.
+
+Synthetic fstat style records are marshalled into a buffer (as they would
+be emitted by p4 -G) and then read back and decoded. Both the decoding of
+the records alone and the full read of the stream are measured.
+
+Usage:
+
+    python benchmarks/decode.py [record_count]
+"""
+import io
+import os
+import sys
+import time
+import marshal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xpf import marshalling
+
+
+# ------------------------------------------------------------------------------
+def legacy_decode(dictionary):
+    """
+    The decoding as it was originally implemented within
+    ThreadedP4Call._byte_dict_to_str_dict
+    """
+    if sys.version_info.major < 3:
+        return dictionary
+
+    converted_output = dict()
+
+    for k, v in dictionary.items():
+        k = k.decode('utf8') if isinstance(k, bytes) else k
+        v = v.decode('utf8') if isinstance(v, bytes) else v
+
+        converted_output[k] = v
+
+    return converted_output
+
+
+# ------------------------------------------------------------------------------
+def build_stream(count):
+    """
+    Returns a buffer containing the given number of marshalled fstat records
+    """
+    stream = io.BytesIO()
+
+    for idx in range(count):
+        record = {
+            'code': 'stat',
+            'depotFile': '//depot/dir%s/file%s.txt' % (idx % 50, idx),
+            'clientFile': '/ws/dir%s/file%s.txt' % (idx % 50, idx),
+            'isMapped': '',
+            'headAction': 'edit',
+            'headType': 'text',
+            'headTime': str(1600000000 + idx),
+            'headRev': str(idx % 9 + 1),
+            'headChange': str(1000 + idx % 200),
+            'headModTime': str(1600000000 + idx),
+            'haveRev': str(idx % 9 + 1),
+            'fileSize': str(idx * 10),
+        }
+
+        marshal.dump(
+            dict(
+                (k.encode('utf8'), v.encode('utf8'))
+                for k, v in record.items()
+            ),
+            stream,
+            0,
+        )
+
+    return stream.getvalue()
+
+
+# ------------------------------------------------------------------------------
+def measure_decode(decode, records):
+    """
+    Returns the number of already loaded records converted per second
+    using the given decoder
+    """
+    start = time.time()
+
+    for record in records:
+        decode(record)
+
+    return len(records) / (time.time() - start)
+
+
+# ------------------------------------------------------------------------------
+def measure_legacy_stream(data):
+    """
+    Returns the number of records read and decoded per second using
+    marshal.load and the legacy conversion
+    """
+    stream = io.BytesIO(data)
+    count = 0
+
+    start = time.time()
+
+    try:
+        while True:
+            legacy_decode(marshal.load(stream))
+            count += 1
+
+    except EOFError:
+        pass
+
+    return count / (time.time() - start)
+
+
+# ------------------------------------------------------------------------------
+def measure_stream(data):
+    """
+    Returns the number of records read and decoded per second using
+    xpf.marshalling.iter_records
+    """
+    stream = io.BytesIO(data)
+    count = 0
+
+    start = time.time()
+
+    for _ in marshalling.iter_records(stream):
+        count += 1
+
+    return count / (time.time() - start)
+
+
+# ------------------------------------------------------------------------------
+def main(count=500000):
+    data = build_stream(count)
+    records = list(marshalling.iter_records(io.BytesIO(data)))
+    raw_records = [
+        marshal.loads(marshal.dumps(
+            dict((k.encode('utf8'), v.encode('utf8')) for k, v in record.items()),
+            0,
+        ))
+        for record in records
+    ]
+
+    marshalling.clear_caches()
+
+    results = [
+        (
+            'decode only',
+            max(measure_decode(legacy_decode, raw_records) for _ in range(3)),
+            max(measure_decode(marshalling.decode_record, raw_records) for _ in range(3)),
+        ),
+        (
+            'read + decode',
+            max(measure_legacy_stream(data) for _ in range(3)),
+            max(measure_stream(data) for _ in range(3)),
+        ),
+    ]
+
+    print('records : %s' % count)
+
+    for label, legacy, current in results:
+        print(
+            '%-14s: legacy %9.0f records/s, xpf %9.0f records/s (%.2fx)' % (
+                label,
+                legacy,
+                current,
+                current / legacy,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
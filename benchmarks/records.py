@@ -0,0 +1,56 @@
+"""
+Measures the memory used to hold a large fstat style result as a list of
+dictionaries compared to an xpf.records.CompactResult.
+
+Usage:
+
+    python benchmarks/records.py [record_count]
+"""
+import io
+import os
+import sys
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xpf import records
+from xpf import marshalling
+
+from decode import build_stream
+
+
+# ------------------------------------------------------------------------------
+def measure(factory, data):
+    """
+    Returns the number of bytes allocated to hold the result built by
+    the given factory from the marshalled stream
+    """
+    marshalling.clear_caches()
+    gc.collect()
+
+    tracemalloc.start()
+    result = factory(marshalling.iter_records(io.BytesIO(data)))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del result
+    return size
+
+
+# ------------------------------------------------------------------------------
+def main(count=1000000):
+    data = build_stream(count)
+
+    as_list = measure(list, data)
+    as_compact = measure(records.CompactResult, data)
+
+    print('records        : %s' % count)
+    print('list of dicts  : %8.1f MB' % (as_list / 1048576.0))
+    print('compact result : %8.1f MB' % (as_compact / 1048576.0))
+    print('reduction      : %.2fx' % (float(as_list) / as_compact))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,142 @@
+"""
+Shared fixtures for the xpf tests. None of the tests need a perforce
+server, calls which reach p4 are answered by a small fake p4 executable
+placed at the front of the PATH.
+"""
+import os
+import sys
+import json
+import stat
+import textwrap
+
+import pytest
+
+import xpf
+from xpf import cache
+from xpf import views
+from xpf import opened
+from xpf import variables
+from xpf import workspace
+
+
+# -- The fake p4 executable. Every call is logged (one json list of the
+# -- arguments per line) and answered with a record per file argument
+_FAKE_P4 = textwrap.dedent(
+    """
+    import os
+    import sys
+    import json
+    import time
+    import marshal
+
+    argv = sys.argv[1:]
+
+    with open(os.environ['FAKEP4_LOG'], 'a') as log:
+        log.write(json.dumps(argv) + '\\n')
+
+    time.sleep(float(os.environ.get('FAKEP4_SLEEP', '0')))
+
+    marshalled = False
+
+    while argv and argv[0].startswith('-'):
+        option = argv.pop(0)
+
+        if option == '-G':
+            marshalled = True
+
+        elif option in ('-p', '-c', '-u', '-H', '-x'):
+            argv.pop(0)
+
+    command = argv.pop(0)
+    files = [arg for arg in argv if not arg.startswith('-')]
+    out = sys.stdout.buffer
+
+    def emit(record):
+        marshal.dump(
+            dict(
+                (key.encode(), value.encode())
+                for key, value in record.items()
+            ),
+            out,
+            0,
+        )
+
+    if command in os.environ.get('FAKEP4_FAIL', '').split(','):
+        emit(dict(code='error', data='server down', severity='3'))
+        sys.exit(1)
+
+    if command == 'info':
+        emit(dict(code='stat', clientName='ws', userName='bob', clientHost='host'))
+
+    elif command == 'set':
+        out.write(b'P4CLIENT=ws (set)\\nP4USER=bob (set)\\nP4PORT=srv:1666 (set)\\n')
+
+    elif command == 'fstat':
+        for path in files:
+            emit(dict(code='stat', depotFile=path, headRev='1'))
+
+    elif command == 'edit':
+        for path in files:
+            emit(dict(code='stat', depotFile=path, action='edit', change='default'))
+    """
+)
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def reset_xpf():
+    """
+    Restores the xpf variables and empties every in-process cache after
+    each test, so no test can see the state of another.
+    """
+    saved = dict(
+        (name, value)
+        for name, value in vars(variables).items()
+        if name.startswith('_') and name[1:].isupper()
+    )
+
+    yield
+
+    for name, value in saved.items():
+        setattr(variables, name, value)
+
+    cache.clear()
+    views.clear_cache()
+    opened.clear_cache()
+    workspace.close_all()
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture
+def fake_p4(tmp_path, monkeypatch):
+    """
+    Places the fake p4 at the front of the PATH, returning a function which
+    gives back the arguments of every call it has received.
+    """
+    if os.name == 'nt':
+        pytest.skip('The fake p4 executable requires a posix platform')
+
+    script = tmp_path / 'p4'
+    script.write_text('#!%s\n%s' % (sys.executable, _FAKE_P4))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    log = tmp_path / 'calls.log'
+    log.write_text('')
+
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKEP4_LOG', str(log))
+
+    xpf.variables.set_timeout(10)
+
+    # ----------------------------------------------------------------------
+    def calls(command=None):
+        logged = [json.loads(line) for line in log.read_text().splitlines()]
+
+        if command is None:
+            return logged
+
+        return [call for call in logged if command in call]
+
+    assert xpf.connection.is_accessible(force=True)
+
+    return calls
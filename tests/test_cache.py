@@ -0,0 +1,100 @@
+import xpf
+from xpf import cache
+
+
+# ------------------------------------------------------------------------------
+def _key(*args):
+    return cache.make_key(list(args), dict(port='srv:1666', client='ws', user='bob'))
+
+
+# ------------------------------------------------------------------------------
+def test_results_are_copied_in_and_out():
+    key = _key('fstat', '//depot/a.txt')
+    results = [dict(depotFile='//depot/a.txt')]
+
+    cache.put(key, results, cache.generation())
+    results[0]['depotFile'] = 'altered'
+
+    cached = cache.get(key)
+    cached[0]['depotFile'] = 'altered again'
+
+    assert cache.get(key) == [dict(depotFile='//depot/a.txt')]
+
+
+# ------------------------------------------------------------------------------
+def test_uncacheable_calls_have_no_key():
+    assert cache.make_key(['edit', '//depot/a.txt'], dict()) is None
+    assert cache.make_key(['fstat', '//depot/a.txt'], dict(on_record=len)) is None
+
+
+# ------------------------------------------------------------------------------
+def test_write_invalidates_overlapping_entries():
+    file_key = _key('fstat', '//depot/a/file.txt')
+    tree_key = _key('fstat', '//depot/a/...')
+    other_key = _key('fstat', '//depot/b/file.txt')
+
+    for key in (file_key, tree_key, other_key):
+        cache.put(key, [dict(code='stat')], cache.generation())
+
+    cache.on_write(['edit', '//depot/a/file.txt'], [])
+
+    assert cache.get(file_key) is cache.MISS
+    assert cache.get(tree_key) is cache.MISS
+    assert cache.get(other_key) == [dict(code='stat')]
+
+
+# ------------------------------------------------------------------------------
+def test_write_without_paths_invalidates_everything():
+    key = _key('fstat', '//depot/a/file.txt')
+    cache.put(key, [dict(code='stat')], cache.generation())
+
+    cache.on_write(None, [])
+
+    assert cache.get(key) is cache.MISS
+
+
+# ------------------------------------------------------------------------------
+def test_results_fetched_across_an_invalidation_are_not_stored():
+    key = _key('fstat', '//depot/a/file.txt')
+    generation = cache.generation()
+
+    cache.invalidate(['//depot/a/file.txt'])
+    cache.put(key, [dict(code='stat')], generation)
+
+    assert cache.get(key) is cache.MISS
+
+
+# ------------------------------------------------------------------------------
+def test_least_recently_used_entries_are_evicted():
+    xpf.variables.set_cache_max_entries(2)
+
+    first = _key('fstat', '//depot/1.txt')
+    second = _key('fstat', '//depot/2.txt')
+    third = _key('fstat', '//depot/3.txt')
+
+    cache.put(first, [], cache.generation())
+    cache.put(second, [], cache.generation())
+
+    # -- Reading the first entry makes the second the least recently used
+    cache.get(first)
+    cache.put(third, [], cache.generation())
+
+    assert cache.get(first) == []
+    assert cache.get(second) is cache.MISS
+    assert cache.get(third) == []
+
+
+# ------------------------------------------------------------------------------
+def test_safe_run_answers_from_the_cache_until_a_write(fake_p4):
+    xpf.variables.set_use_cache(True)
+
+    first = xpf.connection.safe_run('fstat', '//depot/a.txt')
+    second = xpf.connection.safe_run('fstat', '//depot/a.txt')
+
+    assert first == second
+    assert len(fake_p4('fstat')) == 1
+
+    xpf.connection.safe_run('edit', '//depot/a.txt')
+    xpf.connection.safe_run('fstat', '//depot/a.txt')
+
+    assert len(fake_p4('fstat')) == 2
@@ -0,0 +1,93 @@
+import threading
+
+import xpf
+from xpf import connection
+
+
+# ------------------------------------------------------------------------------
+def _run_together(calls):
+    """
+    Runs each of the given argument lists through safe_run on its own
+    thread, returning their results in the same order.
+    """
+    results = [None] * len(calls)
+
+    # --------------------------------------------------------------------------
+    def run(idx):
+        results[idx] = connection.safe_run(*calls[idx])
+
+    threads = [
+        threading.Thread(target=run, args=(idx,))
+        for idx in range(len(calls))
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def test_identical_calls_share_a_single_flight(fake_p4, monkeypatch):
+    xpf.variables.set_single_flight(True)
+    monkeypatch.setenv('FAKEP4_SLEEP', '0.5')
+
+    first, second = _run_together(
+        [
+            ('fstat', '//depot/a.txt'),
+            ('fstat', '//depot/a.txt'),
+        ]
+    )
+
+    assert len(fake_p4('fstat')) == 1
+    assert first == second == [dict(code='stat', depotFile='//depot/a.txt', headRev='1')]
+
+    # -- Each caller is given its own records
+    assert first[0] is not second[0]
+
+
+# ------------------------------------------------------------------------------
+def test_single_flight_is_opt_in(fake_p4, monkeypatch):
+    monkeypatch.setenv('FAKEP4_SLEEP', '0.2')
+
+    _run_together(
+        [
+            ('fstat', '//depot/a.txt'),
+            ('fstat', '//depot/a.txt'),
+        ]
+    )
+
+    assert len(fake_p4('fstat')) == 2
+
+
+# ------------------------------------------------------------------------------
+def test_small_queries_are_coalesced(fake_p4):
+    xpf.variables.set_coalesce_window(0.3)
+
+    first, second = _run_together(
+        [
+            ('fstat', '//depot/a.txt'),
+            ('fstat', '//depot/b.txt'),
+        ]
+    )
+
+    assert len(fake_p4('fstat')) == 1
+    assert [record['depotFile'] for record in first] == ['//depot/a.txt']
+    assert [record['depotFile'] for record in second] == ['//depot/b.txt']
+
+
+# ------------------------------------------------------------------------------
+def test_queries_with_different_flags_are_not_coalesced(fake_p4):
+    xpf.variables.set_coalesce_window(0.3)
+
+    _run_together(
+        [
+            ('fstat', '//depot/a.txt'),
+            ('fstat', '-Ol', '//depot/b.txt'),
+        ]
+    )
+
+    assert len(fake_p4('fstat')) == 2
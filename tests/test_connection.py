@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+import xpf
+from xpf import aio
+from xpf import reactor
+from xpf import connection
+
+
+# ------------------------------------------------------------------------------
+def test_write_hooks_are_given_writes_only(fake_p4):
+    written = list()
+
+    # --------------------------------------------------------------------------
+    def hook(args, results):
+        written.append(args)
+
+    connection.add_write_hook(hook)
+
+    try:
+        connection.safe_run('fstat', '//depot/a.txt')
+        connection.safe_run('edit', '//depot/a.txt')
+
+    finally:
+        connection.remove_write_hook(hook)
+
+    assert written == [['edit', '//depot/a.txt']]
+
+
+# ------------------------------------------------------------------------------
+def test_failed_calls_are_told_apart_from_empty_results(fake_p4, monkeypatch):
+    assert connection.checked_run('fstat', '//depot/a.txt')
+
+    monkeypatch.setenv('FAKEP4_FAIL', 'fstat')
+
+    assert connection.checked_run('fstat', '//depot/a.txt') is None
+
+
+# ------------------------------------------------------------------------------
+@pytest.mark.skipif(not reactor.is_supported(), reason='The reactor is not supported')
+def test_callbacks_never_run_on_the_reactor(fake_p4):
+    xpf.variables.set_use_reactor(True)
+    threads = list()
+
+    # --------------------------------------------------------------------------
+    def on_record(record):
+        threads.append(threading.current_thread())
+
+        # -- A callback making a call of its own must not stall the reactor
+        assert connection.safe_run('fstat', '//depot/nested.txt')
+
+    results = connection.safe_run('fstat', '//depot/a.txt', on_record=on_record)
+
+    assert len(results) == 1
+    assert threads and reactor.get_reactor()._thread not in threads
+
+
+# ------------------------------------------------------------------------------
+def test_aio_calls_use_the_cache_and_write_hooks(fake_p4):
+    xpf.variables.set_use_cache(True)
+
+    # --------------------------------------------------------------------------
+    async def main():
+        await aio.connection.run('fstat', '//depot/a.txt')
+        await aio.connection.run('fstat', '//depot/a.txt')
+        await aio.connection.run('edit', '//depot/a.txt')
+
+        # -- The edit invalidates the cached fstat for both front ends
+        return connection.safe_run('fstat', '//depot/a.txt')
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        results = loop.run_until_complete(main())
+
+    finally:
+        loop.close()
+
+    assert results[0]['depotFile'] == '//depot/a.txt'
+    assert len(fake_p4('fstat')) == 2
@@ -0,0 +1,69 @@
+import os
+
+from xpf import decisions
+
+
+# ------------------------------------------------------------------------------
+def test_record_values_reads_numbered_fields():
+    record = dict(depotFile0='//depot/a.txt', depotFile1='//depot/b.txt')
+
+    assert decisions.record_values(record, 'depotFile') == ['//depot/a.txt', '//depot/b.txt']
+    assert decisions.record_values(dict(depotFile='//depot/a.txt'), 'depotFile') == ['//depot/a.txt']
+    assert decisions.record_values(dict(), 'depotFile') == []
+
+
+# ------------------------------------------------------------------------------
+def test_sync_arguments():
+    description = dict(depotFile0='//depot/b.txt')
+
+    assert decisions.sync_arguments('a.txt') == [['a.txt']]
+    assert decisions.sync_arguments(['a.txt'], description, force=True, revision=3) == [
+        '-f',
+        ['a.txt#3', '//depot/b.txt#3'],
+    ]
+
+
+# ------------------------------------------------------------------------------
+def test_classify_files(tmp_path):
+    edited = str(tmp_path / 'edited.txt')
+    deleted = str(tmp_path / 'deleted.txt')
+    new = str(tmp_path / 'new.txt')
+
+    records = [
+        dict(code='stat', clientFile=edited, headAction='edit'),
+        dict(code='stat', clientFile=deleted, headAction='move/delete'),
+        dict(code='error', data='%s - no such file(s).' % new),
+    ]
+
+    operations = decisions.classify_files([edited, deleted, new], records)
+
+    assert operations == dict(add=[deleted, new], edit=[edited])
+
+
+# ------------------------------------------------------------------------------
+def test_find_change():
+    changes = [
+        dict(change='3', desc='Other work\n'),
+        dict(change='7', desc='  My Work\n'),
+    ]
+
+    assert decisions.find_change(changes, 'my work') == 7
+    assert decisions.find_change(changes, 'missing') is None
+    assert decisions.find_change(None, 'my work') is None
+
+
+# ------------------------------------------------------------------------------
+def test_all_in_change(tmp_path):
+    first = str(tmp_path / 'a.txt')
+    second = str(tmp_path / 'b.txt')
+
+    assert decisions.all_in_change([first], [second, os.path.join(str(tmp_path), '.', 'a.txt')])
+    assert not decisions.all_in_change([first, second], [first])
+
+
+# ------------------------------------------------------------------------------
+def test_sync_results():
+    assert decisions.is_synced([dict(code='error', data='a.txt - file(s) up-to-date.')])
+    assert not decisions.is_synced([dict(code='error', data='a.txt - no such file(s).')])
+    assert not decisions.is_had([])
+    assert not decisions.is_had([dict(code='error', data='a.txt - file(s) not on client.')])
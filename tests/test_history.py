@@ -0,0 +1,110 @@
+import pytest
+
+from xpf import history
+from xpf import connection
+
+
+# ------------------------------------------------------------------------------
+class FakeServer(object):
+    """
+    Stands in for connection.checked_run, answering p4 changes from a run
+    of submitted changes, newest first.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, count):
+        self.changes = list(range(count, 0, -1))
+        self.calls = list()
+        self.fail_after = None
+
+    # --------------------------------------------------------------------------
+    def __call__(self, *args, **kwargs):
+        self.calls.append(args)
+
+        if self.fail_after is not None and len(self.calls) > self.fail_after:
+            return None
+
+        size = int(args[args.index('-m') + 1])
+        changes = self.changes
+
+        # -- Each page after the first is asked for as //...@cursor
+        if '@' in str(args[-1]):
+            cursor = int(args[-1].split('@')[1])
+            changes = [change for change in changes if change <= cursor]
+
+        return [dict(code='stat', change=str(change)) for change in changes[:size]]
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer(25)
+
+    monkeypatch.setattr(connection, 'checked_run', server)
+    monkeypatch.setattr(connection, 'is_accessible', lambda: True)
+
+    return server
+
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_pages_yield_every_change_once(server, prefetch):
+    changes = [
+        int(record['change'])
+        for record in history.iter_changes(page_size=10, prefetch=prefetch)
+    ]
+
+    assert changes == list(range(25, 0, -1))
+    assert len(server.calls) == 3
+
+
+# ------------------------------------------------------------------------------
+def test_limit_stops_paging_early(server):
+    changes = list(history.iter_changes(page_size=10, limit=12))
+
+    assert len(changes) == 12
+
+    # -- The second page only asks for the records still needed
+    assert [call[call.index('-m') + 1] for call in server.calls] == [10, 2]
+
+
+# ------------------------------------------------------------------------------
+def test_failed_page_is_raised_rather_than_ending_the_history(server):
+    server.fail_after = 1
+    changes = list()
+
+    with pytest.raises(RuntimeError):
+        for record in history.iter_changes(page_size=10):
+            changes.append(record)
+
+    assert len(changes) == 10
+
+
+# ------------------------------------------------------------------------------
+def test_reserved_flags_are_rejected(server):
+    with pytest.raises(ValueError):
+        history.iter_changes('-m', 5)
+
+    with pytest.raises(ValueError):
+        history.iter_changes('//depot/...@10')
+
+
+# ------------------------------------------------------------------------------
+def test_filelog_revisions_are_split():
+    record = dict(
+        depotFile='//depot/a.txt',
+        rev0='2',
+        change0='20',
+        action0='edit',
+        rev1='1',
+        change1='10',
+        action1='add',
+        **{'how0,0': 'copy from', 'file0,0': '//depot/b.txt'}
+    )
+
+    revisions = history._split_revisions(record)
+
+    assert [revision['rev'] for revision in revisions] == ['2', '1']
+    assert revisions[0]['depotFile'] == '//depot/a.txt'
+    assert revisions[0]['how'] == ['copy from']
+    assert revisions[1]['action'] == 'add'
@@ -0,0 +1,106 @@
+import io
+import random
+import marshal
+
+import pytest
+
+from xpf import marshalling
+
+
+# ------------------------------------------------------------------------------
+def _marshalled(records):
+    return b''.join(
+        marshal.dumps(
+            dict(
+                (key.encode(), value.encode() if isinstance(value, str) else value)
+                for key, value in record.items()
+            ),
+            0,
+        )
+        for record in records
+    )
+
+
+# ------------------------------------------------------------------------------
+def _records(count):
+    return [
+        dict(code='stat', depotFile='//depot/file%s.txt' % idx, headRev=idx)
+        for idx in range(count)
+    ]
+
+
+# ------------------------------------------------------------------------------
+def test_decode_across_every_chunk_boundary():
+    records = _records(3)
+    data = _marshalled(records)
+
+    for split in range(1, len(data)):
+        decoder = marshalling.StreamDecoder()
+
+        decoded = decoder.feed(data[:split])
+        decoded.extend(decoder.feed(data[split:]))
+        decoded.extend(decoder.close())
+
+        assert decoded == records, split
+        assert decoder.pending == 0
+
+
+# ------------------------------------------------------------------------------
+def test_decode_byte_at_a_time():
+    records = _records(5)
+    data = _marshalled(records)
+    decoder = marshalling.StreamDecoder()
+
+    decoded = list()
+
+    for idx in range(len(data)):
+        decoded.extend(decoder.feed(data[idx:idx + 1]))
+
+    decoded.extend(decoder.close())
+
+    assert decoded == records
+
+
+# ------------------------------------------------------------------------------
+def test_decode_large_record_in_random_chunks():
+    records = [
+        dict(code='stat', desc='x' * (3 * 1024 * 1024)),
+        dict(code='stat', depotFile='//depot/after.txt'),
+    ]
+    data = _marshalled(records)
+    chunks = random.Random(0)
+    decoder = marshalling.StreamDecoder()
+
+    decoded = list()
+    position = 0
+
+    while position < len(data):
+        size = chunks.randint(1, 65536)
+        decoded.extend(decoder.feed(data[position:position + size]))
+        position += size
+
+    decoded.extend(decoder.close())
+
+    assert decoded == records
+
+
+# ------------------------------------------------------------------------------
+def test_truncated_stream_raises_on_close():
+    data = _marshalled(_records(2))
+    decoder = marshalling.StreamDecoder()
+
+    assert len(decoder.feed(data[:-3])) == 1
+
+    with pytest.raises(ValueError):
+        decoder.close()
+
+
+# ------------------------------------------------------------------------------
+def test_iter_records_reads_in_chunks():
+    records = _records(100)
+
+    decoded = list(
+        marshalling.iter_records(io.BytesIO(_marshalled(records)), chunk_size=7)
+    )
+
+    assert decoded == records
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+import xpf
+from xpf import views
+from xpf import assist
+from xpf import opened
+from xpf import connection
+
+
+# ------------------------------------------------------------------------------
+class FakeServer(object):
+    """
+    Stands in for connection.checked_run, answering p4 opened from a
+    dictionary of opened records.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, root):
+        self.root = root
+        self.available = True
+        self.calls = list()
+        self.opened = {
+            '//depot/a.txt': '42',
+            '//depot/b.txt': 'default',
+        }
+
+    # --------------------------------------------------------------------------
+    def __call__(self, *args, **kwargs):
+        self.calls.append(args)
+
+        if not self.available:
+            return None
+
+        depot_paths = sorted(self.opened)
+
+        if isinstance(args[-1], list):
+            depot_paths = [path for path in args[-1] if path in self.opened]
+
+        return [
+            dict(
+                code='stat',
+                depotFile=path,
+                clientFile=os.path.join(self.root, path[len('//depot/'):]),
+                action='edit',
+                change=self.opened[path],
+            )
+            for path in depot_paths
+        ]
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = FakeServer(str(tmp_path))
+
+    monkeypatch.setattr(connection, 'checked_run', server)
+    monkeypatch.setattr(views, 'get_view', lambda **kwargs: None)
+
+    return server
+
+
+# ------------------------------------------------------------------------------
+def test_index_answers_from_the_records(server, tmp_path):
+    index = opened.OpenedIndex(client='ws', port='srv:1666')
+
+    assert index.change_of(str(tmp_path / 'a.txt')) == '42'
+    assert index.is_opened('//depot/b.txt')
+    assert not index.is_opened('//depot/c.txt')
+    assert index.files_in('default') == ['//depot/b.txt']
+    assert index.changes() == ['42', 'default']
+    assert len(server.calls) == 1
+
+
+# ------------------------------------------------------------------------------
+def test_index_which_cannot_be_queried_raises(server):
+    server.available = False
+    index = opened.OpenedIndex(client='ws', port='srv:1666')
+
+    assert not index.ensure_current()
+
+    for read in (index.changes, lambda: index.files_in('42'), lambda: index.record('//depot/a.txt')):
+        with pytest.raises(RuntimeError):
+            read()
+
+
+# ------------------------------------------------------------------------------
+def test_written_files_are_queried_again(server):
+    index = opened.OpenedIndex(client='ws', port='srv:1666')
+    assert index.ensure_current()
+
+    del server.opened['//depot/a.txt']
+    index.mark_written(['revert', '//depot/a.txt'], [])
+    server.available = False
+
+    # -- Whilst the revert cannot be queried the index must not answer
+    with pytest.raises(RuntimeError):
+        index.change_of('//depot/a.txt')
+
+    server.available = True
+
+    assert index.change_of('//depot/a.txt') is None
+    assert index.changes() == ['default']
+    assert server.calls[-1][-1] == ['//depot/a.txt']
+
+
+# ------------------------------------------------------------------------------
+def test_assist_falls_back_to_p4_opened(server, monkeypatch):
+    xpf.variables.set_use_opened_index(True)
+    xpf.variables.set_server_status(True)
+    server.available = False
+
+    index = opened.OpenedIndex(client='ws', port='srv:1666')
+
+    monkeypatch.setattr(opened, 'get_index', lambda: index)
+    monkeypatch.setattr(
+        xpf.direct,
+        'opened',
+        lambda *args, **kwargs: [dict(code='stat', change='7')],
+    )
+
+    assert assist._opened_index() is None
+    assert assist.changelist('//depot/a.txt') == '7'
@@ -0,0 +1,77 @@
+import pytest
+
+from xpf import tables
+from xpf import records
+
+
+# -- Strings which look numeric but would not survive being held as integers
+_AWKWARD_VALUES = ['007', '-0', '+5', ' 5', '5 ', '', '99999999999999999999999']
+
+
+# ------------------------------------------------------------------------------
+def _records():
+    return [
+        dict(
+            code='stat',
+            depotFile='//depot/dir/file%s.txt' % idx,
+            clientFile='//ws/dir/file%s.txt' % idx,
+            headRev=str(idx),
+            desc=value,
+        )
+        for idx, value in enumerate(_AWKWARD_VALUES + ['12'])
+    ]
+
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize('value', _AWKWARD_VALUES)
+def test_awkward_values_are_not_int_strings(value):
+    assert not records.is_int_string(value)
+
+
+# ------------------------------------------------------------------------------
+def test_int_strings():
+    assert records.is_int_string('0')
+    assert records.is_int_string('1234')
+    assert not records.is_int_string(1234)
+
+
+# ------------------------------------------------------------------------------
+def test_compact_results_give_back_the_same_records():
+    result = records.CompactResult(_records())
+
+    assert len(result) == len(_records())
+    assert result.to_list() == _records()
+    assert result[1]['desc'] == '-0'
+    assert result[-1].to_dict() == _records()[-1]
+
+
+# ------------------------------------------------------------------------------
+@pytest.mark.parametrize('value', _AWKWARD_VALUES)
+def test_numeric_columns_keep_awkward_values(value):
+    table = tables.as_table(
+        [
+            dict(depotFile='//depot/a.txt', fileSize='10'),
+            dict(depotFile='//depot/b.txt', fileSize=value),
+        ]
+    )
+
+    # -- The column can no longer be held as integers, so it holds the
+    # -- values exactly as they were given
+    assert not table.is_numeric('fileSize')
+    assert table.column('fileSize') == ['10', value]
+
+
+# ------------------------------------------------------------------------------
+def test_numeric_columns():
+    table = tables.as_table(
+        [
+            dict(depotFile='//depot/a.txt', fileSize='10'),
+            dict(depotFile='//depot/b.txt'),
+            dict(depotFile='//depot/c.txt', fileSize='32'),
+        ]
+    )
+
+    assert table.is_numeric('fileSize')
+    assert list(table.present('fileSize')) == [True, False, True]
+    assert sum(table.column('fileSize')) == 42
+    assert table.row(1) == dict(depotFile='//depot/b.txt')
@@ -0,0 +1,72 @@
+import pytest
+
+from xpf import spill
+
+
+# ------------------------------------------------------------------------------
+def _records(count):
+    return [
+        dict(code='stat', depotFile='//depot/file%s.txt' % idx)
+        for idx in range(count)
+    ]
+
+
+# ------------------------------------------------------------------------------
+def _collect(records, budget):
+    collector = spill.Collector(budget)
+
+    for record in records:
+        collector.append(record)
+
+    return collector.finish()
+
+
+# ------------------------------------------------------------------------------
+def test_results_within_the_budget_stay_a_list():
+    results = _collect(_records(10), budget=1024 * 1024)
+
+    assert isinstance(results, list)
+    assert results == _records(10)
+
+
+# ------------------------------------------------------------------------------
+def test_results_over_the_budget_are_spilled():
+    records = _records(100)
+    results = _collect(records, budget=1024)
+
+    assert isinstance(results, spill.SpilledResult)
+    assert len(results) == 100
+    assert results == records
+    assert results[0] == records[0]
+    assert results[-1] == records[-1]
+    assert results[10:13] == records[10:13]
+    assert list(results) == records
+    assert records[5] in results
+    assert results.index(records[5]) == 5
+    assert results.to_list() == records
+
+
+# ------------------------------------------------------------------------------
+def test_spilled_results_can_be_extended():
+    records = _records(50)
+    results = _collect(records, budget=512)
+
+    results.append(dict(code='stat', depotFile='//depot/extra.txt'))
+    results += _records(2)
+
+    assert len(results) == 53
+    assert results[50] == dict(code='stat', depotFile='//depot/extra.txt')
+    assert results[-2:] == _records(2)
+
+    # -- Concatenation gives a list, as it does for lists
+    combined = results + [dict()]
+    assert isinstance(combined, list)
+    assert len(combined) == 54
+
+
+# ------------------------------------------------------------------------------
+def test_spilled_results_are_not_hashable():
+    results = _collect(_records(50), budget=512)
+
+    with pytest.raises(TypeError):
+        hash(results)
@@ -0,0 +1,94 @@
+import os
+
+from xpf import views
+
+
+# ------------------------------------------------------------------------------
+def _view(root, *lines, **kwargs):
+    spec = dict(Client='ws', Root=str(root))
+
+    for idx, line in enumerate(lines):
+        spec['View%s' % idx] = line
+
+    return views.ClientView(spec, **kwargs)
+
+
+# ------------------------------------------------------------------------------
+def test_exclusion_lines_unmap_paths(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/main/... //ws/main/...',
+        '-//depot/main/secret/... //ws/main/secret/...',
+    )
+
+    assert view.depot_to_client('//depot/main/a.txt') == '//ws/main/a.txt'
+    assert view.depot_to_client('//depot/main/secret/b.txt') is None
+    assert view.client_to_depot('//ws/main/secret/b.txt') is None
+
+
+# ------------------------------------------------------------------------------
+def test_later_lines_override_earlier_lines(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/main/... //ws/main/...',
+        '//depot/patch/... //ws/main/...',
+    )
+
+    # -- The later line claims the client path, so the earlier depot path
+    # -- is no longer mapped
+    assert view.depot_to_client('//depot/main/a.txt') is None
+    assert view.depot_to_client('//depot/patch/a.txt') == '//ws/main/a.txt'
+
+
+# ------------------------------------------------------------------------------
+def test_overlay_lines_keep_earlier_lines(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/main/... //ws/main/...',
+        '+//depot/patch/... //ws/main/...',
+    )
+
+    assert view.depot_to_client('//depot/main/a.txt') == '//ws/main/a.txt'
+    assert view.depot_to_client('//depot/patch/b.txt') == '//ws/main/b.txt'
+
+    # -- The overlay is later, so it wins where both give the client path
+    assert view.client_to_depot('//ws/main/b.txt') == '//depot/patch/b.txt'
+
+
+# ------------------------------------------------------------------------------
+def test_wildcards(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/%%1/src/*.py //ws/code/%%1/*.py',
+    )
+
+    assert view.depot_to_client('//depot/tool/src/run.py') == '//ws/code/tool/run.py'
+    assert view.client_to_depot('//ws/code/tool/run.py') == '//depot/tool/src/run.py'
+
+    # -- A single star never crosses a directory
+    assert view.depot_to_client('//depot/tool/src/sub/run.py') is None
+
+
+# ------------------------------------------------------------------------------
+def test_local_round_trip(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/... //ws/...',
+    )
+
+    local_path = view.depot_to_local('//depot/dir/a%40b.txt')
+
+    assert local_path == os.path.join(str(tmp_path), 'dir', 'a@b.txt')
+    assert view.local_to_depot(local_path) == '//depot/dir/a%40b.txt'
+    assert view.local_to_depot(os.path.dirname(str(tmp_path))) is None
+
+
+# ------------------------------------------------------------------------------
+def test_case_insensitive_views(tmp_path):
+    view = _view(
+        tmp_path,
+        '//depot/Main/... //ws/Main/...',
+        case_sensitive=False,
+    )
+
+    assert view.depot_to_client('//depot/main/a.txt') == '//ws/Main/a.txt'
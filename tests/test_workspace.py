@@ -0,0 +1,147 @@
+import os
+
+import pytest
+
+import xpf
+from xpf import assist
+from xpf import workspace
+from xpf import connection
+
+
+# ------------------------------------------------------------------------------
+class FakeServer(object):
+    """
+    Stands in for connection.checked_run, answering the queries the
+    workspace index makes from a dictionary of fstat records.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, root):
+        self.root = root
+        self.available = True
+        self.calls = list()
+        self.files = {
+            '//depot/had.txt': dict(haveRev='3', headRev='3'),
+            '//depot/opened.txt': dict(haveRev='1', headRev='2', action='edit', change='42'),
+        }
+
+    # --------------------------------------------------------------------------
+    def __call__(self, *args, **kwargs):
+        self.calls.append(args)
+
+        if not self.available:
+            return None
+
+        if args[0] == 'changes':
+            return [dict(code='stat', change='10')]
+
+        flags = [arg for arg in args[3:] if isinstance(arg, str)]
+        paths = [arg for arg in args[3:] if isinstance(arg, list)]
+
+        if paths:
+            depot_paths = [path for path in paths[0] if path in self.files]
+
+        else:
+            depot_paths = sorted(self.files)
+
+        if '-Ro' in flags:
+            depot_paths = [path for path in depot_paths if 'action' in self.files[path]]
+
+        return [self.record(path) for path in depot_paths]
+
+    # --------------------------------------------------------------------------
+    def record(self, depot_path):
+        record = dict(self.files[depot_path])
+        record['code'] = 'stat'
+        record['depotFile'] = depot_path
+        record['clientFile'] = os.path.join(self.root, depot_path[len('//depot/'):])
+
+        return record
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = FakeServer(str(tmp_path))
+    monkeypatch.setattr(connection, 'checked_run', server)
+
+    return server
+
+
+# ------------------------------------------------------------------------------
+@pytest.fixture
+def index(tmp_path):
+    index = workspace.WorkspaceIndex(
+        str(tmp_path / 'index' / 'ws.sqlite3'),
+        client='ws',
+        port='srv:1666',
+    )
+
+    yield index
+
+    index.close()
+
+
+# ------------------------------------------------------------------------------
+def test_index_answers_from_the_records(server, index, tmp_path):
+    assert index.have('//depot/had.txt')
+    assert index.have_revision(str(tmp_path / 'had.txt')) == 3
+    assert index.is_opened('//depot/opened.txt')
+    assert index.changelist('//depot/opened.txt') == '42'
+    assert index.record('//depot/missing.txt') is None
+    assert index.last_change == 10
+
+
+# ------------------------------------------------------------------------------
+def test_index_which_cannot_be_built_raises(server, index):
+    server.available = False
+
+    assert not index.ensure_current()
+
+    with pytest.raises(RuntimeError):
+        index.have('//depot/had.txt')
+
+
+# ------------------------------------------------------------------------------
+def test_written_files_are_queried_again(server, index):
+    assert not index.is_opened('//depot/had.txt')
+
+    server.files['//depot/had.txt']['action'] = 'edit'
+    index.mark_written(['edit', '//depot/had.txt'], [])
+
+    assert index.is_opened('//depot/had.txt')
+    assert server.calls[-1][-1] == ['//depot/had.txt']
+
+
+# ------------------------------------------------------------------------------
+def test_written_files_stay_pending_whilst_the_server_is_down(server, index):
+    assert index.ensure_current()
+
+    server.files['//depot/had.txt']['action'] = 'edit'
+    index.mark_written(['edit', '//depot/had.txt'], [])
+    server.available = False
+
+    # -- The index must not answer from what it knows is out of date
+    with pytest.raises(RuntimeError):
+        index.is_opened('//depot/had.txt')
+
+    server.available = True
+
+    assert index.is_opened('//depot/had.txt')
+
+
+# ------------------------------------------------------------------------------
+def test_assist_falls_back_to_the_server(server, index, monkeypatch):
+    xpf.variables.set_use_workspace_index(True)
+    xpf.variables.set_server_status(True)
+    server.available = False
+
+    monkeypatch.setattr(workspace, 'get_index', lambda: index)
+    monkeypatch.setattr(
+        xpf.direct,
+        'have',
+        lambda *args, **kwargs: [dict(code='stat', depotFile='//depot/had.txt')],
+    )
+
+    assert assist._workspace_index(['//depot/had.txt']) is None
+    assert assist.have('//depot/had.txt')
@@ -123,6 +123,46 @@ xpf.assist.submit_files(
 ```
 
 
+##Xpf Views
+
+Translating paths between depot, client and local syntax would typically
+require a ```p4 where``` call for every path. The ```xpf.views``` module
+instead reads the client spec once, caches it, and performs the translation
+locally using the same wildcard, exclusion and overlay rules as perforce:
+
+```python
+import xpf
+
+view = xpf.views.get_view()
+
+local_path = view.depot_to_local('//depot/my_files/file.txt')
+depot_path = view.local_to_depot(local_path)
+```
+
+
+##Xpf Aio
+
+If you're working within an asyncio application you can use the
+```xpf.aio``` package, which mirrors ```xpf.direct``` and the most common
+```xpf.assist``` functions with awaitable versions. These run through
+asyncio subprocesses, so many queries can be in flight from a single event
+loop without tying up threads. They are failsafe in exactly the same way as
+their synchronous counterparts. This requires Python 3.5 or later so is not
+imported by default:
+
+```python
+import asyncio
+from xpf import aio
+
+
+async def main():
+    opened, editable = await asyncio.gather(
+        aio.direct.opened(),
+        aio.assist.is_editable('/usr/my_files/file.txt'),
+    )
+```
+
+
 ##Xpf Variables
 
 Xpf works at a module level. It is not class based and it wraps the perforce
@@ -147,6 +187,32 @@ Variables which can be retrieved and set in this way include:
     * user
     * port (server)
     * timeout
+    * arg_input_count / arg_input_size (the point at which file lists are
+      passed to p4 as an argument file rather than on the command line)
+    * use_reactor (when True, and running Python 3 on a posix platform,
+      calls are serviced by a single shared thread rather than each call
+      having its own thread, keeping the thread count constant however
+      many calls are in flight. Calls with callbacks or an output, and
+      streamed calls, still have a thread of their own)
+    * coalesce_window (the time in seconds small read only queries are
+      gathered for so they can be combined, see Coalescing)
+    * single_flight (whether identical read only calls share a single
+      p4 process, see Shared Calls)
+    * use_cache / cache_max_entries / cache_max_bytes (whether the results of
+      read only calls are cached and the bounds of that cache, see Caching)
+    * content_cache_dir / content_cache_max_bytes (where file content is
+      cached on disk and how large that cache may grow, see File Content)
+    * use_metadata_cache / metadata_cache_path (whether immutable query
+      results are stored permanently and where, see Metadata Cache)
+    * use_workspace_index / workspace_index_timeout / workspace_index_dir
+      (whether assist queries are answered from a local index of the
+      workspace and where those indexes are held, see Workspace Index)
+    * use_opened_index (whether assist queries of which change a file is
+      opened in are answered from an index of the opened files, see
+      Opened Files)
+    * result_memory_budget (the estimated size in bytes the records of a
+      single call may take up before they are moved to disk, see Spilled
+      Results)
 
 A special variable which can be turned on/off is the `debugging` variable.
 When debugging is turned on xpf will print ever command line its about to
@@ -217,6 +283,13 @@ import xpf
 xpf.direct.info(timeout=10)
 ```
 
+If a call exceeds its timeout the p4 process, along with anything it has
+spawned, is terminated rather than being left to run on in the background.
+Any p4 processes which are still in-flight can be inspected (or cleaned up)
+through ```xpf.connection.live_processes()``` and
+```xpf.connection.terminate_all()```. The latter is also run automatically
+when the interpreter exits.
+
 
 ## Marshalling
 
@@ -229,6 +302,363 @@ shown here:
 string_dump = xof.direct.run('set', marshal=False)  # -- (Equivalent to p4 set)
 ```
 
+##Streaming
+
+For queries which return a very large number of records you can ask for the
+records to be yielded as soon as perforce emits them rather than waiting for
+the whole call to complete. This keeps memory usage bounded and gives you
+the first record quickly:
+
+```python
+import xpf
+
+for record in xpf.direct.fstat('//depot/...', stream=True):
+    print(record['depotFile'])
+```
+
+When streaming, the timeout applies to how long xpf waits for each record
+rather than to the call as a whole.
+
+
+##Paged History
+
+Long histories of changes, file revisions and jobs can be walked a page at
+a time with ```xpf.history```, rather than fetching everything at once or
+guessing at a -m limit. Each page starts where the last one finished and
+the next page is fetched in the background whilst the current one is
+processed, so memory stays bounded and the first records arrive quickly:
+
+```python
+import xpf
+
+for change in xpf.history.iter_changes('-s', 'submitted', '//depot/...'):
+    if int(change['change']) < oldest_change_of_interest:
+        break  # -- No further pages are fetched
+
+for revision in xpf.history.iter_filelog('//depot/file.txt', limit=50):
+    print(revision['rev'], revision['desc'])
+
+for job in xpf.history.iter_jobs('-e', 'Status=open', page_size=100):
+    print(job['Job'])
+```
+
+
+##Raw Output
+
+The raw output of a call (such as the content of a file being printed) can
+be written straight to a destination rather than returned. The output is
+read in fixed size chunks into a single re-used buffer and is never decoded,
+so exporting very large binary files uses a constant amount of memory:
+
+```python
+import hashlib
+import xpf
+
+# -- Write to a file path (a file descriptor or file object also work)
+byte_count = xpf.direct.print_('-q', '//depot/big.bin', output='/tmp/big.bin')
+
+# -- Or hand each chunk to a callable
+digest = hashlib.sha1()
+xpf.direct.print_('-q', '//depot/big.bin', output=digest.update)
+```
+
+The number of bytes written is returned. A callable is given a memoryview
+which is only valid until it returns, so it must copy anything it keeps.
+
+
+##Callbacks
+
+Long running commands such as sync and submit can report on each record as
+soon as it is read, rather than only once the call has completed. Any
+```xpf.direct``` call (as well as ```xpf.assist.sync``` and
+```xpf.assist.submit_files```) accepts the following callbacks:
+
+```python
+import xpf
+
+xpf.assist.sync(
+    '//depot/my_files/...',
+    on_record=lambda record: print(record.get('clientFile')),
+    on_error=lambda record: print(record['data']),
+    on_progress=lambda count: print('%s files synced' % count),
+    timeout=600,
+)
+```
+
+
+##Queries
+
+Rather than fetching every field of every record and filtering in Python,
+```xpf.query``` builds queries which ask the server to only send the
+records and fields you need (using the -F, -T and -m arguments where the
+command supports them):
+
+```python
+import xpf
+
+records = xpf.query.fstat(
+    '//depot/...',
+).where(
+    'headType', 'binary',
+).where_not(
+    'headAction', 'delete',
+).fields(
+    'depotFile', 'headRev',
+).limit(100).run()
+```
+
+Queries can be made of fstat, changes and clients. Any filtering which the
+server cannot do for a command is done once the records are returned.
+
+
+##Batches
+
+When running a command over a large list of files you can have xpf split
+the list into chunks and run those chunks in parallel. The records are
+merged back together in the order the files were given:
+
+```python
+import xpf
+
+results = xpf.batch.map('fstat', paths, '-Ol', chunk=500, workers=8)
+```
+
+The chunk size adapts to how long each chunk takes, and the timeout applies
+to each chunk. If a chunk fails or times out then only the records of that
+chunk are missing from the results.
+
+
+##Per File Queries
+
+```xpf.assist.have``` and ```xpf.assist.is_editable``` give a single answer
+for a whole list of files. When you need to know the answer for each file
+there are map variants. These query the files in chunks (see Batches) and
+return a dictionary keyed by the paths you gave:
+
+```python
+import xpf
+
+have = xpf.assist.have_map(paths)                 # -- {path: bool}
+editable = xpf.assist.editable_map(paths)         # -- {path: bool}
+changes = xpf.assist.changelist_map(paths)        # -- {path: change or None}
+revisions = xpf.assist.head_revision_map(paths)   # -- {path: int or None}
+```
+
+
+##Caching
+
+The results of read only commands (such as fstat, have, where, clients,
+changes and info) can be cached in memory so repeated queries do not go back
+to the server:
+
+```python
+import xpf
+
+xpf.variables.set_use_cache(True)
+
+# -- Alter how long the results of a command are cached for
+xpf.cache.set_ttl('fstat', 2)
+
+print(xpf.cache.stats())
+```
+
+Each command has its own time to live, and the cache is bounded by both
+its number of entries and its estimated size (see the cache_max_entries and
+cache_max_bytes variables). Whenever xpf runs a command which may alter
+files (edit, add, submit, revert, sync etc) any cached results for
+overlapping paths are invalidated.
+
+
+##Shared Calls
+
+When single flight is turned on, if a read only call is made whilst an
+identical call (the same command, arguments and connection settings) is
+already running, xpf waits on the running call rather than starting another
+p4 process. This avoids a
+stampede of identical queries when, for instance, a user interface refreshes
+many panels at once. Each caller still waits with its own timeout, and the
+call is only terminated once every caller has given up on it.
+
+Calls which are given a form or callbacks are never shared. Each caller of
+a shared call is given its own copy of the records, so altering them does not
+affect the other callers. This behaviour is off by default, and is turned on
+with ```xpf.variables.set_single_flight(True)```.
+
+
+##Coalescing
+
+Tools often fire many small queries (such as the fstat of a single file) from
+different threads at almost the same moment. Xpf can gather these for a short
+window and run them as a single p4 call, splitting the records back out to
+each caller:
+
+```python
+import xpf
+
+# -- Gather queries for up to 5 milliseconds
+xpf.variables.set_coalesce_window(0.005)
+```
+
+Only read only commands whose records can be attributed back to the paths
+each caller asked for are combined (fstat, have, where, files and sizes),
+and only when they share the same flags and connection settings. Every
+caller still has its own timeout.
+
+
+##Compact Results
+
+Holding millions of records as dictionaries uses a lot of memory. Any
+```xpf.direct``` call can instead return an ```xpf.records.CompactResult```
+which shares field names, directories and integer values between records,
+whilst each record can still be read like a dictionary:
+
+```python
+import xpf
+
+results = xpf.direct.fstat('//depot/...', compact=True)
+
+for record in results:
+    print(record['depotFile'], record['headRev'])
+```
+
+
+##Spilled Results
+
+An unexpectedly large query (such as an fstat of an entire depot) can use
+more memory than is available. Setting a memory budget means that once the
+records of a call exceed it they are written to a temporary file instead,
+and the call returns an ```xpf.spill.SpilledResult```. This supports len,
+iteration, indexing, slicing, comparison, concatenation, append and extend,
+reading each record back from disk as it is accessed:
+
+```python
+import xpf
+
+xpf.variables.set_result_memory_budget(256 * 1024 * 1024)
+
+results = xpf.direct.fstat('//depot/...')
+
+print(len(results), results[-1]['depotFile'])
+```
+
+No budget is set by default, so this is opt-in. Results which fit within the
+budget are still returned as a list, but a SpilledResult is not a list, so
+code which needs one (isinstance checks, json.dump or altering records in
+place) should call ```results.to_list()```. Spilled results are never held in
+the cache.
+
+
+##Tables
+
+If you are pulling results only to aggregate numeric fields (such as
+fileSize, headTime or change) you can ask for them as an
+```xpf.tables.Table```. Each field is held as a column, with numeric fields
+decoded straight into typed arrays (or NumPy arrays when NumPy is
+installed):
+
+```python
+import xpf
+
+table = xpf.direct.sizes('//depot/...', as_table=True)
+total_size = sum(table.column('fileSize'))
+```
+
+
+##File Content
+
+A submitted revision of a file never changes, so xpf can keep the content of
+any revision it prints in a persistent cache on disk. Content is printed
+straight to disk without being decoded, which makes this suitable for binary
+files, and is then served locally from that point on (including by other
+processes):
+
+```python
+import xpf
+
+# -- Read the content of a revision as bytes
+data = xpf.content.fetch('//depot/textures/wood.png#4')
+
+# -- Or get the path to a local file holding that content
+path = xpf.content.fetch_path('//depot/textures/wood.png')
+```
+
+The cache location and size are controlled by the content_cache_dir and
+content_cache_max_bytes variables, with the least recently used content
+being evicted first.
+
+
+##Metadata Cache
+
+Some queries can never give a different answer, such as describing a
+submitted change or asking for the history of a file up to a given revision.
+xpf can store the results of these permanently in an SQLite database, which
+is shared between processes and sessions:
+
+```python
+import xpf
+
+xpf.variables.set_use_metadata_cache(True)
+
+xpf.direct.describe(1234)  # -- Asks the server
+xpf.direct.describe(1234)  # -- Answered from the cache
+```
+
+Only describes of submitted changes, and filelog/annotate calls where every
+file names an explicit revision (#3) or a submitted change (@1234), are
+stored. The database location is controlled by the metadata_cache_path
+variable. If the sqlite3 module is not available the cache is not used.
+
+
+##Workspace Index
+
+Questions such as whether a file is had, opened or which change it is
+opened in can be answered from a local index of the workspace rather than
+the server. The index is stored in an SQLite database within the
+workspace_index_dir variable (~/.xpf/workspaces by default), with a
+database for each server, client and host, and is refreshed incrementally,
+only querying the files which have changed since it was last refreshed:
+
+```python
+import xpf
+
+# -- Answer the have, is_editable and changelist assist queries locally
+xpf.variables.set_use_workspace_index(True)
+
+xpf.assist.have('/usr/my_files/file.txt')
+
+# -- The index can also be used directly
+index = xpf.workspace.get_index()
+index.refresh()
+```
+
+Any files altered by commands run through xpf are re-queried the next time
+the index is read. Changes made outside of xpf (for instance through P4V)
+are only picked up by ```index.refresh(full=True)```.
+
+
+##Opened Files
+
+Tools which repeatedly ask which change a file is opened in (or which files
+are in a change) can use an in-memory index of the opened files. These are
+queried once, after which each question is a simple lookup:
+
+```python
+import xpf
+
+index = xpf.opened.get_index()
+
+index.change_of('/usr/my_files/file.txt')
+index.files_in(1234)
+
+# -- Or have xpf.assist.changelist and submit_files use the index
+xpf.variables.set_use_opened_index(True)
+```
+
+Files touched by commands run through xpf (such as edit, reopen, revert or
+submit) are re-queried the next time the index is read. Files opened outside
+of xpf are picked up by calling ```index.refresh()```.
+
+
 ##Forms
 
 Forms are used in perforce to deliver multiple pieces of user input. When
@@ -258,7 +688,15 @@ result = xpf.direct.changelist(
 
 Xpf has been tested under Python 2.7 and Python 3.7 on Windows.
 """
+from . import views
+from . import query
+from . import history
+from . import batch
 from . import assist
+from . import decisions
+from . import opened
+from . import content
+from . import workspace
 from . import direct
 from . import contexts
 from . import variables
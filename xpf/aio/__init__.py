@@ -0,0 +1,35 @@
+"""
+This package offers an asyncio interface to perforce which mirrors
+xpf.direct (as xpf.aio.direct) along with the most common xpf.assist
+functions (as xpf.aio.assist). Each call is run through an asyncio
+subprocess and its output is decoded incrementally as it arrives, so many
+queries can be in flight from a single event loop without tying up
+threads.
+
+All the calls are failsafe in the same way as their synchronous
+counterparts, returning a default value if the server is inaccessible, if
+the call times out or if an error occurs.
+
+This package requires Python 3.5 or later, and is therefore not imported
+by default:
+
+```python
+import asyncio
+from xpf import aio
+
+
+async def main():
+    opened, info = await asyncio.gather(
+        aio.direct.opened(),
+        aio.direct.info(),
+    )
+
+asyncio.get_event_loop().run_until_complete(main())
+```
+"""
+from . import assist
+from . import direct
+from . import failsafe
+from . import connection
+
+from .direct import run
@@ -0,0 +1,227 @@
+"""
+This is the asyncio equivalent of xpf.assist, holding awaitable versions
+of the higher level functions. Both these and their xpf.assist counterparts
+make their decisions through xpf.decisions, so they always give the same
+answers, and they are failsafe in the same way. The workspace and opened
+files indexes are not used here, as reading them may block.
+
+```python
+from xpf import aio
+
+if not await aio.assist.is_editable(filepath):
+    await aio.assist.add_to_changelist(filepath, description='My change')
+```
+"""
+import os
+import asyncio
+
+from . import direct
+from . import failsafe
+from .. import views
+from .. import decisions
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_false
+async def sync(files=None, cl_num=None, force=False, revision=None, *args, **kwargs):
+    """
+    Awaitable version of xpf.assist.sync
+
+    :return: bool
+    """
+    description = None
+
+    if cl_num:
+        description = (await direct.describe(cl_num))[0]
+
+    arguments = decisions.sync_arguments(
+        files,
+        description=description,
+        force=force,
+        revision=revision,
+    )
+
+    results = await direct.sync(
+        *arguments + list(args),
+        **kwargs
+    )
+
+    return decisions.is_synced(results)
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_true
+async def have(files, *args, **kwargs):
+    """
+    Awaitable version of xpf.assist.have
+
+    :return: bool
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    return decisions.is_had(await direct.have(files, *args, **kwargs))
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_false
+async def is_editable(files):
+    """
+    Awaitable version of xpf.assist.is_editable
+
+    :return: bool
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    return decisions.is_editable(
+        await _run_query(decisions.editable_query(files)),
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_none
+async def changelist(filepath):
+    """
+    Awaitable version of xpf.assist.changelist
+
+    :return: str
+    """
+    return decisions.opened_change(await direct.opened(filepath))
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_list
+async def workspace_names():
+    """
+    Awaitable version of xpf.assist.workspace_names
+
+    :return: list(str, str, ...)
+    """
+    return decisions.workspace_names(
+        await _run_query(decisions.workspace_query()),
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_none
+async def get_changelist(description, **kwargs):
+    """
+    Awaitable version of xpf.assist.get_changelist
+
+    :return: int
+    """
+    current_changes = await direct.changes(
+        *decisions.pending_changes_arguments(),
+        **kwargs
+    )
+
+    change_id = decisions.find_change(current_changes, description)
+
+    if change_id:
+        return change_id
+
+    return decisions.created_change(
+        await direct.changelist(
+            '-i',
+            form=decisions.new_change_form(description),
+            **kwargs
+        )
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_false
+async def add_to_changelist(files, description='default', change_id=None):
+    """
+    Awaitable version of xpf.assist.add_to_changelist
+
+    :return: the changelist id number which was added/used
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    for filepath in files:
+        if not os.path.exists(filepath):
+            return False
+
+    if not change_id:
+        change_id = await get_changelist(description)
+
+    operations = decisions.classify_files(
+        files,
+        await direct.fstat(*decisions.classify_arguments(files)),
+    )
+
+    for op in ['add', 'edit']:
+        if operations[op]:
+            await direct.run(op, '-c', change_id, operations[op])
+
+    await direct.reopen('-c', change_id, files)
+
+    return change_id
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_false
+async def submit_files(files,
+                       description=None,
+                       change_id=None,
+                       on_record=None,
+                       on_error=None,
+                       on_progress=None):
+    """
+    Awaitable version of xpf.assist.submit_files
+
+    :return: submission results
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    change_id = change_id or await changelist(files[0])
+    cl_description = (await direct.describe(change_id))[-1]
+
+    # -- Loading the client view is a blocking call, but only happens
+    # -- once per client
+    view = views.cached_view()
+
+    if not view:
+        view = await asyncio.get_event_loop().run_in_executor(
+            None,
+            views.get_view,
+        )
+
+    local_files = list()
+
+    for depot_file, local_file in decisions.change_local_files(cl_description, view):
+        if not local_file:
+            local_file = (await direct.where(depot_file))[0]['path']
+
+        local_files.append(local_file)
+
+    if not decisions.all_in_change(local_files, files):
+        await add_to_changelist(files, description=description)
+
+    return await direct.submit(
+        '-c',
+        change_id,
+        on_record=on_record,
+        on_error=on_error,
+        on_progress=on_progress,
+    )
+
+
+# ------------------------------------------------------------------------------
+async def _run_query(query):
+    """
+    Private coroutine which runs an xpf.query.Query, applying the parts of
+    the query the server cannot do to its records in the same way as
+    running it synchronously.
+
+    :param query: The query to run
+    :type query: xpf.query.Query
+
+    :return: list(dict, ...)
+    """
+    results = await direct.run(query.command, *query.arguments())
+    return query.filter(results or [])
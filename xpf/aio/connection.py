@@ -0,0 +1,345 @@
+"""
+This module is the asyncio equivalent of xpf.connection. Each call is run
+through an asyncio subprocess and its output is decoded incrementally as
+it arrives.
+"""
+import marshal
+import asyncio
+import functools
+import subprocess
+
+from .. import cache
+from .. import spill
+from .. import tables
+from .. import records
+from .. import variables
+from .. import connection
+from .. import marshalling
+
+
+# -- The number of bytes we read from the process at once
+_CHUNK_SIZE = 65536
+
+
+# ------------------------------------------------------------------------------
+async def is_accessible(force=False):
+    """
+    Awaitable version of xpf.connection.is_accessible. The server test is
+    only ever run once (unless forced) and is run in an executor so as not
+    to block the event loop.
+
+    :param force: If True then the test will be run even if it has already
+        been run before.
+    :type force: bool
+
+    :return: True if the server is accessible
+    """
+    if variables.get_server_status() != -1 and not force:
+        return variables.get_server_status()
+
+    loop = asyncio.get_event_loop()
+
+    return await loop.run_in_executor(
+        None,
+        functools.partial(connection.is_accessible, force=force),
+    )
+
+
+# ------------------------------------------------------------------------------
+async def run(*args, **kwargs):
+    """
+    Awaitable version of xpf.connection.safe_run, accepting the same
+    arguments and special keyword arguments (timeout, return_type, form,
+    marshal, port, client, user, on_record, on_error, on_progress, compact
+    and as_table).
+
+    Writing the output straight to a destination (output) is not supported
+    as it would block the event loop, so a TypeError is raised if it is
+    given.
+
+    As with safe_run, read only calls may be answered from the memory and
+    metadata caches, and every command which may alter files is passed to
+    the write hooks (keeping xpf.cache and the workspace and opened files
+    indexes up to date) once it completes. Anything which may block, such
+    as reading the metadata cache, is run in an executor.
+
+    Unlike safe_run this is not failsafe itself, xpf.aio.direct.run should
+    be used for that.
+
+    :return: list(dict, ...) or str if the call is not marshalled
+    """
+    if kwargs.get('output') is not None:
+        raise TypeError('output is not supported by asyncio calls')
+
+    timeout = kwargs.get(
+        'timeout',
+        variables.get_timeout(),
+    )
+
+    return_type = kwargs.get(
+        'return_type',
+        None,
+    )
+
+    loop = asyncio.get_event_loop()
+
+    # -- The metadata cache is held on disk and may ask the server for the
+    # -- latest change, so it is only read and written off the event loop
+    lookup = connection.CacheLookup(args, kwargs)
+    blocking = variables.get_use_metadata_cache()
+
+    if blocking:
+        results = await loop.run_in_executor(None, lookup.get)
+
+    else:
+        results = lookup.get()
+
+    if results is not cache.MISS:
+        return results
+
+    results = await _run(args, kwargs, timeout, return_type)
+
+    if results is not return_type:
+        if blocking:
+            await loop.run_in_executor(None, lookup.put, results)
+
+        else:
+            lookup.put(results)
+
+    # -- Let anything holding state about files know they may have changed.
+    # -- The indexes hold their locks whilst refreshing from the server, so
+    # -- this is also run off the event loop
+    await loop.run_in_executor(None, connection.notify_write, args, results)
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+async def _run(args, kwargs, timeout, return_type):
+    """
+    Private coroutine which runs a single call on behalf of run, returning
+    the return type if it times out.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :param timeout: The maximum time to wait for the call
+    :type timeout: float
+
+    :param return_type: The value to return if the call times out
+
+    :return: The results of the call, or the return_type
+    """
+    cmd, arg_input = connection.build_command(args, kwargs)
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        **connection.popen_kwargs()
+    )
+
+    # -- This ensures the process is terminated along with every other
+    # -- xpf process if the interpreter exits
+    live_process = _LiveProcess(process)
+    connection.register_process(live_process)
+
+    try:
+        return await asyncio.wait_for(
+            _communicate(process, arg_input, kwargs),
+            timeout,
+        )
+
+    except asyncio.TimeoutError:
+        print('xpf :: timing out (after %ss)...' % timeout)
+        return return_type
+
+    finally:
+        # -- Ensure nothing is left running if we timed out or were
+        # -- cancelled
+        if process.returncode is None:
+            connection.kill_process_tree(process.pid)
+            await process.wait()
+
+        connection.unregister_process(live_process)
+
+
+# ------------------------------------------------------------------------------
+async def _communicate(process, arg_input, kwargs):
+    """
+    Private coroutine which feeds any form or argument input to the process
+    and reads its output.
+
+    :param process: The process to communicate with
+    :type process: asyncio.subprocess.Process
+
+    :param arg_input: Optional arguments to feed to stdin (for -x -)
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :return: list(dict, ...) or str if the call is not marshalled
+    """
+    form = kwargs.get('form')
+    feeder = None
+
+    if form:
+        process.stdin.write(marshal.dumps(form, 0))
+        await process.stdin.drain()
+        process.stdin.close()
+
+    elif arg_input is not None:
+        feeder = asyncio.ensure_future(_feed(process.stdin, arg_input))
+
+    else:
+        process.stdin.close()
+
+    try:
+        if not kwargs.get('marshal', True):
+            results = (await process.stdout.read()).decode('utf-8')
+
+        else:
+            results = await _read_records(process.stdout, kwargs)
+
+    finally:
+        if feeder:
+            feeder.cancel()
+
+    await process.wait()
+    return results
+
+
+# ------------------------------------------------------------------------------
+async def _feed(stdin, arg_input):
+    """
+    Private coroutine which writes the given arguments to stdin, one per line.
+
+    :param stdin: The stdin stream of the process
+    :param arg_input: The arguments to write
+
+    :return: None
+    """
+    try:
+        batch = list()
+
+        for item in arg_input:
+            batch.append(item.encode('utf8'))
+
+            if len(batch) >= 1000:
+                stdin.write(b'\n'.join(batch) + b'\n')
+                await stdin.drain()
+                batch = list()
+
+        if batch:
+            stdin.write(b'\n'.join(batch) + b'\n')
+            await stdin.drain()
+
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+    finally:
+        stdin.close()
+
+
+# ------------------------------------------------------------------------------
+async def _read_records(stdout, kwargs):
+    """
+    Private coroutine which reads and decodes the records from stdout as
+    they arrive, calling any callbacks given in the kwargs.
+
+    :param stdout: The stdout stream of the process
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :return: list(dict, ...), or the container asked for by the compact
+        and as_table keyword arguments
+    """
+    on_record = kwargs.get('on_record')
+    on_error = kwargs.get('on_error')
+    on_progress = kwargs.get('on_progress')
+
+    decoder = marshalling.StreamDecoder()
+    results = _new_results(kwargs)
+    count = 0
+
+    while True:
+        chunk = await stdout.read(_CHUNK_SIZE)
+
+        for record in decoder.feed(chunk) if chunk else decoder.close():
+            results.append(record)
+            count += 1
+
+            # -- As with synchronous calls, an exception raised by a
+            # -- callback does not interrupt the reading of the output
+            if on_record:
+                connection.run_callback(on_record, record)
+
+            if on_error and record.get('code') == 'error':
+                connection.run_callback(on_error, record)
+
+            if on_progress:
+                connection.run_callback(on_progress, count)
+
+        if not chunk:
+            break
+
+    # -- Finishing spilled results flushes them to disk, which we do off
+    # -- the event loop
+    if isinstance(results, spill.Collector):
+        results = await asyncio.get_event_loop().run_in_executor(
+            None,
+            results.finish,
+        )
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def _new_results(kwargs):
+    """
+    Private function which returns the container records are collected into,
+    matching the choice made by xpf.connection.ThreadedP4Call.
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :return: list, records.CompactResult, tables.Table or spill.Collector
+    """
+    if kwargs.get('as_table', False):
+        return tables.Table()
+
+    if kwargs.get('compact', False):
+        return records.CompactResult()
+
+    if variables.get_result_memory_budget():
+        return spill.Collector(variables.get_result_memory_budget())
+
+    return list()
+
+
+# ------------------------------------------------------------------------------
+class _LiveProcess(object):
+    """
+    Private class which allows an asyncio process to be held within the
+    live process registry of xpf.connection, which expects the interface of
+    subprocess.Popen. The process is reaped by the event loop, so waiting
+    on it here only reports its return code.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, process):
+        self.process = process
+        self.pid = process.pid
+
+    # --------------------------------------------------------------------------
+    def poll(self):
+        return self.process.returncode
+
+    # --------------------------------------------------------------------------
+    def wait(self):
+        return self.process.returncode
+
+
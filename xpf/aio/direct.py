@@ -0,0 +1,60 @@
+"""
+This is the asyncio equivalent of xpf.direct, holding an awaitable
+function for every perforce command. These accept the same arguments and
+special keyword arguments as the functions within xpf.direct (other than
+output, which would block the event loop) and are failsafe in the same way.
+
+```python
+from xpf import aio
+
+results = await aio.direct.fstat('//depot/...', timeout=10)
+```
+"""
+import sys
+
+from . import failsafe
+from . import connection
+from .. import direct as _direct
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_list
+async def run(*args, **kwargs):
+    return await connection.run(*args, **kwargs)
+
+
+# ------------------------------------------------------------------------------
+def _command(command, name):
+    """
+    Private function which creates the awaitable function for a single
+    perforce command.
+
+    :param command: The perforce command
+    :type command: str
+
+    :param name: The name to give the function
+    :type name: str
+
+    :return: coroutine function
+    """
+    async def wrapper(*args, **kwargs):
+        return await run(command, *args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__qualname__ = name
+    wrapper.__doc__ = 'Awaitable version of xpf.direct.%s' % name
+
+    return failsafe.return_list(wrapper)
+
+
+# -- Generate an awaitable function for every command within xpf.direct.
+# -- The functions which clash with python builtins have a trailing
+# -- underscore, which is not part of the command itself.
+for _name, _value in sorted(vars(_direct).items()):
+    if _name.startswith('_') or _name in ('run', 'iter_run'):
+        continue
+
+    if not callable(_value) or isinstance(_value, type(sys)):
+        continue
+
+    globals()[_name] = _command(_name.rstrip('_'), _name)
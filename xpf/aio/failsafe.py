@@ -0,0 +1,49 @@
+"""
+This holds the asyncio equivalents of the decorators within xpf.failsafe,
+returning default values in the absence of a perforce server, or a server
+which is not responsive within a reasonable amount of time.
+"""
+import sys
+import asyncio
+import functools
+
+from . import connection
+
+
+# ------------------------------------------------------------------------------
+def _failsafe(default):
+    """
+    Private function which creates a decorator returning the result of the
+    given default callable whenever the server is inaccessible or the
+    decorated coroutine raises.
+
+    :param default: Callable which returns the default value
+    """
+    def decorator(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not await connection.is_accessible():
+                return default()
+
+            try:
+                return await func(*args, **kwargs)
+
+            except asyncio.CancelledError:
+                raise
+
+            except BaseException:
+                print(str(sys.exc_info()))
+                return default()
+
+        return wrapper
+
+    return decorator
+
+
+return_true = _failsafe(lambda: True)
+return_false = _failsafe(lambda: False)
+return_none = _failsafe(lambda: None)
+return_list = _failsafe(list)
+return_dict = _failsafe(dict)
+return_string = _failsafe(str)
@@ -3,9 +3,15 @@ This holds higher level functionality for common place behaviours.
 """
 import os
 
+from . import batch
+from . import views
+from . import opened
 from . import direct
+from . import commands
 from . import failsafe
+from . import decisions
 from . import variables
+from . import workspace
 from . import connection
 
 
@@ -34,47 +40,31 @@ def sync(files=None, cl_num=None, force=False, revision=None, *args, **kwargs):
     :type revision: int
 
     :param kwargs: Any additional arguments you want to pass to the perforce
-        call
+        call. This includes the on_record, on_error and on_progress callbacks
+        which are called as each file is synced.
 
     :return: 
     """
-    if not files:
-        files = list()
-
-    if not isinstance(files, (list, tuple)):
-        files = [files]
-
     # -- If we're given a changelist number we need to add all the files
     # -- from that change list number to our file list
+    description = None
+
     if cl_num:
-        query = direct.describe(cl_num)
-        files.extend(query[0]['depotFile'])
-
-    # -- If we're given a specific revision we should tag
-    # -- that onto the end of the file paths
-    if revision:
-        for idx, filepath in enumerate(files):
-            files[idx] = '%s#%s' % (filepath, revision)
-
-    if force:
-        results = direct.sync(
-            '-f',
-            files,
-            *args,
-            **kwargs
-        )
-    else:
-        results = direct.sync(
-            files,
-            *args,
-            **kwargs
-        )
+        description = direct.describe(cl_num)[0]
 
-    for result in results:
-        if result.get('code') == 'error' and 'up-to-date' not in result['data']:
-            return False
+    arguments = decisions.sync_arguments(
+        files,
+        description=description,
+        force=force,
+        revision=revision,
+    )
+
+    results = direct.sync(
+        *arguments + list(args),
+        **kwargs
+    )
 
-    return True
+    return decisions.is_synced(results)
 
 
 # ------------------------------------------------------------------------------
@@ -117,28 +107,16 @@ def add_to_changelist(files, description='default', change_id=None):
     if not change_id:
         change_id = get_changelist(description)
 
-    # -- The more we batch up the commands the faster
-    # -- this will be, so we create a list of all the files
-    # -- we can add, and edit seperately so we can run it
-    # -- together
-    operations = dict(
-        add=[],
-        edit=[],
+    # -- Check if the files already exist in perforce, if they do
+    # -- we edit, otherwise we add. We query all the files in a single
+    # -- call and only ask for the fields we need to make the decision.
+    # -- The more we batch up the commands the faster this will be, so
+    # -- the files we add and edit are each run together
+    operations = decisions.classify_files(
+        files,
+        direct.fstat(*decisions.classify_arguments(files)),
     )
 
-    # -- Check if the file already exists in perforce, if it does
-    # -- we edit, otherwise we add
-    for file_path in files:
-        test = direct.fstat(file_path)
-        try:
-            if len(test) and 'error' not in str(test):
-                operations['edit'].append(file_path)
-            else:
-                operations['add'].append(file_path)
-
-        except:
-            operations['add'].append(file_path)
-
     # -- We can now do the actions in two steps
     for op in ['add', 'edit']:
         if len(operations[op]) == 0:
@@ -171,6 +149,9 @@ def have(files, *args, **kwargs):
     return True if the file exists. If multiple files exist then all the files
     need to exist to get a True return
 
+    If xpf.variables.get_use_workspace_index() is True (and no additional
+    arguments are given) this is answered from the workspace index.
+
     :param files: Optional list of files to sync to, or a single filepath
     :type files: list(str, str, ...) or str
 
@@ -181,20 +162,14 @@ def have(files, *args, **kwargs):
     """
 
     if not isinstance(files, (list, tuple)):
-        files = files
-
-    f_list = '" "'.join(files)
-    f_list = '"%s"' % f_list
-    results = direct.have(f_list, *args, **kwargs)
+        files = [files]
 
-    if not results:
-        return False
+    index = _workspace_index(files, args, kwargs)
 
-    for result in results:
-        if 'not on client' in str(result):
-            return False
+    if index:
+        return all(index.have(filepath) for filepath in files)
 
-    return True
+    return decisions.is_had(direct.have(files, *args, **kwargs))
 
 
 # ------------------------------------------------------------------------------
@@ -225,43 +200,26 @@ def get_changelist(description, **kwargs):
 
     # -- Execute our command
     current_changes = direct.changes(
-        '-s',
-        'pending',
-        '-l',
-        '-u',
-        variables.get_user(),
-        '-c',
-        variables.get_client(),
+        *decisions.pending_changes_arguments(),
         **kwargs
     )
 
-    # -- Cycle the results, and check whether the description matches
-    # -- any of the found changelists
-    change_id = 0
+    # -- Check whether the description matches any of the found
+    # -- changelists
+    change_id = decisions.find_change(current_changes, description)
 
-    # -- This can occur if the server is offline
-    if current_changes:
-        for change in current_changes:
-            if 'desc' in change:
-                if description.lower().strip() == change['desc'].lower().strip():
-                    return int(change['change'])
+    if change_id:
+        return change_id
 
-    # -- If we do not have a pre-existing one, lets make one
-    if not change_id:
-        result = direct.changelist(
+    # -- If we do not have a pre-existing one, lets make one. If this
+    # -- fails something has gone horribly wrong and we give None
+    return decisions.created_change(
+        direct.changelist(
             '-i',
-            form={
-                'Change': 'new',
-                'Status': 'new',
-                'Description': str(description),
-            },
+            form=decisions.new_change_form(description),
             **kwargs
         )
-        if result:
-            return int(result[0]['data'].split()[1])
-
-    # -- Fallback, something has gone horribly wrong!
-    return None
+    )
 
 
 # ------------------------------------------------------------------------------
@@ -278,19 +236,7 @@ def workspace_names():
     if not connection.is_accessible():
         return None
 
-    client_data = direct.run(
-        '-H',
-        variables.get_host(),
-        'clients',
-        '-u',
-        variables.get_user(),
-    )
-
-    return [
-        workspace['client']
-        for workspace in client_data
-        if workspace['Host'] == variables.get_host()
-    ]
+    return decisions.workspace_names(decisions.workspace_query().run())
 
 
 # ------------------------------------------------------------------------------
@@ -311,18 +257,36 @@ def changelist(filepath):
     Returns the changelist number which the filepath is currently marked for
     edit within.
 
+    If xpf.variables.get_use_opened_index() or
+    xpf.variables.get_use_workspace_index() is True this is answered from
+    the opened files index or the workspace index respectively.
+
     :param filepath: Filepath to find
     :type filepath: str
 
     :return: int 
     """
-    change_number = direct.opened(filepath)[0]
-    return change_number['change']
+    index = _opened_index()
+
+    if index:
+        return index.change_of(filepath)
+
+    index = _workspace_index([filepath])
+
+    if index:
+        return index.changelist(filepath)
+
+    return decisions.opened_change(direct.opened(filepath))
 
 
 # ------------------------------------------------------------------------------
 @failsafe.return_false
-def submit_files(files, description=None, change_id=None):
+def submit_files(files,
+                 description=None,
+                 change_id=None,
+                 on_record=None,
+                 on_error=None,
+                 on_progress=None):
     """
     This will submit the given files under a changelist with the given
     description. If all the files are all already under the same changelist
@@ -346,6 +310,18 @@ def submit_files(files, description=None, change_id=None):
         be used.
     :type change_id: int
 
+    :param on_record: Optional callable which is given each record of the
+        submit as soon as it is read
+    :type on_record: callable
+
+    :param on_error: Optional callable which is given each error record of
+        the submit as soon as it is read
+    :type on_error: callable
+
+    :param on_progress: Optional callable which is given the number of
+        records of the submit read so far
+    :type on_progress: callable
+
     :return: submission changelist number
     """
     if not isinstance(files, (list, tuple)):
@@ -354,22 +330,9 @@ def submit_files(files, description=None, change_id=None):
     # -- If all the files are in the same changelist, submit it
     change_id = change_id or changelist(files[0])
 
-    # -- Get a full list of files in the change list
-    cl_description = direct.describe(change_id)[-1]
-
-    local_files = [
-        direct.where(depot_file)[0]['path']
-        for depot_file in cl_description['depotFile']
-    ]
+    local_files = _change_local_files(change_id)
 
-    all_files_in_cl = True
-
-    for local_file in local_files:
-        if local_file not in files:
-            all_files_in_cl = False
-            break
-
-    if not all_files_in_cl:
+    if not decisions.all_in_change(local_files, files):
         add_to_changelist(
             files,
             description=description,
@@ -378,6 +341,9 @@ def submit_files(files, description=None, change_id=None):
     return direct.submit(
         '-c',
         change_id,
+        on_record=on_record,
+        on_error=on_error,
+        on_progress=on_progress,
     )
 
 # ------------------------------------------------------------------------------
@@ -387,6 +353,9 @@ def is_editable(files):
     Returns True if all the given files are editable. If any file is not
     editable this will return False.
 
+    If xpf.variables.get_use_workspace_index() is True this is answered from
+    the workspace index.
+
     :param files: List of files to check, or single file
     :type files: list(str, str, ...) or str
 
@@ -395,10 +364,280 @@ def is_editable(files):
     if not isinstance(files, (list, tuple)):
         files = [files]
 
-    results = direct.fstat(files)
+    index = _workspace_index(files)
 
-    for file_results in results:
-        if 'action' not in file_results:
-            return False
+    if index:
+        return all(index.is_opened(filepath) for filepath in files)
+
+    # -- We only need to know whether each file has an action
+    return decisions.is_editable(decisions.editable_query(files).run())
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_dict
+def have_map(files, **kwargs):
+    """
+    Returns whether each of the given files is had by the workspace. Unlike
+    have, this gives a result per file, and the files are queried in
+    chunks (see xpf.batch) rather than one at a time.
+
+    If xpf.variables.get_use_workspace_index() is True (and no keyword
+    arguments are given) this is answered from the workspace index.
+
+    :param files: The files to check (not wildcards)
+    :type files: list(str, str, ...)
+
+    :param kwargs: Any additional keyword arguments to pass to each
+        perforce call, such as timeout, chunk or workers
+
+    :return: dict(str: bool)
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    index = _workspace_index(files, kwargs=kwargs)
+
+    if index:
+        return dict((filepath, index.have(filepath)) for filepath in files)
+
+    return dict(
+        (filepath, 'haveRev' in record)
+        for filepath, record in _fstat_map(files, 'haveRev', **kwargs).items()
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_dict
+def editable_map(files, **kwargs):
+    """
+    Returns whether each of the given files is editable (opened). Unlike
+    is_editable, this gives a result per file, and the files are queried in
+    chunks (see xpf.batch) rather than one at a time.
+
+    If xpf.variables.get_use_workspace_index() is True (and no keyword
+    arguments are given) this is answered from the workspace index.
+
+    :param files: The files to check (not wildcards)
+    :type files: list(str, str, ...)
+
+    :param kwargs: Any additional keyword arguments to pass to each
+        perforce call, such as timeout, chunk or workers
+
+    :return: dict(str: bool)
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    index = _workspace_index(files, kwargs=kwargs)
+
+    if index:
+        return dict((filepath, index.is_opened(filepath)) for filepath in files)
+
+    return dict(
+        (filepath, 'action' in record)
+        for filepath, record in _fstat_map(files, 'action', **kwargs).items()
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_dict
+def changelist_map(files, **kwargs):
+    """
+    Returns the change each of the given files is opened in, queried in
+    chunks (see xpf.batch) rather than one file at a time.
+
+    If xpf.variables.get_use_opened_index() is True (and no keyword
+    arguments are given) this is answered from the opened files index.
+
+    :param files: The files to check (not wildcards)
+    :type files: list(str, str, ...)
+
+    :param kwargs: Any additional keyword arguments to pass to each
+        perforce call, such as timeout, chunk or workers
+
+    :return: dict(str: str) where files which are not opened are given None
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    index = _opened_index(kwargs)
+
+    if index:
+        return dict((filepath, index.change_of(filepath)) for filepath in files)
+
+    return dict(
+        (filepath, record.get('change'))
+        for filepath, record in _fstat_map(files, 'change', **kwargs).items()
+    )
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_dict
+def head_revision_map(files, **kwargs):
+    """
+    Returns the head revision of each of the given files, queried in chunks
+    (see xpf.batch) rather than one file at a time.
+
+    :param files: The files to check (not wildcards)
+    :type files: list(str, str, ...)
+
+    :param kwargs: Any additional keyword arguments to pass to each
+        perforce call, such as timeout, chunk or workers
+
+    :return: dict(str: int) where files which are not in the depot are
+        given None
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    results = dict()
+
+    for filepath, record in _fstat_map(files, 'headRev', **kwargs).items():
+        head_revision = record.get('headRev')
+        results[filepath] = int(head_revision) if head_revision else None
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def _fstat_map(files, field, **kwargs):
+    """
+    Private function which runs fstat over the given files in chunks and
+    returns the record of each file, keyed by the path it was given as.
+
+    :param files: The depot or local paths of the files
+    :type files: list(str, ...)
+
+    :param field: The fstat field needed, alongside the paths of each file
+    :type field: str
+
+    :return: dict(str: dict) where files without a record are given an
+        empty dict
+    """
+    records = batch.map(
+        'fstat',
+        files,
+        '-T',
+        'depotFile,clientFile,%s' % field,
+        **kwargs
+    )
+
+    # -- Each record can be found by either its depot or local path
+    by_path = dict()
+
+    for record in records:
+        if record.get('depotFile'):
+            by_path[record['depotFile']] = record
+
+        if record.get('clientFile'):
+            by_path[decisions.normalise_path(record['clientFile'])] = record
+
+    return dict(
+        (
+            filepath,
+            by_path.get(
+                filepath if filepath.startswith('//') else decisions.normalise_path(filepath),
+                dict(),
+            ),
+        )
+        for filepath in files
+    )
+
+
+# ------------------------------------------------------------------------------
+def _change_local_files(change_id):
+    """
+    Private function which returns the local paths of the files within the
+    given pending change.
+
+    :param change_id: The change to get the files of
+    :type change_id: int or str
+
+    :return: list(str, ...)
+    """
+    index = _opened_index()
+
+    if index:
+        local_files = index.files_in(change_id, local=True)
+
+        # -- Files outside of the client view have no local path, so
+        # -- we can only rely on the index if every file has one
+        if local_files and all(local_files):
+            return local_files
+
+    # -- Get a full list of files in the change list
+    cl_description = direct.describe(change_id)[-1]
+
+    # -- Resolve the local paths using the client view rather than asking
+    # -- the server, only falling back to a where call if the view cannot
+    # -- map the file
+    local_files = list()
+
+    for depot_file, local_file in decisions.change_local_files(
+            cl_description,
+            views.get_view()):
+
+        if not local_file:
+            local_file = direct.where(depot_file)[0]['path']
+
+        local_files.append(local_file)
+
+    return local_files
+
+
+# ------------------------------------------------------------------------------
+def _opened_index(kwargs=None):
+    """
+    Private function which returns the opened files index to answer a
+    query from, if the index is enabled and can answer it.
+
+    :param kwargs: Any additional keyword arguments given for the query
+    :type kwargs: dict
+
+    :return: xpf.opened.OpenedIndex or None
+    """
+    if not variables.get_use_opened_index() or kwargs:
+        return None
+
+    index = opened.get_index()
+
+    # -- An index whose opened files could not be queried would report
+    # -- every file as not opened, so we ask the server instead
+    if index is None or not index.ensure_current():
+        return None
+
+    return index
+
+
+# ------------------------------------------------------------------------------
+def _workspace_index(files, args=None, kwargs=None):
+    """
+    Private function which returns the workspace index to answer a query
+    of the given files from, if the index is enabled and can answer it.
+
+    :param files: The files being queried
+    :type files: list(str, ...)
+
+    :param args: Any additional arguments given for the query
+    :type args: tuple
+
+    :param kwargs: Any additional keyword arguments given for the query
+    :type kwargs: dict
+
+    :return: xpf.workspace.WorkspaceIndex or None
+    """
+    if not variables.get_use_workspace_index() or args or kwargs:
+        return None
+
+    # -- The index only holds individual files
+    if any(commands.is_wildcard(filepath) for filepath in files):
+        return None
+
+    index = workspace.get_index()
+
+    # -- An index which cannot be built or brought up to date would report
+    # -- every file as neither had nor opened, so we ask the server instead
+    if index is None or not index.ensure_current():
+        return None
 
-    return True
+    return index
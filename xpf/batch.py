@@ -0,0 +1,238 @@
+"""
+This module allows a single command to be run over a large list of files
+by splitting the list into chunks and running those chunks in parallel,
+making use of the servers ability to serve many requests at once.
+
+```python
+import xpf
+
+results = xpf.batch.map('fstat', paths, chunk=500, workers=8)
+```
+
+The records of every chunk are merged back together in the same order as
+the files were given. The chunk size adapts as chunks complete, growing
+whilst chunks return quickly and shrinking when they are slow, so that each
+chunk takes roughly xpf.batch.TARGET_LATENCY seconds.
+
+Each chunk is failsafe on its own, so if a chunk times out or errors then
+only the records of that chunk are missing from the results.
+"""
+import sys
+import time
+import threading
+
+from . import tables
+from . import records
+from . import failsafe
+from . import connection
+
+
+# -- The amount of time (in seconds) we aim for each chunk to take. Chunks
+# -- much faster than this are mostly spent in process start up, whilst
+# -- chunks much slower than this risk hitting the timeout
+TARGET_LATENCY = 1.0
+
+# -- How far the chunk size can adapt away from the chunk size requested
+_MAX_CHUNK_SCALE = 8
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_list
+def map(command, paths, *args, **kwargs):
+    """
+    Runs the given command over all the given paths, splitting the paths
+    into chunks which are run in parallel. Any additional arguments are
+    placed before the paths of each chunk, and any keyword arguments (such
+    as timeout, port or client) are given to each call.
+
+    Callbacks (on_record, on_error and on_progress) are called from the
+    thread running each chunk, so may be called from several threads at
+    once. The record count given to on_progress is per chunk.
+
+    :param command: The p4 command to run, such as 'fstat' or 'have'
+    :type command: str
+
+    :param paths: The file paths to run the command over
+    :type paths: list(str, ...)
+
+    :param chunk: The number of paths to start each chunk with. This adapts
+        as chunks complete. The default is 500.
+    :type chunk: int
+
+    :param workers: The maximum number of calls to run at once. The default
+        is 8.
+    :type workers: int
+
+    :return: list(dict, ...)
+    """
+    chunk = kwargs.pop('chunk', 500)
+    workers = kwargs.pop('workers', 8)
+
+    # -- Records are merged from each chunk, so we convert to the compact
+    # -- or table forms only once we have everything
+    compact = kwargs.pop('compact', False)
+    as_table = kwargs.pop('as_table', False)
+
+    batch = _Batch(command, list(paths), args, kwargs, chunk)
+    results = batch.run(workers)
+
+    if as_table:
+        return tables.as_table(results)
+
+    if compact:
+        return records.CompactResult(results)
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+class _Batch(object):
+    """
+    Private class which hands out chunks of paths to the worker threads and
+    collects the records of each chunk.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, command, paths, args, kwargs, chunk):
+        self.command = command
+        self.paths = paths
+        self.args = args
+        self.kwargs = kwargs
+
+        self.chunk = max(1, int(chunk))
+        self.min_chunk = max(1, self.chunk // _MAX_CHUNK_SCALE)
+        self.max_chunk = self.chunk * _MAX_CHUNK_SCALE
+
+        # -- The index of the next path to be handed out, and the records
+        # -- of each chunk keyed by the index of its first path
+        self._cursor = 0
+        self._results = dict()
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------------------------------
+    def run(self, workers):
+        """
+        Runs all the chunks using the given number of worker threads,
+        blocking until they are all complete.
+
+        :param workers: The number of worker threads to use
+        :type workers: int
+
+        :return: list(dict, ...)
+        """
+        if not self.paths:
+            return []
+
+        # -- There is no point starting more workers than there are
+        # -- chunks to begin with
+        workers = max(1, min(int(workers), -(-len(self.paths) // self.chunk)))
+
+        threads = list()
+
+        for _ in range(workers - 1):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # -- The calling thread does its share of the work too
+        self._work()
+
+        for thread in threads:
+            thread.join()
+
+        merged = list()
+
+        for start in sorted(self._results):
+            merged.extend(self._results[start])
+
+        return merged
+
+    # --------------------------------------------------------------------------
+    def _next_chunk(self):
+        """
+        Returns the index of the first path of the next chunk along with the
+        paths of that chunk. If there are no paths left the paths are empty.
+
+        :return: tuple(int, list(str, ...))
+        """
+        with self._lock:
+            start = self._cursor
+            self._cursor += self.chunk
+
+            return start, self.paths[start:self._cursor]
+
+    # --------------------------------------------------------------------------
+    def _work(self):
+        """
+        Runs chunks until there are no more paths left.
+
+        :return: None
+        """
+        while True:
+            start, paths = self._next_chunk()
+
+            if not paths:
+                return
+
+            started = time.time()
+            chunk_records = self._run_chunk(paths)
+            elapsed = time.time() - started
+
+            with self._lock:
+                self._results[start] = chunk_records or []
+                self._adapt(len(paths), elapsed, chunk_records is not None)
+
+    # --------------------------------------------------------------------------
+    def _run_chunk(self, paths):
+        """
+        Runs the command for a single chunk of paths. If the call fails or
+        times out then None is returned.
+
+        :param paths: The paths of the chunk
+        :type paths: list(str, ...)
+
+        :return: list(dict, ...) or None
+        """
+        try:
+            return connection.safe_run(
+                self.command,
+                *(self.args + (paths,)),
+                **self.kwargs
+            )
+
+        except BaseException:
+            print(str(sys.exc_info()))
+            return None
+
+    # --------------------------------------------------------------------------
+    def _adapt(self, count, elapsed, succeeded):
+        """
+        Adjusts the size of subsequent chunks based on how long a chunk of
+        the given size took. This must be called whilst holding the lock.
+
+        :param count: The number of paths in the chunk
+        :type count: int
+
+        :param elapsed: The time the chunk took, in seconds
+        :type elapsed: float
+
+        :param succeeded: Whether the chunk returned results
+        :type succeeded: bool
+
+        :return: None
+        """
+        # -- Failures are often timeouts, so we back off quickly
+        if not succeeded:
+            self.chunk = max(self.min_chunk, self.chunk // 2)
+            return
+
+        # -- The last chunk is often short, which tells us little
+        if count < self.chunk:
+            return
+
+        if elapsed > TARGET_LATENCY:
+            self.chunk = max(self.min_chunk, self.chunk // 2)
+
+        elif elapsed < TARGET_LATENCY / 4:
+            self.chunk = min(self.max_chunk, self.chunk * 2)
@@ -0,0 +1,526 @@
+"""
+This module holds an in-memory cache of the results of read only calls,
+allowing repeated queries (such as fstat, have, where, clients, changes and
+info) to be answered without going back to the server.
+
+Each command has its own time to live (see xpf.cache.TTLS, which can be
+altered with xpf.cache.set_ttl) and entries are evicted on a least recently
+used basis once the cache exceeds either its entry count or its estimated
+size in bytes.
+
+Whenever xpf runs a command which may alter files (such as edit, add,
+submit, revert, reopen or sync) every entry whose paths overlap the paths
+of that command is invalidated. Both the paths a query asked for and the
+paths found within its results are considered, so a query made against a
+local path is invalidated by a write made against the matching depot path.
+Queries which were not given any paths (such as opened or changes) are
+invalidated by every write.
+
+The cache is off by default:
+
+```python
+import xpf
+
+xpf.variables.set_use_cache(True)
+
+xpf.direct.fstat('//depot/file.txt')  # -- Asks the server
+xpf.direct.fstat('//depot/file.txt')  # -- Answered from the cache
+
+print(xpf.cache.stats())
+```
+"""
+import os
+import time
+import threading
+import collections
+
+from . import spill
+from . import commands
+from . import variables
+
+
+# -- The number of seconds the results of each command are cached for. Any
+# -- command not listed here is never cached
+TTLS = {
+    'branches': 60,
+    'changes': 10,
+    'clients': 60,
+    'depots': 300,
+    'dirs': 10,
+    'filelog': 10,
+    'files': 10,
+    'fstat': 5,
+    'have': 10,
+    'info': 60,
+    'labels': 60,
+    'opened': 5,
+    'sizes': 10,
+    'streams': 60,
+    'users': 60,
+    'where': 60,
+    'workspaces': 60,
+}
+
+# -- Returned by get when there is no valid entry for a key
+MISS = object()
+
+# -- Calls given any of these keyword arguments are never cached
+_UNCACHED_KWARGS = (
+    'as_table',
+    'compact',
+    'form',
+    'on_error',
+    'on_progress',
+    'on_record',
+    'output',
+)
+
+_ENTRIES = collections.OrderedDict()
+_LOCK = threading.Lock()
+
+_STATS = dict(
+    hits=0,
+    misses=0,
+    stores=0,
+    evictions=0,
+    expirations=0,
+    invalidations=0,
+)
+
+# -- The total estimated size of all the entries
+_SIZE = [0]
+
+# -- Incremented every time entries are invalidated. Results are only
+# -- stored if no invalidation happened whilst they were being fetched, as
+# -- otherwise they may already be out of date
+_GENERATION = [0]
+
+
+# ------------------------------------------------------------------------------
+def get_ttl(command):
+    """
+    Returns the number of seconds the results of the given command are
+    cached for. Zero means the command is not cached.
+
+    :param command: The p4 command, such as 'fstat'
+    :type command: str
+
+    :return: float
+    """
+    return TTLS.get(command, 0)
+
+
+# ------------------------------------------------------------------------------
+def set_ttl(command, value):
+    """
+    Sets the number of seconds the results of the given command are cached
+    for. Setting this to zero stops the command from being cached.
+
+    :param command: The p4 command, such as 'fstat'
+    :type command: str
+
+    :param value: The number of seconds to cache results for
+    :type value: float
+
+    :return: None
+    """
+    if value:
+        TTLS[command] = value
+
+    else:
+        TTLS.pop(command, None)
+
+
+# ------------------------------------------------------------------------------
+def make_key(args, kwargs):
+    """
+    Returns the key the results of the given call are cached against, or
+    None if the call cannot be cached.
+
+    :param args: The flattened arguments of the call, starting with the
+        command. None should be given if the arguments cannot be read
+        without consuming them.
+    :type args: list(str, ...)
+
+    :param kwargs: The keyword arguments of the call
+    :type kwargs: dict
+
+    :return: tuple or None
+    """
+    if not args or not get_ttl(args[0]):
+        return None
+
+    for key in _UNCACHED_KWARGS:
+        if kwargs.get(key):
+            return None
+
+    return (
+        tuple(args),
+        bool(kwargs.get('marshal', True)),
+        kwargs.get('port', variables.get_port()),
+        kwargs.get('client', variables.get_client()),
+        kwargs.get('user', variables.get_user()),
+    )
+
+
+# ------------------------------------------------------------------------------
+def generation():
+    """
+    Returns the current invalidation generation. This should be read before
+    a call is made and given to put once the call completes.
+
+    :return: int
+    """
+    return _GENERATION[0]
+
+
+# ------------------------------------------------------------------------------
+def get(key):
+    """
+    Returns a copy of the results cached against the given key, or MISS if
+    there is no valid entry.
+
+    :param key: The key, as given by make_key
+
+    :return: The cached results or MISS
+    """
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+
+        if entry is None:
+            _STATS['misses'] += 1
+            return MISS
+
+        if entry.expires <= time.time():
+            _remove(key)
+            _STATS['expirations'] += 1
+            _STATS['misses'] += 1
+            return MISS
+
+        # -- Mark the entry as the most recently used
+        del _ENTRIES[key]
+        _ENTRIES[key] = entry
+
+        _STATS['hits'] += 1
+        results = entry.results
+
+    return copy_results(results)
+
+
+# ------------------------------------------------------------------------------
+def put(key, results, from_generation):
+    """
+    Caches the given results against the given key, unless entries have been
+    invalidated since the call which produced them started.
+
+    :param key: The key, as given by make_key
+
+    :param results: The results to cache
+
+    :param from_generation: The generation (as given by generation) read
+        before the call was started
+    :type from_generation: int
+
+    :return: None
+    """
+    # -- Results which exceeded the memory budget are held on disk, and
+    # -- holding on to them here would keep their file alive
+    if isinstance(results, spill.SpilledResult):
+        return
+
+    max_entries = variables.get_cache_max_entries()
+    max_bytes = variables.get_cache_max_bytes()
+
+    entry = _Entry(
+        key,
+        copy_results(results),
+        time.time() + get_ttl(key[0][0]),
+    )
+
+    if max_bytes and entry.size > max_bytes:
+        return
+
+    with _LOCK:
+        if from_generation != _GENERATION[0]:
+            return
+
+        _remove(key)
+
+        _ENTRIES[key] = entry
+        _SIZE[0] += entry.size
+        _STATS['stores'] += 1
+
+        # -- Evict the least recently used entries until we're within
+        # -- our limits again
+        while _ENTRIES and (
+                (max_entries and len(_ENTRIES) > max_entries)
+                or (max_bytes and _SIZE[0] > max_bytes)):
+            _remove(next(iter(_ENTRIES)))
+            _STATS['evictions'] += 1
+
+
+# ------------------------------------------------------------------------------
+def invalidate(paths=None):
+    """
+    Invalidates every entry which overlaps any of the given paths. If no
+    paths are given then everything is invalidated.
+
+    :param paths: The paths which have been altered. These may be local or
+        depot paths and may hold wildcards.
+    :type paths: list(str, ...)
+
+    :return: None
+    """
+    exact, prefixes = _split_paths(paths or [])
+
+    with _LOCK:
+        _GENERATION[0] += 1
+
+        for key, entry in list(_ENTRIES.items()):
+            if paths and not entry.overlaps(exact, prefixes):
+                continue
+
+            _remove(key)
+            _STATS['invalidations'] += 1
+
+
+# ------------------------------------------------------------------------------
+def on_write(args, results):
+    """
+    The write hook registered with xpf.connection, which invalidates the
+    entries affected by a command which may have altered files.
+
+    :param args: The flattened arguments of the command, starting with the
+        command itself, or None if they are not known
+    :type args: list(str, ...)
+
+    :param results: The results of the command
+
+    :return: None
+    """
+    if not _ENTRIES:
+        return
+
+    paths = commands.file_paths(args) if args else None
+
+    # -- Without any paths we cannot tell what the command has affected
+    if not paths:
+        invalidate()
+        return
+
+    invalidate(paths + commands.record_paths(results))
+
+
+# ------------------------------------------------------------------------------
+def clear():
+    """
+    Removes every entry from the cache and resets the statistics.
+
+    :return: None
+    """
+    with _LOCK:
+        _ENTRIES.clear()
+        _SIZE[0] = 0
+        _GENERATION[0] += 1
+
+        for key in _STATS:
+            _STATS[key] = 0
+
+
+# ------------------------------------------------------------------------------
+def stats():
+    """
+    Returns the hit, miss, store, eviction, expiration and invalidation
+    counts along with the current number of entries and their estimated
+    size in bytes.
+
+    :return: dict
+    """
+    with _LOCK:
+        result = dict(_STATS)
+        result['entries'] = len(_ENTRIES)
+        result['bytes'] = _SIZE[0]
+
+    return result
+
+
+# ------------------------------------------------------------------------------
+def _remove(key):
+    """
+    Private function which removes an entry. This must be called whilst
+    holding the _LOCK.
+
+    :param key: The key of the entry to remove
+
+    :return: None
+    """
+    entry = _ENTRIES.pop(key, None)
+
+    if entry is not None:
+        _SIZE[0] -= entry.size
+
+
+# ------------------------------------------------------------------------------
+def copy_results(results):
+    """
+    Copies results, ensuring that callers altering the results they are
+    given cannot alter the cached (or otherwise shared) results.
+
+    :param results: The results to copy
+
+    :return: The copied results
+    """
+    if isinstance(results, list):
+        return [
+            dict(record) if isinstance(record, dict) else record
+            for record in results
+        ]
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def _split_paths(paths):
+    """
+    Private function which normalises the given paths, splitting them into
+    exact paths and the prefixes of paths which hold wildcards.
+
+    :param paths: The paths to split
+    :type paths: list(str, ...)
+
+    :return: tuple(set(str, ...), list(str, ...))
+    """
+    exact = set()
+    prefixes = list()
+
+    for path in paths:
+        # -- Revisions make no difference to which files are affected
+        path = path.split('#', 1)[0].split('@', 1)[0]
+
+        wildcard = min(
+            idx for idx in (
+                path.find('...'),
+                path.find('*'),
+                path.find('%%'),
+                len(path),
+            )
+            if idx >= 0
+        )
+
+        if wildcard < len(path):
+            prefixes.append(_normalise(path[:wildcard]))
+
+        elif path:
+            exact.add(_normalise(path))
+
+        else:
+            # -- A revision on its own refers to everything
+            prefixes.append('')
+
+    return exact, prefixes
+
+
+# ------------------------------------------------------------------------------
+def _normalise(path):
+    """
+    Private function which normalises a path so that paths given by the
+    caller can be compared with those p4 reports. Depot paths are left as
+    they are, whilst local paths are made absolute.
+
+    :param path: The path to normalise
+    :type path: str
+
+    :return: str
+    """
+    if not path or path.startswith('//'):
+        return path
+
+    normalised = os.path.normcase(os.path.abspath(path))
+
+    # -- Keep the trailing separator of directory prefixes
+    if path.endswith(('/', '\\')) and not normalised.endswith(os.sep):
+        normalised += os.sep
+
+    return normalised
+
+
+# ------------------------------------------------------------------------------
+class _Entry(object):
+    """
+    Private class holding the cached results of a single call along with
+    the paths those results relate to.
+    """
+
+    __slots__ = (
+        'results',
+        'expires',
+        'size',
+        'exact',
+        'prefixes',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, key, results, expires):
+        self.results = results
+        self.expires = expires
+        self.size = _estimate_size(results)
+
+        paths = commands.file_paths(list(key[0]))
+        self.exact, self.prefixes = _split_paths(paths)
+
+        # -- Queries which were not given paths may be affected by
+        # -- anything, so they are considered to cover everything
+        if not paths:
+            self.prefixes = ['']
+
+        self.exact.update(
+            _normalise(path) for path in commands.record_paths(results)
+        )
+
+    # --------------------------------------------------------------------------
+    def overlaps(self, exact, prefixes):
+        """
+        Returns True if any of the given paths overlap the paths of this
+        entry.
+
+        :param exact: Normalised paths without wildcards
+        :type exact: set(str, ...)
+
+        :param prefixes: Normalised prefixes of paths with wildcards
+        :type prefixes: list(str, ...)
+
+        :return: bool
+        """
+        if not self.exact.isdisjoint(exact):
+            return True
+
+        for prefix in self.prefixes:
+            for path in exact:
+                if path.startswith(prefix):
+                    return True
+
+            for other in prefixes:
+                if prefix.startswith(other) or other.startswith(prefix):
+                    return True
+
+        for prefix in prefixes:
+            for path in self.exact:
+                if path.startswith(prefix):
+                    return True
+
+        return False
+
+
+# ------------------------------------------------------------------------------
+def _estimate_size(results):
+    """
+    Private function which estimates the memory used by the given results.
+
+    :param results: The results to estimate the size of
+
+    :return: int
+    """
+    if not isinstance(results, list):
+        return len(results or '')
+
+    return sum(spill.estimate_size(record) for record in results)
@@ -0,0 +1,400 @@
+"""
+This module combines small read only queries which are made at nearly the
+same time (typically from different threads) into a single p4 call. For
+example, many widgets each asking for the fstat of a single file within a
+few milliseconds of each other results in one fstat call for all of those
+files, with the records then split back to each caller.
+
+Only calls of the same command, with the same flags and connection settings
+are combined, and only when every record can be attributed to the paths a
+caller asked for (through its depotFile, clientFile or path field, or the
+path an error message is reported against). The commands which can be
+combined are listed in xpf.coalesce.COALESCED_COMMANDS.
+
+This is off by default and is enabled by setting a window (in seconds) for
+calls to be gathered within:
+
+```python
+import xpf
+
+xpf.variables.set_coalesce_window(0.005)
+```
+"""
+import os
+import sys
+import threading
+
+from . import commands
+from . import variables
+
+
+# -- The commands which can be combined. These all emit records which can
+# -- be attributed to the path they were asked for
+COALESCED_COMMANDS = frozenset(
+    [
+        'files',
+        'fstat',
+        'have',
+        'sizes',
+        'where',
+    ]
+)
+
+# -- The flags which alter what is returned based on the call as a whole,
+# -- and therefore cannot be combined
+_UNCOALESCED_FLAGS = frozenset(['-m'])
+
+# -- The keyword arguments which can be given to a combined call. Calls with
+# -- any other special keyword arguments are run on their own
+_COALESCED_KWARGS = frozenset(
+    [
+        'client',
+        'port',
+        'return_type',
+        'timeout',
+        'user',
+    ]
+)
+
+# -- Once a batch holds this many paths it is run straight away
+_MAX_PATHS = 5000
+
+# -- The batches currently gathering calls, keyed by their command, flags
+# -- and connection settings
+_BATCHES = dict()
+_BATCHES_LOCK = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+def submit(args, kwargs, timeout, runner):
+    """
+    Adds the given call to a batch of calls to be run together, returning a
+    request which can be waited on. If the call cannot be combined with
+    others then None is returned and the call should be run as normal.
+
+    :param args: The flattened arguments of the call, starting with the
+        command
+    :type args: list(str, ...)
+
+    :param kwargs: The keyword arguments of the call
+    :type kwargs: dict
+
+    :param timeout: The timeout of the call
+    :type timeout: float
+
+    :param runner: The function used to run a combined call. This is given
+        the arguments, keyword arguments, timeout and return type of the call
+        and returns its results
+    :type runner: callable
+
+    :return: Request or None
+    """
+    window = variables.get_coalesce_window()
+
+    if not window or not args or args[0] not in COALESCED_COMMANDS:
+        return None
+
+    if any(key not in _COALESCED_KWARGS for key in kwargs):
+        return None
+
+    try:
+        command, flags, paths = commands.split_command(args)
+
+    except ValueError:
+        return None
+
+    if not paths or _UNCOALESCED_FLAGS.intersection(flags):
+        return None
+
+    if any(commands.is_wildcard(path) for path in paths):
+        return None
+
+    key = (
+        command,
+        tuple(flags),
+        kwargs.get('port', variables.get_port()),
+        kwargs.get('client', variables.get_client()),
+        kwargs.get('user', variables.get_user()),
+    )
+
+    request = Request(args, paths, timeout)
+
+    with _BATCHES_LOCK:
+        batch = _BATCHES.get(key)
+
+        if batch is None:
+            batch = _Batch(key, runner)
+            _BATCHES[key] = batch
+
+            timer = threading.Timer(window, _run_batch, args=(key, batch))
+            timer.daemon = True
+            timer.start()
+
+        batch.add(request)
+
+        # -- Large batches are run straight away rather than waiting
+        # -- for the window to close
+        run_now = batch.path_count >= _MAX_PATHS
+
+        if run_now:
+            _BATCHES.pop(key, None)
+
+    if run_now:
+        batch.run()
+
+    return request
+
+
+# ------------------------------------------------------------------------------
+def _run_batch(key, batch):
+    """
+    Private function called once the window of a batch has closed, which
+    stops the batch from gathering calls and runs it.
+
+    :param key: The key the batch is stored against
+    :param batch: The batch to run
+    :type batch: _Batch
+
+    :return: None
+    """
+    with _BATCHES_LOCK:
+        if _BATCHES.get(key) is not batch:
+            # -- The batch has already been run
+            return
+
+        _BATCHES.pop(key)
+
+    batch.run()
+
+
+# ------------------------------------------------------------------------------
+class Request(object):
+    """
+    A single call which has been added to a batch.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, args, paths, timeout):
+        self.args = args
+        self.paths = paths
+        self.timeout = timeout
+
+        # -- The records attributed to this request. If the combined call
+        # -- failed this is None
+        self.results = list()
+
+        # -- Set if the records of this request could not be reliably
+        # -- picked out of the combined results, in which case the call
+        # -- should be run on its own
+        self.retry = False
+
+        self._complete_event = threading.Event()
+
+    # --------------------------------------------------------------------------
+    def wait(self, timeout=None):
+        """
+        Blocks until the combined call completes or the timeout elapses.
+
+        :param timeout: Maximum time to wait, None will wait indefinitely
+        :type timeout: float
+
+        :return: True if the call completed within the timeout
+        """
+        return self._complete_event.wait(timeout)
+
+
+# ------------------------------------------------------------------------------
+class _Batch(object):
+    """
+    Private class which gathers the requests to be run as a single call.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, key, runner):
+        self.command = key[0]
+        self.flags = list(key[1])
+        self.port = key[2]
+        self.client = key[3]
+        self.user = key[4]
+
+        self.runner = runner
+        self.requests = list()
+        self.path_count = 0
+
+    # --------------------------------------------------------------------------
+    def add(self, request):
+        self.requests.append(request)
+        self.path_count += len(request.paths)
+
+    # --------------------------------------------------------------------------
+    def run(self):
+        """
+        Runs the combined call and distributes the records to each request.
+
+        :return: None
+        """
+        try:
+            self._run()
+
+        except BaseException:
+            print(str(sys.exc_info()))
+
+            for request in self.requests:
+                request.results = None
+
+        finally:
+            for request in self.requests:
+                request._complete_event.set()
+
+    # --------------------------------------------------------------------------
+    def _run(self):
+
+        # -- There is no need to attribute anything when there is only one
+        # -- request, we can run it exactly as it was given
+        if len(self.requests) == 1:
+            request = self.requests[0]
+            request.results = self._call(request.args, request.timeout)
+            return
+
+        # -- Map each path to the requests which asked for it, and build
+        # -- the unique list of paths to ask for
+        index = dict()
+        paths = list()
+
+        for request in self.requests:
+            for path in request.paths:
+                normalised = _normalise(path)
+
+                if normalised not in index:
+                    index[normalised] = list()
+                    paths.append(path)
+
+                if request not in index[normalised]:
+                    index[normalised].append(request)
+
+        # -- The combined call has to be given as long as the longest
+        # -- timeout of any of the requests
+        timeouts = [request.timeout for request in self.requests]
+        timeout = None if None in timeouts else max(timeouts)
+
+        results = self._call(
+            [self.command] + self.flags + [paths],
+            timeout,
+        )
+
+        if results is None:
+            for request in self.requests:
+                request.results = None
+            return
+
+        attributed = True
+        matched = set()
+
+        for record in results:
+            keys = _attribute(record, index)
+
+            if not keys:
+                attributed = False
+                continue
+
+            matched.update(keys)
+            targets = list()
+
+            for key in keys:
+                for request in index[key]:
+                    if request not in targets:
+                        targets.append(request)
+
+            for request in targets:
+                request.results.append(record)
+
+        # -- Every path we ask for gives at least one record, even if it is
+        # -- an error. So any request with a path nothing was attributed to
+        # -- may be missing records and is asked to run on its own. If a
+        # -- record could not be attributed at all we cannot know who it
+        # -- belonged to, so every request is run on its own
+        for request in self.requests:
+            if not attributed or any(
+                    _normalise(path) not in matched
+                    for path in request.paths):
+                request.retry = True
+
+    # --------------------------------------------------------------------------
+    def _call(self, args, timeout):
+        return self.runner(
+            args,
+            dict(
+                port=self.port,
+                client=self.client,
+                user=self.user,
+            ),
+            timeout,
+            None,
+        )
+
+
+# ------------------------------------------------------------------------------
+def _attribute(record, index):
+    """
+    Private function which returns the normalised paths (the keys of the
+    index) the given record belongs to based on the paths within the
+    record.
+
+    :param record: The record to attribute
+    :type record: dict
+
+    :param index: The requests keyed by their normalised paths
+    :type index: dict
+
+    :return: list(str, ...)
+    """
+    if not isinstance(record, dict):
+        return []
+
+    keys = list()
+
+    # -- Different callers may have asked for the same file by its depot
+    # -- and its local path, in which case both are given the record
+    for field in commands.PATH_FIELDS:
+        value = record.get(field)
+
+        if not value:
+            continue
+
+        key = _normalise(value)
+
+        if key in index and key not in keys:
+            keys.append(key)
+
+    if keys:
+        return keys
+
+    # -- Errors and warnings are reported against the path as it was given,
+    # -- for instance "//depot/file.txt - no such file(s)."
+    data = record.get('data')
+
+    if data and ' - ' in data:
+        key = _normalise(data.split(' - ', 1)[0])
+
+        if key in index:
+            return [key]
+
+    return []
+
+
+# ------------------------------------------------------------------------------
+def _normalise(path):
+    """
+    Private function which normalises a path so that paths given by the
+    caller can be compared with those p4 reports. Depot paths are left as
+    they are, whilst local paths are made absolute.
+
+    :param path: The path to normalise
+    :type path: str
+
+    :return: str
+    """
+    if path.startswith('//'):
+        return path
+
+    return os.path.normcase(os.path.abspath(path))
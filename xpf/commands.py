@@ -0,0 +1,384 @@
+"""
+This module holds knowledge about the p4 commands themselves, such as which
+commands only read data and how the arguments of a command are split between
+flags and file paths. This allows the other modules to reason about a call
+without having to run it.
+"""
+import os
+
+from . import spill
+
+
+# -- The commands which never alter anything, either on the server or
+# -- within the workspace
+READ_ONLY_COMMANDS = frozenset(
+    [
+        'annotate',
+        'branches',
+        'changelists',
+        'changes',
+        'clients',
+        'counters',
+        'depots',
+        'describe',
+        'diff',
+        'diff2',
+        'dirs',
+        'filelog',
+        'files',
+        'fixes',
+        'fstat',
+        'grep',
+        'groups',
+        'have',
+        'info',
+        'interchanges',
+        'jobs',
+        'labels',
+        'opened',
+        'print',
+        'set',
+        'sizes',
+        'streams',
+        'users',
+        'where',
+        'workspaces',
+    ]
+)
+
+# -- The commands which open, submit or otherwise alter the state of files,
+# -- either on the server or within the workspace
+WRITE_COMMANDS = frozenset(
+    [
+        'add',
+        'attribute',
+        'change',
+        'clean',
+        'client',
+        'copy',
+        'delete',
+        'edit',
+        'fix',
+        'flush',
+        'integ',
+        'integrate',
+        'label',
+        'labelsync',
+        'lock',
+        'merge',
+        'move',
+        'obliterate',
+        'populate',
+        'reconcile',
+        'rename',
+        'reopen',
+        'resolve',
+        'revert',
+        'shelve',
+        'submit',
+        'sync',
+        'tag',
+        'undo',
+        'unlock',
+        'unshelve',
+        'workspace',
+    ]
+)
+
+# -- The commands which output a spec when given -o, and are read only
+# -- when doing so
+SPEC_COMMANDS = frozenset(
+    [
+        'branch',
+        'change',
+        'client',
+        'job',
+        'label',
+        'stream',
+        'user',
+        'workspace',
+    ]
+)
+
+# -- The write commands which may be run without any file arguments but
+# -- which do not alter the have list or opened state of any files
+FILELESS_COMMANDS = frozenset(
+    [
+        'change',
+        'changelist',
+        'fix',
+        'label',
+        'labelsync',
+        'lock',
+        'tag',
+        'unlock',
+    ]
+)
+
+# -- The record fields which hold the path a record relates to
+PATH_FIELDS = (
+    'depotFile',
+    'clientFile',
+    'path',
+)
+
+# -- For the commands we fully understand, the flags which are followed by
+# -- a value and the flags which are not. Flags which take their options
+# -- within the flag itself (such as -Ol) are matched on their prefix
+_COMMAND_FLAGS = {
+    'changes': (
+        ('-c', '-e', '-m', '-s', '-u'),
+        ('-f', '-i', '-l', '-L', '-r', '-t'),
+    ),
+    'filelog': (
+        ('-c', '-m'),
+        ('-h', '-i', '-l', '-L', '-p', '-s', '-t'),
+    ),
+    'files': (
+        ('-m',),
+        ('-a', '-A', '-e', '-i', '-U'),
+    ),
+    'fstat': (
+        ('-A', '-c', '-e', '-F', '-m', '-T'),
+        ('-L', '-O', '-r', '-R', '-S', '-U'),
+    ),
+    'jobs': (
+        ('-e', '-m'),
+        ('-i', '-l', '-L', '-r'),
+    ),
+    'have': (
+        (),
+        (),
+    ),
+    'sizes': (
+        ('-b', '-m'),
+        ('-a', '-A', '-C', '-h', '-H', '-s', '-S', '-U', '-z'),
+    ),
+    'where': (
+        (),
+        (),
+    ),
+}
+
+
+# ------------------------------------------------------------------------------
+def is_read_only(command, flags=None):
+    """
+    Returns True if the given command (with the given flags) only reads
+    data. Commands which are neither known to be read only nor known to
+    write are assumed to write.
+
+    :param command: The p4 command, such as 'fstat'
+    :type command: str
+
+    :param flags: The flags given to the command
+    :type flags: list(str, ...)
+
+    :return: bool
+    """
+    if command in READ_ONLY_COMMANDS:
+        return True
+
+    if command in SPEC_COMMANDS and '-o' in (flags or []):
+        return True
+
+    return False
+
+
+# ------------------------------------------------------------------------------
+def is_understood(command):
+    """
+    Returns True if the flags of the given command are fully understood,
+    meaning split_command can reliably separate its flags from its paths.
+
+    :param command: The p4 command, such as 'fstat'
+    :type command: str
+
+    :return: bool
+    """
+    return command in _COMMAND_FLAGS
+
+
+# ------------------------------------------------------------------------------
+def split_command(args):
+    """
+    Splits the arguments of a call into the command, its flags (along with
+    the values of any flags which take one) and the file paths it operates
+    on.
+
+    For commands whose flags are understood (see is_understood) a ValueError
+    is raised if an unknown flag is given. For all other commands any
+    argument starting with a dash is considered a flag and everything
+    else a path, which is only an approximation.
+
+    :param args: The flattened arguments of the call, starting with the
+        command
+    :type args: list(str, ...)
+
+    :return: tuple(command, flags, paths)
+    """
+    command = args[0]
+    flags = list()
+    paths = list()
+
+    value_flags, switch_flags = _COMMAND_FLAGS.get(command, (None, None))
+
+    arguments = iter(args[1:])
+
+    for argument in arguments:
+        if paths or not argument.startswith('-'):
+            paths.append(argument)
+            continue
+
+        if value_flags is None:
+            flags.append(argument)
+
+        elif argument in value_flags:
+            flags.extend([argument, next(arguments, '')])
+
+        # -- Values can also be given within the flag itself (such as -m1)
+        # -- which we split so the flag can always be found on its own
+        elif argument[:2] in value_flags:
+            flags.extend([argument[:2], argument[2:]])
+
+        elif argument.startswith(switch_flags):
+            flags.append(argument)
+
+        else:
+            raise ValueError(
+                'Unknown flag for %s : %s' % (command, argument),
+            )
+
+    return command, flags, paths
+
+
+# ------------------------------------------------------------------------------
+def is_wildcard(path):
+    """
+    Returns True if the given path holds a wildcard or a revision specifier,
+    meaning it may refer to any number of files.
+
+    :param path: The path to test
+    :type path: str
+
+    :return: bool
+    """
+    return (
+        '...' in path
+        or '*' in path
+        or '%%' in path
+        or '#' in path
+        or '@' in path
+    )
+
+
+# ------------------------------------------------------------------------------
+def file_paths(args):
+    """
+    Returns the file paths given to a call. When the flags of the command
+    are not fully understood we only keep arguments which look like paths
+    or revisions, as the values of flags cannot be told apart from paths.
+
+    :param args: The flattened arguments of the call, starting with the
+        command
+    :type args: list(str, ...)
+
+    :return: list(str, ...)
+    """
+    understood = is_understood(args[0])
+
+    try:
+        _, _, paths = split_command(args)
+
+    except ValueError:
+        # -- An unknown flag means we cannot tell the values of flags
+        # -- apart from paths
+        paths = [arg for arg in args[1:] if not arg.startswith('-')]
+        understood = False
+
+    if understood:
+        return paths
+
+    return [
+        path
+        for path in paths
+        if path.startswith(('/', '@', '#')) or '/' in path or '\\' in path
+    ]
+
+
+# ------------------------------------------------------------------------------
+def record_paths(results):
+    """
+    Returns every path found within the given results (see PATH_FIELDS).
+
+    :param results: The results of a call
+
+    :return: list(str, ...)
+    """
+    paths = list()
+
+    if not isinstance(results, (list, spill.SpilledResult)):
+        return paths
+
+    for record in results:
+        if not isinstance(record, dict):
+            continue
+
+        for field in PATH_FIELDS:
+            value = record.get(field)
+
+            if value:
+                paths.append(value)
+
+    return paths
+
+
+# ------------------------------------------------------------------------------
+def affected_paths(args, results):
+    """
+    Returns the files affected by a command which may have altered them,
+    taken from both the arguments of the command and the paths within its
+    results. These are split into individual files and the prefixes of
+    directories (paths ending in ...). Revisions are removed and local paths
+    are made absolute.
+
+    :param args: The flattened arguments of the command, starting with the
+        command itself, or None if they are not known
+    :type args: list(str, ...)
+
+    :param results: The results of the command
+
+    :return: tuple(set(str, ...), set(str, ...)) or None if it cannot be
+        told which files were affected
+    """
+    if not args:
+        return None
+
+    paths = file_paths(args) + record_paths(results)
+
+    if not paths:
+        if args[0] in FILELESS_COMMANDS:
+            return set(), set()
+
+        return None
+
+    exact = set()
+    prefixes = set()
+
+    for path in paths:
+        # -- Revisions make no difference to which files are affected
+        path = path.split('#', 1)[0].split('@', 1)[0]
+
+        if not path.startswith('//'):
+            path = os.path.abspath(path)
+
+        if not is_wildcard(path):
+            exact.add(path)
+
+        elif path.endswith('...') and not is_wildcard(path[:-3]):
+            prefixes.add(path[:-3])
+
+        else:
+            return None
+
+    return exact, prefixes
@@ -2,13 +2,76 @@
 This module handles the connection and serve accessibility methods. All calls
 should be routed through here to ensure for a consistent result
 """
+import os
 import sys
-import time
+import atexit
+import signal
 import marshal
+import functools
+import itertools
 import threading
 import subprocess
 
+try:
+    import queue
+
+except ImportError:
+    import Queue as queue
+
 from . import variables
+from . import cache
+from . import tables
+from . import records
+from . import spill
+from . import reactor
+from . import commands
+from . import metadata
+from . import coalesce
+from . import marshalling
+
+
+# -- Every p4 process spawned by xpf is registered here (keyed by its pid)
+# -- for as long as it is alive. This allows us to inspect what is currently
+# -- in-flight as well as ensure nothing is left behind on exit
+_LIVE_PROCESSES = dict()
+_LIVE_PROCESSES_LOCK = threading.Lock()
+
+# -- The leading global arguments for each combination of connection
+# -- settings we have been asked to run with
+_GLOBAL_ARGS = dict()
+
+# -- The maximum number of records which can be waiting to be consumed
+# -- when streaming before we stop reading from p4
+_STREAM_QUEUE_SIZE = 1000
+
+# -- Placed on a record queue once a streamed call has no more records
+_END_OF_STREAM = object()
+
+# -- The number of bytes read at a time when writing output straight to
+# -- a destination, see safe_run
+_OUTPUT_CHUNK_SIZE = 1024 * 1024
+
+# -- The shareable calls which are currently running, keyed by their full
+# -- command, see _run_shared_call
+_IN_FLIGHT = dict()
+_IN_FLIGHT_LOCK = threading.Lock()
+
+# -- The severity p4 gives to errors which mean a command failed, rather
+# -- than warnings such as a file not being on the client
+_E_FAILED = 3
+
+# -- The callables which are informed of every command which may have
+# -- altered files, see add_write_hook
+_WRITE_HOOKS = list()
+
+# -- Calls given any of these keyword arguments are never shared
+_UNSHARED_KWARGS = (
+    'form',
+    'output',
+    'on_error',
+    'on_progress',
+    'on_record',
+)
 
 
 # ------------------------------------------------------------------------------
@@ -21,9 +84,53 @@ def safe_run(*args, **kwargs):
     This will also manage the timeout logic, returning the default_value if
     ever the timeout is exceeded.
 
-    It also manages the format of arguments coming in, wrapping all strings
-    in quotes to ensure thorough compatibility as well as constructing the
-    commandline.
+    Callbacks can be given to be informed of each record as it is read,
+    which is useful for long running commands such as sync or submit. They
+    are called from the thread reading the p4 output:
+
+        * on_record(record) is called for every record
+        * on_error(record) is called for every record with an error code
+        * on_progress(count) is called with the number of records read so far
+
+    It also manages the format of arguments coming in, unpacking any lists
+    and constructing the argument list which is passed directly to the p4
+    executable (without going through a shell).
+
+    Any lists, tuples or generators given as the trailing arguments are
+    considered file arguments. If there are more of these than
+    xpf.variables.get_arg_input_count() or they are larger than
+    xpf.variables.get_arg_input_size() then they are streamed to p4 as an
+    argument file (p4 -x) rather than placed on the command line. Generators
+    are consumed lazily in this case, so the full list is never held.
+
+    If xpf.variables.get_use_reactor() is True (and the platform supports
+    it) the call is serviced by the shared xpf.reactor rather than by a
+    thread of its own. Calls given callbacks, an output or streamed through
+    iter_run always have a thread of their own, so user code is never run
+    on the reactor thread.
+
+    If xpf.variables.get_coalesce_window() is set, small read only queries
+    may be combined with the same query from other threads (see
+    xpf.coalesce).
+
+    If an identical read only call is already running (and
+    xpf.variables.get_single_flight() is True) we wait on that call rather
+    than starting another, each caller waiting with its own timeout.
+
+    If xpf.variables.get_use_cache() is True the results of read only calls
+    are cached (see xpf.cache). Every command which may alter files is
+    passed to the registered write hooks once it completes.
+
+    If xpf.variables.get_use_metadata_cache() is True the results of queries
+    which can never change (such as describes of submitted changes) are
+    stored permanently (see xpf.metadata).
+
+    If an output is given then the raw output of p4 is written straight to
+    it in fixed size chunks, without being marshalled, decoded or held in
+    memory, and the number of bytes written is returned. The output can be
+    a file path, a file descriptor, a writable file object or a callable.
+    A callable is given a memoryview over a buffer which is re-used for the
+    next chunk, so it must copy anything it wants to keep.
 
     :return: bool 
     """
@@ -39,100 +146,411 @@ def safe_run(*args, **kwargs):
         None,
     )
 
-    # -- Forms are used to inject data to p4
-    form = kwargs.get(
-        'form',
-        None,
-    )
+    # -- Read only calls may be answered from the caches
+    lookup = CacheLookup(args, kwargs)
+    results = lookup.get()
 
-    marshal_result = kwargs.get(
-        'marshal',
-        True,
-    )
+    if results is not cache.MISS:
+        return results
 
-    port = kwargs.get(
-        'port',
-        variables.get_port(),
-    )
+    results = _dispatch_call(args, kwargs, timeout, return_type)
 
-    client = kwargs.get(
-        'client',
-        variables.get_client(),
-    )
+    if results is not return_type:
+        lookup.put(results)
 
-    user = kwargs.get(
-        'user',
-        variables.get_user(),
+    # -- Let anything holding state about files know they may have changed
+    notify_write(args, results)
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def checked_run(*args, **kwargs):
+    """
+    Runs a call exactly as safe_run does, but rather than raising or giving
+    back the return type when the call fails this returns None. A call is
+    considered to have failed if it raised, timed out or returned an error
+    record (warnings, such as files not being on the client, are part of a
+    valid result).
+
+    This allows a call which failed to be told apart from a call which
+    genuinely had no results, which the failsafe xpf.direct functions
+    cannot do.
+
+    :return: The results of the call or None if it failed
+    """
+    try:
+        results = safe_run(*args, **kwargs)
+
+    except BaseException:
+        print(str(sys.exc_info()))
+        return None
+
+    if results is None or isinstance(results, str):
+        return None
+
+    for record in results:
+        if not isinstance(record, dict):
+            continue
+
+        if (record.get('code') == 'error'
+                and int(record.get('severity', _E_FAILED)) >= _E_FAILED):
+            return None
+
+    return results
+
+
+# ------------------------------------------------------------------------------
+def add_write_hook(hook):
+    """
+    Registers a callable which is called after every command which may have
+    altered files (any command which is not known to be read only) has
+    completed. The hook is given the flattened arguments of the command
+    (starting with the command itself, or None if they could not be read
+    without consuming them) and the results of the command.
+
+    :param hook: The callable to register
+    :type hook: callable
+
+    :return: None
+    """
+    if hook not in _WRITE_HOOKS:
+        _WRITE_HOOKS.append(hook)
+
+
+# ------------------------------------------------------------------------------
+def remove_write_hook(hook):
+    """
+    Removes a callable previously registered with add_write_hook.
+
+    :param hook: The callable to remove
+    :type hook: callable
+
+    :return: None
+    """
+    if hook in _WRITE_HOOKS:
+        _WRITE_HOOKS.remove(hook)
+
+
+# ------------------------------------------------------------------------------
+def _dispatch_call(args, kwargs, timeout, return_type):
+    """
+    Private function which runs a call on behalf of safe_run, combining it
+    with other calls if coalescing is enabled.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :param timeout: The maximum time to wait for the call
+    :type timeout: float
+
+    :param return_type: The value to return if the call times out
+
+    :return: The results of the call, or the return_type
+    """
+    # -- Small queries made at the same time from different threads can
+    # -- be combined into a single call
+    if variables.get_coalesce_window() and _is_concrete(args):
+        request = coalesce.submit(_flatten(args), kwargs, timeout, _run_call)
+
+        if request is not None:
+            if not request.wait(timeout):
+                print('xpf :: timing out (after %ss)...' % timeout)
+                return return_type
+
+            if not request.retry:
+                if request.results is None:
+                    return return_type
+
+                return request.results
+
+    return _run_call(args, kwargs, timeout, return_type)
+
+
+# ------------------------------------------------------------------------------
+def _run_call(args, kwargs, timeout, return_type):
+    """
+    Private function which runs a single call on behalf of safe_run, waiting
+    for it to complete.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :param timeout: The maximum time to wait for the call
+    :type timeout: float
+
+    :param return_type: The value to return if the call times out
+
+    :return: The results of the call, or the return_type
+    """
+    # -- Identical read only calls which are already running are shared
+    # -- rather than run again
+    if variables.get_single_flight() and _is_shareable(args, kwargs):
+        return _run_shared_call(args, kwargs, timeout, return_type)
+
+    # -- Construct the call from our arguments
+    thread = _create_call(args, kwargs, timeout=timeout)
+
+    # -- Start the execution thread and block until it signals completion
+    # -- or our timeout elapses. Python 3 has a lot of the timeout
+    # -- functionality already built into subprocess but we need to be
+    # -- python 2 compatible, so we wait on the threads completion event
+    # -- rather than polling it.
+    thread.start()
+
+    # -- If we exceeded our timeout period we need to terminate
+    # -- our call and return our default return type rather than
+    # -- the actual return value. Calls run by the reactor may also
+    # -- have been timed out by the reactor itself.
+    if not thread.wait(timeout) or thread.timed_out:
+        print('xpf :: timing out (after %ss)...' % timeout)
+        thread.terminate()
+
+        return return_type
+
+    if thread.error is not None:
+        print('xpf :: call failed : %s' % thread.error)
+        return return_type
+
+    return thread.results
+
+
+# ------------------------------------------------------------------------------
+def _run_shared_call(args, kwargs, timeout, return_type):
+    """
+    Private function which runs a call on behalf of _run_call, attaching to
+    an identical call if one is already in flight. Every caller waits with
+    its own timeout, and the call is only terminated once every caller has
+    given up on it.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :param timeout: The maximum time to wait for the call
+    :type timeout: float
+
+    :param return_type: The value to return if the call times out
+
+    :return: The results of the call, or the return_type
+    """
+    cmd, arg_input = build_command(args, kwargs)
+
+    # -- The argument input has to be read to form the key, so it is
+    # -- held as a list from here on
+    if arg_input is not None:
+        arg_input = list(arg_input)
+
+    # -- The full command includes the global arguments, so this also
+    # -- covers the port, client and user
+    key = (
+        tuple(cmd),
+        tuple(arg_input) if arg_input is not None else None,
+        bool(kwargs.get('compact', False)),
+        bool(kwargs.get('as_table', False)),
     )
 
-    # -- Define our mandatory elements for the perforce command
-    cmd = [
-        'p4',
-        '-G' if marshal_result else '',
-    ]
+    with _IN_FLIGHT_LOCK:
+        flight = _IN_FLIGHT.get(key)
+        leader = flight is None or flight.thread.complete
 
-    # -- Add the port and client if they are given. These have to be
-    # -- added before the command
-    if port:
-        cmd.extend(['-p', port])
+        if leader:
+            # -- The callers enforce their own timeouts, so the call
+            # -- itself is never timed out by the reactor
+            flight = _Flight(
+                _create_call(args, kwargs, command=(cmd, arg_input)),
+            )
+            _IN_FLIGHT[key] = flight
 
-    if client:
-        cmd.extend(['-c', client])
+        flight.waiters += 1
+        flight.callers += 1
 
-    if user:
-        cmd.extend(['-u', user])
+    thread = flight.thread
 
-    # -- Now extend it with all the arguments coming into the
-    # -- the function
-    cmd.extend(args)
+    if leader:
+        try:
+            thread.start()
 
-    # -- Finally, construct our execution string
-    formatted_items = list()
-    for item in cmd:
-        item = _stringify(item)
-        if item:
-            formatted_items.append(item)
+        except BaseException:
+            # -- Let anyone who has already attached know the call
+            # -- will never complete
+            with _IN_FLIGHT_LOCK:
+                flight.failed = True
+                _remove_flight(key, flight)
 
-    # -- Join it all together
-    exec_str = ' '.join(formatted_items)
+            thread._complete_event.set()
+            raise
 
-    # -- If we're meant to log debug info print off the command
-    # -- we're about to run
-    if variables.get_debug():
-        print('xpf :: %s' % exec_str)
+    completed = thread.wait(timeout)
 
-    # -- Open a process to run an external call
-    thread = ThreadedP4Call(
-        exec_str,
-        form=form,
-        marshal_result=marshal_result,
+    with _IN_FLIGHT_LOCK:
+        flight.waiters -= 1
+        abandoned = not completed and not flight.waiters
+
+        # -- No one can attach once the call has completed, so this is
+        # -- the final number of callers
+        shared = flight.callers > 1
+
+        if completed or abandoned:
+            _remove_flight(key, flight)
+
+    if not completed:
+        print('xpf :: timing out (after %ss)...' % timeout)
+
+        if abandoned:
+            thread.terminate()
+
+        return return_type
+
+    if flight.failed:
+        return return_type
+
+    if thread.error is not None:
+        print('xpf :: call failed : %s' % thread.error)
+        return return_type
+
+    # -- If the call was shared each caller is given its own copy of the
+    # -- records, as the cache does, so that altering them does not affect
+    # -- the other callers. Spilled results are read only so they are
+    # -- shared rather than read back into memory
+    if shared:
+        return cache.copy_results(thread.results)
+
+    return thread.results
+
+
+# ------------------------------------------------------------------------------
+def iter_run(*args, **kwargs):
+    """
+    Runs a call in the same way as safe_run, but rather than waiting for
+    the call to complete and returning all the records this yields each
+    record as soon as p4 emits it. This allows for very large results to be
+    processed with bounded memory.
+
+    The timeout is applied to how long we wait on p4 for each record rather
+    than to the call as a whole, so time spent processing records is not
+    counted. If the timeout is exceeded the call is terminated and no more
+    records are yielded. Likewise, if the generator is closed before all the
+    records are consumed the call is terminated.
+
+    If the call is not marshalled then the output is yielded line by line.
+
+    :return: generator
+    """
+    timeout = kwargs.get(
+        'timeout',
+        variables.get_timeout(),
     )
 
-    # -- Start the execution thread and being the timer. Python 3 has a
-    # -- lot of the timeout functionality already built into subprocess
-    # -- but we need to by python 2 compatible.
+    # -- The queue is bounded so that p4 is held back if the records
+    # -- are not being consumed as fast as they are produced
+    record_queue = queue.Queue(maxsize=_STREAM_QUEUE_SIZE)
+
+    thread = _create_call(args, kwargs, record_queue=record_queue)
     thread.start()
-    start_time = time.time()
 
-    # -- Loop for the duration of the call, monitoring how long
-    # -- its taking
-    while not thread.complete:
+    try:
+        while True:
+            try:
+                record = record_queue.get(timeout=timeout)
+
+            except queue.Empty:
+                print('xpf :: timing out (after %ss)...' % timeout)
+                break
 
-        # -- Determine how long we have been running the call
-        current_time = time.time()
-        delta_time = (current_time - start_time)  # Convert to seconds
+            if record is _END_OF_STREAM:
+                break
 
-        # -- If we exceeded our timeout period we need to terminate
-        # -- our call and return our default return type rather than
-        # -- the actual return value
-        if delta_time > timeout:
-            print('xpf :: timing out (after %ss)...' % timeout)
-            thread.process = None
-            del thread
+            yield record
 
-            return return_type
+    finally:
+        if not thread.complete:
+            thread.terminate()
 
-    return thread.results
+        notify_write(args, None)
+
+
+# ------------------------------------------------------------------------------
+def live_processes():
+    """
+    Returns all the p4 processes which xpf has spawned and which have not
+    yet completed.
+
+    :return: list(subprocess.Popen, ...)
+    """
+    with _LIVE_PROCESSES_LOCK:
+        return list(_LIVE_PROCESSES.values())
+
+
+# ------------------------------------------------------------------------------
+def terminate_process(process):
+    """
+    Terminates the given p4 process along with any processes it has spawned
+    and then reaps it to ensure it does not linger as a zombie.
+
+    :param process: The process to terminate
+    :type process: subprocess.Popen
+
+    :return: None
+    """
+    if process.poll() is None:
+        kill_process_tree(process.pid)
+
+    # -- Wait for the process to exit so the os can release it. Any
+    # -- thread reading from the process will now be given an EOF.
+    process.wait()
+    unregister_process(process)
+
+
+# ------------------------------------------------------------------------------
+def kill_process_tree(pid):
+    """
+    Kills the process with the given pid along with any processes it has
+    spawned. The process is expected to have been started in its own process
+    group (as all xpf processes are). This does not wait for the process.
+
+    :param pid: The id of the process to kill
+    :type pid: int
+
+    :return: None
+    """
+    try:
+        if os.name == 'nt':
+            # -- Windows has no process groups we can signal, so we
+            # -- lean on taskkill to take down the whole tree
+            subprocess.call(
+                ['taskkill', '/F', '/T', '/PID', str(pid)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+
+        else:
+            # -- Every process is started in its own session, so its
+            # -- pid is also the id of the group we need to kill
+            os.killpg(pid, signal.SIGKILL)
+
+    except OSError:
+        pass
+
+
+# ------------------------------------------------------------------------------
+def terminate_all():
+    """
+    Terminates every p4 process which xpf has spawned that is still running.
+    This is automatically called when the interpreter exits.
+
+    :return: None
+    """
+    for process in live_processes():
+        terminate_process(process)
 
 
 # ------------------------------------------------------------------------------
@@ -214,108 +632,1183 @@ def initialise_variables():
 
 
 # ------------------------------------------------------------------------------
-def _stringify(item):
+def build_command(args, kwargs):
     """
-    Private funtion which wraps all items in quotes to protect from paths
-    being broken up. It will also unpack lists into strings
+    Constructs the argument list for a p4 process from the arguments and
+    special keyword arguments (form, marshal, port, client and user) given
+    to a call.
+
+    Large trailing file lists are not placed in the argument list, instead
+    they are returned separately so they can be fed to p4 through its stdin.
+
+    :param args: The arguments given to the call
+    :type args: tuple
 
-    :param item: Item to stringify.
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
 
-    :return: string
+    :return: tuple(cmd, arg_input) where cmd is the argument list and
+        arg_input is either None or a generator of the arguments to be
+        written to the stdin of the process
     """
-    if isinstance(item, (list, tuple)):
-        return '"' + '" "'.join(item) + '"'
+    # -- Forms are used to inject data to p4
+    form = kwargs.get(
+        'form',
+        None,
+    )
 
-    if isinstance(item, str) and len(item) == 0:
-        return None
+    marshal_result = kwargs.get(
+        'marshal',
+        True,
+    )
+
+    # -- Output written straight to a destination is always the raw output
+    if kwargs.get('output') is not None:
+        marshal_result = False
+
+    port = kwargs.get(
+        'port',
+        variables.get_port(),
+    )
+
+    client = kwargs.get(
+        'client',
+        variables.get_client(),
+    )
+
+    user = kwargs.get(
+        'user',
+        variables.get_user(),
+    )
+
+    # -- Large file lists would exceed the os command line limits, so if
+    # -- the trailing file lists are big enough we pass them to p4 through
+    # -- its stdin instead (-x -). Forms also use stdin, so we cannot do
+    # -- both at once.
+    arg_input = None
+
+    if not form:
+        args, arg_input = _split_arg_input(args)
+
+    # -- Build our argument list. The global arguments (marshalling, port,
+    # -- client and user) have to be added before the command and are
+    # -- shared by every call with the same settings, so we re-use them.
+    cmd = _global_args(marshal_result, port, client, user)
+
+    if arg_input is not None:
+        cmd.extend(['-x', '-'])
+
+    cmd.extend(_flatten(args))
 
-    return '"%s"' % item
+    # -- If we're meant to log debug info print off the command
+    # -- we're about to run
+    if variables.get_debug():
+        print('xpf :: %s' % _format_command(cmd))
+
+    return cmd, arg_input
 
 
 # ------------------------------------------------------------------------------
-class ThreadedP4Call(threading.Thread):
+def _create_call(args, kwargs, record_queue=None, timeout=None, command=None):
     """
-    All our calls are threaded to allow for timeouts to occur in both
-    Python2 and Python3
+    Private function which constructs the ThreadedP4Call for the given
+    arguments and special keyword arguments (form, marshal, port, client,
+    user, on_record, on_error, on_progress, compact, as_table and output).
+    The call is not started.
+
+    If the reactor is enabled, supported and we are not streaming, writing
+    to an output or calling back, a ReactorP4Call is returned instead.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :param record_queue: If given, records will be put onto this queue as
+        they are read rather than collected into the results.
+    :type record_queue: queue.Queue
+
+    :param timeout: The time after which a reactor call is terminated
+    :type timeout: float
+
+    :param command: Optionally the (cmd, arg_input) tuple, if build_command
+        has already been called for these arguments
+    :type command: tuple
+
+    :return: ThreadedP4Call
     """
+    # -- Construct the arguments for the process
+    cmd, arg_input = command or build_command(args, kwargs)
+
+    call_kwargs = dict()
+    call_class = ThreadedP4Call
+    output = kwargs.get('output')
+
+    # -- Streamed calls rely on blocking their thread when the consumer
+    # -- falls behind, which the reactor cannot do, so they always have
+    # -- a thread of their own. The same is true of calls writing to an
+    # -- output, which may block on a slow destination, and of calls with
+    # -- callbacks. A callback may take any amount of time or make calls
+    # -- of its own, neither of which can happen on the reactor thread
+    # -- without stalling every other call it is servicing
+    has_callbacks = any(
+        kwargs.get(name)
+        for name in ('on_record', 'on_error', 'on_progress')
+    )
 
-    # --------------------------------------------------------------------------
-    def __init__(self, cmd, form=None, marshal_result=True):
-        super(ThreadedP4Call, self).__init__()
+    if (record_queue is None
+            and output is None
+            and not has_callbacks
+            and variables.get_use_reactor()
+            and reactor.is_supported()):
+        call_class = ReactorP4Call
+        call_kwargs['timeout'] = timeout
 
-        self.cmd = cmd
-        self.form = form
-        self.marshal = marshal_result
+    # -- Open a process to run an external call
+    return call_class(
+        cmd,
+        form=kwargs.get('form'),
+        marshal_result=kwargs.get('marshal', True) and output is None,
+        arg_input=arg_input,
+        record_queue=record_queue,
+        on_record=kwargs.get('on_record'),
+        on_error=kwargs.get('on_error'),
+        on_progress=kwargs.get('on_progress'),
+        compact=kwargs.get('compact', False),
+        as_table=kwargs.get('as_table', False),
+        output=output,
+        **call_kwargs
+    )
 
-        self.process = None
-        self.complete = False
-        self.results = list()
 
-    # --------------------------------------------------------------------------
-    def run(self):
+# ------------------------------------------------------------------------------
+def register_process(process):
+    """
+    Adds a process to the live process registry, ensuring it is terminated
+    by terminate_all.
 
-        # -- This is pretty much a copy/paste of the p4 example of using
-        # -- -G. We kick off a process, get the process input and output,
-        # -- injecting any form informaiton before reading the output
-        p = subprocess.Popen(
-            self.cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            shell=True,
-        )
+    :param process: The process to register, or any object with the same
+        pid, poll and wait interface
+    :type process: subprocess.Popen
 
-        (pi, po) = (p.stdin, p.stdout)
+    :return: None
+    """
+    with _LIVE_PROCESSES_LOCK:
+        _LIVE_PROCESSES[process.pid] = process
 
-        if self.form:
-            marshal.dump(self.form, pi, 0)
-            pi.close()
 
-        # -- How we read the output depends a lot on whether we need
-        # -- to marshal or not. If we do, we must conform specific
-        # -- dictionary standards which can differ between python2 and
-        # -- python3 (py2 gives strings, py3 gives bytes)
-        if self.marshal:
-            records = []
-            try:
-                while True:
-                    records.append(
-                        self._byte_dict_to_str_dict(
-                            marshal.load(po)
-                        )
-                    )
-
-            except EOFError:
-                pass
+# ------------------------------------------------------------------------------
+def unregister_process(process):
+    """
+    Removes a process from the live process registry.
 
-            self.results = records
+    :param process: The process to unregister
+    :type process: subprocess.Popen
 
-        else:
-            self.results = po.read().decode('utf-8')
+    :return: None
+    """
+    with _LIVE_PROCESSES_LOCK:
+        _LIVE_PROCESSES.pop(process.pid, None)
 
-        # -- By setting this to True we know we're completely finished.
-        self.complete = True
 
-    # --------------------------------------------------------------------------
-    @staticmethod
-    def _byte_dict_to_str_dict(dictionary):
-        """
-        This ensures that the dictionary has any keys and values converted
-        from bytes to strings.
-        
-        :param dictionary: 
-        :return: 
-        """
-        if sys.version_info.major < 3:
-            return dictionary
+# ------------------------------------------------------------------------------
+def run_callback(callback, value):
+    """
+    Calls the given on_record, on_error or on_progress callback, ensuring
+    any exception it raises does not interrupt the reading of the p4
+    output.
+
+    :param callback: The callable to call
+    :param value: The value to pass to the callable
+
+    :return: None
+    """
+    try:
+        callback(value)
+
+    except BaseException:
+        print(str(sys.exc_info()))
+
+
+# ------------------------------------------------------------------------------
+def popen_kwargs():
+    """
+    Returns the platform specific subprocess arguments required to start a
+    p4 process in its own process group. This is what allows us to terminate
+    the process along with anything it spawns.
+
+    :return: dict
+    """
+    if os.name == 'nt':
+        return dict(
+            creationflags=getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0x200),
+        )
+
+    if sys.version_info.major < 3:
+        return dict(preexec_fn=os.setsid)
+
+    return dict(start_new_session=True)
+
+
+# ------------------------------------------------------------------------------
+def _global_args(marshal_result, port, client, user):
+    """
+    Private function which returns the leading p4 arguments (the executable
+    and global options) for the given settings. These are only constructed
+    once for each unique combination of settings.
+
+    :param marshal_result: Whether the -G option should be included
+    :type marshal_result: bool
+
+    :param port: The port to pass with -p, if any
+    :type port: str
+
+    :param client: The client to pass with -c, if any
+    :type client: str
+
+    :param user: The user to pass with -u, if any
+    :type user: str
+
+    :return: list(str, str, ...)
+    """
+    key = (bool(marshal_result), port, client, user)
+
+    try:
+        return list(_GLOBAL_ARGS[key])
+
+    except KeyError:
+        pass
+
+    # -- Define our mandatory elements for the perforce command
+    cmd = ['p4']
+
+    if marshal_result:
+        cmd.append('-G')
+
+    # -- Add the port and client if they are given. These have to be
+    # -- added before the command
+    if port:
+        cmd.extend(['-p', _to_arg(port)])
+
+    if client:
+        cmd.extend(['-c', _to_arg(client)])
+
+    if user:
+        cmd.extend(['-u', _to_arg(user)])
+
+    _GLOBAL_ARGS[key] = tuple(cmd)
+
+    return cmd
+
+
+# ------------------------------------------------------------------------------
+def _flatten(args):
+    """
+    Private function which converts the arguments given to a call into a
+    flat list of strings, unpacking any lists, tuples or generators. Empty
+    strings are omitted.
+
+    :param args: Arguments to flatten
+
+    :return: list(str, str, ...)
+    """
+    return list(_iter_flat(args))
+
+
+# ------------------------------------------------------------------------------
+def _iter_flat(args):
+    """
+    Private generator which yields each argument as a string, unpacking any
+    lists, tuples or generators. Empty strings are omitted.
+
+    :param args: Arguments to flatten
+
+    :return: generator(str, ...)
+    """
+    for item in args:
+        if _is_arg_list(item):
+            for sub_item in _iter_flat(item):
+                yield sub_item
+            continue
+
+        item = _to_arg(item)
+
+        if item:
+            yield item
+
+
+# ------------------------------------------------------------------------------
+def _is_arg_list(item):
+    """
+    Private function to determine whether an argument is a list of arguments
+    (a list, tuple or any other non-string iterable).
+
+    :param item: Item to test
+
+    :return: bool
+    """
+    if isinstance(item, (list, tuple)):
+        return True
+
+    if isinstance(item, (str, bytes, dict)):
+        return False
+
+    return hasattr(item, '__iter__')
+
+
+# ------------------------------------------------------------------------------
+def _is_concrete(args):
+    """
+    Private function to determine whether the arguments given to a call can
+    be read without consuming anything (meaning there are no generators
+    amongst them).
+
+    :param args: The arguments given to the call
+
+    :return: bool
+    """
+    for item in args:
+        if isinstance(item, (list, tuple)):
+            if not _is_concrete(item):
+                return False
+
+        elif _is_arg_list(item):
+            return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def _is_shareable(args, kwargs):
+    """
+    Private function to determine whether a call may be shared with other
+    callers making the identical call. Only read only calls with no forms or
+    callbacks are shared.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+
+    :return: bool
+    """
+    for key in _UNSHARED_KWARGS:
+        if kwargs.get(key):
+            return False
+
+    if not _is_concrete(args):
+        return False
+
+    flat = _flatten(args)
+
+    if not flat:
+        return False
+
+    return commands.is_read_only(
+        flat[0],
+        [item for item in flat[1:] if item.startswith('-')],
+    )
+
+
+# ------------------------------------------------------------------------------
+def notify_write(args, results):
+    """
+    Passes a completed call to each of the write hooks, unless the call is
+    known to be read only. This is called by safe_run, and by anything else
+    which runs p4 itself (such as xpf.aio), after every call.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param results: The results of the call
+
+    :return: None
+    """
+    if not _WRITE_HOOKS:
+        return
+
+    # -- Any generators amongst the arguments have already been consumed
+    if _is_concrete(args):
+        flat = _flatten(args)
+
+    else:
+        flat = None
+
+    leading = flat or [item for item in args if isinstance(item, str)]
+
+    if not leading:
+        return
+
+    flags = [item for item in leading[1:] if item.startswith('-')]
+
+    if commands.is_read_only(leading[0], flags):
+        return
+
+    for hook in list(_WRITE_HOOKS):
+        try:
+            hook(flat, results)
+
+        except BaseException:
+            print(str(sys.exc_info()))
+
+
+# ------------------------------------------------------------------------------
+def _remove_flight(key, flight):
+    """
+    Private function which removes a flight from the in-flight calls if it
+    has not already been replaced. This must be called whilst holding the
+    _IN_FLIGHT_LOCK.
+
+    :param key: The key of the flight
+    :param flight: The flight to remove
+    :type flight: _Flight
+
+    :return: None
+    """
+    if _IN_FLIGHT.get(key) is flight:
+        _IN_FLIGHT.pop(key)
+
+
+# ------------------------------------------------------------------------------
+def _split_arg_input(args):
+    """
+    Private function which looks at the trailing file list arguments and
+    determines whether they are large enough that they should be passed to
+    p4 as an argument file rather than on the command line.
+
+    Only as many arguments as are needed to make that decision are read, so
+    any generators are not consumed beyond the threshold.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :return: tuple(args, arg_input) where args are the arguments to be placed
+        on the command line and arg_input is either None or a generator
+        of the arguments to be given to -x
+    """
+    # -- Find where the trailing run of file lists start
+    split_idx = len(args)
+    while split_idx and _is_arg_list(args[split_idx - 1]):
+        split_idx -= 1
+
+    if split_idx == len(args):
+        return args, None
+
+    leading = list(args[:split_idx])
+    trailing = _iter_flat(args[split_idx:])
+
+    max_count = variables.get_arg_input_count()
+    max_size = variables.get_arg_input_size()
+
+    count = 0
+    size = 0
+    peeked = list()
+
+    for item in trailing:
+        peeked.append(item)
+
+        count += 1
+        size += len(item) + 1
+
+        if count > max_count or size > max_size:
+            return leading, itertools.chain(peeked, trailing)
+
+    leading.append(peeked)
+    return leading, None
+
+
+# ------------------------------------------------------------------------------
+def _to_arg(item):
+    """
+    Private function which converts a single argument into a string.
+
+    :param item: Item to convert
+
+    :return: str
+    """
+    if isinstance(item, str):
+        return item
+
+    return '%s' % item
+
+
+# ------------------------------------------------------------------------------
+def _open_output(output):
+    """
+    Private function which returns the functions used to write to (and
+    then close) the given output.
+
+    :param output: A file path, file descriptor, writable file object or
+        callable
+
+    :return: tuple(write, close)
+    """
+    if isinstance(output, int):
+        return functools.partial(_write_fd, output), lambda: None
+
+    if hasattr(output, 'write'):
+        return output.write, lambda: None
+
+    if callable(output):
+        return output, lambda: None
+
+    stream = open(output, 'wb')
+    return stream.write, stream.close
+
+
+# ------------------------------------------------------------------------------
+def _write_fd(fd, data):
+    """
+    Private function which writes all of the given data to a file
+    descriptor, as a single os.write may only write some of it.
+
+    :param fd: The file descriptor to write to
+    :type fd: int
+
+    :param data: The data to write
+    :type data: memoryview
+
+    :return: None
+    """
+    while data:
+        data = data[os.write(fd, data):]
+
+
+# ------------------------------------------------------------------------------
+def _format_command(cmd):
+    """
+    Private function which formats an argument list into a single string
+    with each argument quoted. This is only used for display purposes.
+
+    :param cmd: Argument list to format
+    :type cmd: list(str, str, ...)
+
+    :return: str
+    """
+    return ' '.join(
+        '"%s"' % item if idx else item
+        for idx, item in enumerate(cmd)
+    )
+
+
+# ------------------------------------------------------------------------------
+class ThreadedP4Call(threading.Thread):
+    """
+    All our calls are threaded to allow for timeouts to occur in both
+    Python2 and Python3
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self,
+                 cmd,
+                 form=None,
+                 marshal_result=True,
+                 arg_input=None,
+                 record_queue=None,
+                 on_record=None,
+                 on_error=None,
+                 on_progress=None,
+                 compact=False,
+                 as_table=False,
+                 output=None):
+        super(ThreadedP4Call, self).__init__()
+
+        # -- We never want a stalled p4 call to hold the interpreter open
+        self.daemon = True
+
+        self.cmd = cmd
+        self.form = form
+        self.marshal = marshal_result
+        self.arg_input = arg_input
+        self.record_queue = record_queue
+        self.output = output
+
+        self.on_record = on_record
+        self.on_error = on_error
+        self.on_progress = on_progress
+
+        self.process = None
+        self.record_count = 0
+
+        # -- Set if the call was terminated for exceeding its timeout
+        # -- by something other than the caller
+        self.timed_out = False
+
+        # -- Set to the exception raised if the output of the call could
+        # -- not be read, which is reported separately from a timeout
+        self.error = None
+
+        # -- Large results can optionally be held in a compact or
+        # -- columnar form
+        if as_table and marshal_result:
+            self.results = tables.Table()
+
+        elif compact and marshal_result:
+            self.results = records.CompactResult()
+
+        # -- Results which may exceed the memory budget are collected such
+        # -- that they can be moved to disk, see xpf.spill
+        elif (marshal_result
+                and record_queue is None
+                and variables.get_result_memory_budget()):
+            self.results = spill.Collector(
+                variables.get_result_memory_budget(),
+            )
+
+        else:
+            self.results = list()
+
+        self._terminated = False
+        self._lock = threading.Lock()
+        self._complete_event = threading.Event()
+
+    # --------------------------------------------------------------------------
+    @property
+    def complete(self):
+        """
+        True once the call has finished, whether successfully or not.
+
+        :return: bool
+        """
+        return self._complete_event.is_set()
+
+    # --------------------------------------------------------------------------
+    def wait(self, timeout=None):
+        """
+        Blocks until the call completes or the timeout (in seconds) elapses.
+
+        :param timeout: Maximum time to wait, None will wait indefinitely
+        :type timeout: float
+
+        :return: True if the call completed within the timeout
+        """
+        return self._complete_event.wait(timeout)
+
+    # --------------------------------------------------------------------------
+    def terminate(self):
+        """
+        Terminates the underlying p4 process (and its children) if it is
+        still running. If the process has not been started yet it will be
+        terminated as soon as it is.
+
+        :return: None
+        """
+        with self._lock:
+            self._terminated = True
+            process = self.process
+
+        if process:
+            terminate_process(process)
+
+    # --------------------------------------------------------------------------
+    def run(self):
+        try:
+            self._run()
+
+        except BaseException as error:
+            print(str(sys.exc_info()))
+            self.error = error
+
+        finally:
+            # -- Let anything consuming our records know there are
+            # -- no more to come
+            if self.record_queue is not None:
+                self._put(_END_OF_STREAM)
+
+            self._finish_results()
+
+            # -- By setting this we know we're completely finished.
+            self._complete_event.set()
+
+    # --------------------------------------------------------------------------
+    def _run(self):
+
+        # -- This is pretty much a copy/paste of the p4 example of using
+        # -- -G. We kick off a process, get the process input and output,
+        # -- injecting any form informaiton before reading the output
+        p = self._spawn()
+
+        # -- If we were terminated whilst the process was being started
+        # -- then there is nothing more to do
+        with self._lock:
+            self.process = p
+            terminated = self._terminated
+
+        if terminated:
+            terminate_process(p)
+            return
+
+        try:
+            self._read(p)
+
+        except (IOError, OSError, ValueError):
+            # -- These occur when the pipes are closed beneath us because
+            # -- the call has been terminated
+            if not self._terminated:
+                raise
+
+        finally:
+            for pipe in (p.stdin, p.stdout):
+                try:
+                    pipe.close()
+
+                except (IOError, OSError):
+                    pass
+
+            p.wait()
+            unregister_process(p)
+
+    # --------------------------------------------------------------------------
+    def _spawn(self):
+        """
+        Starts the p4 process and registers it as live.
+
+        :return: subprocess.Popen
+        """
+        p = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            **popen_kwargs()
+        )
+        register_process(p)
+
+        return p
+
+    # --------------------------------------------------------------------------
+    def _read(self, p):
+
+        (pi, po) = (p.stdin, p.stdout)
+
+        if self.form:
+            marshal.dump(self.form, pi, 0)
+            pi.close()
+
+        # -- Argument input is fed through a separate thread, as p4 will
+        # -- be producing output whilst we're still feeding it input
+        if self.arg_input is not None:
+            feeder = threading.Thread(
+                target=self._feed_arg_input,
+                args=(pi,),
+            )
+            feeder.daemon = True
+            feeder.start()
+
+        # -- How we read the output depends a lot on whether we need
+        # -- to marshal or not. If we do, we must conform specific
+        # -- dictionary standards which can differ between python2 and
+        # -- python3 (py2 gives strings, py3 gives bytes)
+        if self.output is not None:
+            self.results = self._write_output(po)
+
+        elif self.marshal:
+            emit = self._emit
+
+            for record in marshalling.iter_records(po):
+                emit(record)
+
+        elif self.record_queue is not None:
+            for line in po:
+                self._emit(line.decode('utf-8'))
+
+        else:
+            self.results = po.read().decode('utf-8')
+
+    # --------------------------------------------------------------------------
+    def _write_output(self, po):
+        """
+        Reads the output of the process in fixed size chunks into a single
+        re-usable buffer, writing each chunk straight to our output. Nothing
+        is decoded and only one chunk is ever held in memory.
+
+        :param po: The stdout pipe of the p4 process
+
+        :return: int, the number of bytes written
+        """
+        buffer_ = bytearray(_OUTPUT_CHUNK_SIZE)
+        view = memoryview(buffer_)
+        written = 0
+
+        write, close = _open_output(self.output)
+
+        try:
+            while True:
+                count = po.readinto(buffer_)
+
+                if not count:
+                    break
+
+                write(view[:count])
+                written += count
+
+        finally:
+            close()
+
+        return written
+
+    # --------------------------------------------------------------------------
+    def _emit(self, record):
+        """
+        Hands a single record back to the caller, either by adding it to
+        our results or by placing it on our record queue if we have one.
+
+        :param record: The record which has been read
+
+        :return: None
+        """
+        self.record_count += 1
+
+        if self.on_record:
+            run_callback(self.on_record, record)
+
+        if self.on_error and self.marshal and record.get('code') == 'error':
+            run_callback(self.on_error, record)
+
+        if self.on_progress:
+            run_callback(self.on_progress, self.record_count)
+
+        if self.record_queue is not None:
+            self._put(record)
+
+        else:
+            self.results.append(record)
+
+    # --------------------------------------------------------------------------
+    def _finish_results(self):
+        """
+        Called once all the records have been read, giving back the records
+        held by a spill.Collector either as a list or, if they exceeded the
+        memory budget, as a spill.SpilledResult.
+
+        :return: None
+        """
+        if isinstance(self.results, spill.Collector):
+            self.results = self.results.finish()
+
+    # --------------------------------------------------------------------------
+    def _put(self, item):
+        """
+        Places an item on our record queue. If the queue is full this will
+        wait until there is space, unless the call is terminated.
+
+        :param item: The item to place on the queue
+
+        :return: None
+        """
+        while not self._terminated:
+            try:
+                self.record_queue.put(item, timeout=0.1)
+                return
+
+            except queue.Full:
+                pass
+
+    # --------------------------------------------------------------------------
+    def _feed_arg_input(self, pi):
+        """
+        Writes each of our input arguments to the given pipe, one per line,
+        closing the pipe once all the arguments have been written.
+
+        :param pi: The stdin pipe of the p4 process
+
+        :return: None
+        """
+        try:
+            for data in self._iter_arg_input():
+                pi.write(data)
+
+        except (IOError, OSError, ValueError):
+            # -- The process has closed (or been terminated) before it
+            # -- read all of our input
+            pass
+
+        finally:
+            try:
+                pi.close()
+
+            except (IOError, OSError):
+                pass
+
+    # --------------------------------------------------------------------------
+    def _iter_arg_input(self):
+        """
+        Yields our input arguments encoded as bytes, one argument per line
+        and batched to reduce the number of writes.
+
+        :return: generator(bytes, ...)
+        """
+        batch = list()
+
+        for item in self.arg_input:
+            if not isinstance(item, bytes):
+                item = item.encode('utf8')
+
+            batch.append(item)
+
+            if len(batch) >= 1000:
+                yield b'\n'.join(batch) + b'\n'
+                batch = list()
+
+        if batch:
+            yield b'\n'.join(batch) + b'\n'
+
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _byte_dict_to_str_dict(dictionary):
+        """
+        This ensures that the dictionary has any keys and values converted
+        from bytes to strings.
+        
+        :param dictionary: 
+        :return: 
+        """
+        return marshalling.decode_record(dictionary)
+
+
+# ------------------------------------------------------------------------------
+class CacheLookup(object):
+    """
+    Answers a call from the memory cache (see xpf.cache) or the metadata
+    cache (see xpf.metadata) where they are enabled, and stores the results
+    of the call once it has been run. This is used by safe_run and by
+    xpf.aio, so calls are answered in the same way whichever is used.
+
+    Note that the metadata cache is held on disk and may ask the server for
+    the latest submitted change, so get and put may block when it is
+    enabled.
+
+    :param args: The arguments given to the call
+    :type args: tuple
+
+    :param kwargs: The keyword arguments given to the call
+    :type kwargs: dict
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, args, kwargs):
+        self.kwargs = kwargs
+        self.flat = None
+
+        # -- The arguments are only flattened if a cache could answer the
+        # -- call, and calls which consume generators can never be cached
+        if ((variables.get_use_cache() or variables.get_use_metadata_cache())
+                and _is_concrete(args)):
+            self.flat = _flatten(args)
+
+        self._cache_key = None
+        self._metadata_key = None
+        self._generation = None
+
+    # --------------------------------------------------------------------------
+    def get(self):
+        """
+        Returns the cached results of the call.
+
+        :return: The results, or xpf.cache.MISS if the call must be run
+        """
+        if not self.flat:
+            return cache.MISS
+
+        if variables.get_use_cache():
+            self._cache_key = cache.make_key(self.flat, self.kwargs)
+
+        if self._cache_key is not None:
+            results = cache.get(self._cache_key)
+
+            if results is not cache.MISS:
+                return results
+
+            self._generation = cache.generation()
+
+        if variables.get_use_metadata_cache():
+            self._metadata_key = metadata.make_key(
+                self.flat,
+                self.kwargs,
+                _run_call,
+            )
+
+        if self._metadata_key is not None:
+            results = metadata.get(self._metadata_key)
+
+            if results is not metadata.MISS:
+                return results
+
+        return cache.MISS
+
+    # --------------------------------------------------------------------------
+    def put(self, results):
+        """
+        Stores the results of the call in the caches get looked in. This
+        must only be given the results of a call which completed.
+
+        :param results: The results of the call
+
+        :return: None
+        """
+        if self._cache_key is not None:
+            cache.put(self._cache_key, results, self._generation)
+
+        if self._metadata_key is not None:
+            metadata.put(self._metadata_key, self.flat, results)
+
+
+# ------------------------------------------------------------------------------
+class _Flight(object):
+    """
+    Private class which tracks a shared call along with the number of
+    callers waiting on it.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, thread):
+        self.thread = thread
+        self.waiters = 0
+        self.callers = 0
+        self.failed = False
+
+
+# ------------------------------------------------------------------------------
+class ReactorP4Call(ThreadedP4Call):
+    """
+    A call which rather than running on its own thread hands its process to
+    the shared xpf.reactor, which reads its output (and feeds it input) from
+    a single thread along with every other reactor call. The reactor also
+    terminates the call once its timeout has passed.
+
+    This exposes the same interface as ThreadedP4Call, so callers start the
+    call and then wait on it in exactly the same way.
+
+    :param timeout: The number of seconds after which the reactor terminates
+        the call, None will allow it to run indefinitely
+    :type timeout: float
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, cmd, timeout=None, **kwargs):
+        super(ReactorP4Call, self).__init__(cmd, **kwargs)
+
+        self.timeout = timeout
+
+        self._decoder = marshalling.StreamDecoder()
+        self._chunks = list()
+        self._input = None
+
+    # --------------------------------------------------------------------------
+    def start(self):
+        """
+        Starts the p4 process and hands it to the reactor. Unlike a
+        ThreadedP4Call no thread is started.
+
+        :return: None
+        """
+        if self.form:
+            self._input = iter([marshal.dumps(self.form, 0)])
+
+        elif self.arg_input is not None:
+            self._input = self._iter_arg_input()
+
+        with self._lock:
+            if self._terminated:
+                self._complete_event.set()
+                return
+
+            self.process = self._spawn()
+
+        reactor.get_reactor().add(self)
+
+    # --------------------------------------------------------------------------
+    def next_input(self):
+        """
+        Called by the reactor to get the next bytes to write to the stdin of
+        the process.
+
+        :return: bytes
+        """
+        if self._input is None:
+            return b''
+
+        return next(self._input, b'')
+
+    # --------------------------------------------------------------------------
+    def feed(self, data):
+        """
+        Called by the reactor with each chunk of output read from the
+        process.
+
+        :param data: The output which has been read
+        :type data: bytes
+
+        :return: None
+        """
+        if not self.marshal:
+            self._chunks.append(data)
+            return
+
+        for record in self._decoder.feed(data):
+            self._emit(record)
+
+    # --------------------------------------------------------------------------
+    def expire(self):
+        """
+        Called by the reactor if the call is still running once its timeout
+        has passed. The process is killed, but not waited on, as the reactor
+        will reap it once its output closes.
+
+        :return: None
+        """
+        self.timed_out = True
+        self._terminated = True
+
+        kill_process_tree(self.process.pid)
+
+    # --------------------------------------------------------------------------
+    def fail(self, error):
+        """
+        Called by the reactor if the output of the call could not be handled.
+        As with expire the process is killed, but the call is reported as
+        having failed rather than as having timed out.
+
+        :param error: The exception which was raised
+        :type error: BaseException
+
+        :return: None
+        """
+        self.error = error
+        self._terminated = True
+
+        if self.process is not None:
+            kill_process_tree(self.process.pid)
+
+    # --------------------------------------------------------------------------
+    def close(self):
+        """
+        Called by the reactor once the output of the process has closed and
+        the process has exited.
+
+        :return: None
+        """
+        try:
+            if not self.marshal:
+                self.results = b''.join(self._chunks).decode('utf-8')
+
+            elif not self._terminated:
+                for record in self._decoder.close():
+                    self._emit(record)
+
+        except BaseException as error:
+            print(str(sys.exc_info()))
+            self.error = error
 
-        converted_output = dict()
+        finally:
+            self._finish_results()
 
-        # -- Cycle our items and convert any bytes to strings
-        for k, v in dictionary.items():
-            k = k.decode('utf8') if isinstance(k, bytes) else k
-            v = v.decode('utf8') if isinstance(v, bytes) else v
+            unregister_process(self.process)
+            self._complete_event.set()
 
-            # -- Update our dictionary data
-            converted_output[k] = v
+# -- Ensure we never leave orphaned p4 processes behind
+atexit.register(terminate_all)
 
-        return converted_output
+# -- Ensure cached results are invalidated by our own writes
+add_write_hook(cache.on_write)
@@ -0,0 +1,636 @@
+"""
+This module holds a persistent, content addressed cache of file content on
+disk. A submitted revision of a file never changes, so once a revision has
+been printed it can be served locally from then on, across processes and
+sessions.
+
+The content is written by p4 straight to disk (using print -o) and is never
+decoded, so binary files are handled just as well as text files. You can
+either read the content as bytes or be given the path to the cached file:
+
+```python
+import xpf
+
+# -- Read a specific revision
+data = xpf.content.fetch('//depot/textures/wood.png#4')
+
+# -- Get a local path holding the content of the head revision
+path = xpf.content.fetch_path('//depot/textures/wood.png')
+```
+
+Each file is stored once, named by the sha1 digest of its content, and each
+revision (keyed by the server, depot path and revision number) refers to
+that file. When a file spec does not name an explicit revision number the
+revision it currently refers to is first resolved with fstat.
+
+The cache lives in xpf.variables.get_content_cache_dir() and is kept within
+xpf.variables.get_content_cache_max_bytes(), evicting the least recently
+used files first. The size of the cache is counted once and then tracked as
+content is stored, so the cache is only scanned again once it may have grown
+beyond its limit. All writes are made to a temporary file which is then
+renamed into place, so concurrent processes never see partial files. A
+print which fails, times out or (for binary files) does not match the size
+and digest the server reports is discarded rather than stored. The size and
+digest are those reported by the fstat which resolved the revision, or by
+the print itself, so no further call is made to check them.
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from . import direct
+from . import failsafe
+from . import variables
+from . import connection
+
+
+# -- Matches a file spec with an explicit revision number, such as
+# -- //depot/file.txt#4
+_REVISION_SPEC = re.compile(r'^(?P<path>[^#@]+)#(?P<rev>[0-9]+)\Z')
+
+# -- The head actions which mean a revision has no content
+_DELETED_ACTIONS = (
+    'delete',
+    'move/delete',
+    'purge',
+    'archive',
+)
+
+# -- The number of bytes read at a time when hashing content
+_CHUNK_SIZE = 1024 * 1024
+
+# -- The size of the content held in each cache directory, as far as this
+# -- process knows it. Other processes may also store content, so this is
+# -- counted again whenever we evict
+_SIZES = dict()
+_SIZES_LOCK = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_none
+def fetch(spec, **kwargs):
+    """
+    Returns the content of the given file revision as bytes, serving it from
+    the cache where possible.
+
+    :param spec: The file to get the content of, optionally with a revision
+        (such as //depot/file.txt#3 or //depot/file.txt@1234)
+    :type spec: str
+
+    :param kwargs: Any special keyword arguments (such as timeout, port or
+        client) to pass to the p4 calls
+
+    :return: bytes or None if the revision has no content
+    """
+    path = fetch_path(spec, **kwargs)
+
+    if not path:
+        return None
+
+    with open(path, 'rb') as stream:
+        return stream.read()
+
+
+# ------------------------------------------------------------------------------
+@failsafe.return_none
+def fetch_path(spec, **kwargs):
+    """
+    Returns the path of a local file holding the content of the given file
+    revision, printing it into the cache if it is not already there. The
+    returned file is owned by the cache and must not be altered.
+
+    :param spec: The file to get the content of, optionally with a revision
+        (such as //depot/file.txt#3 or //depot/file.txt@1234)
+    :type spec: str
+
+    :param kwargs: Any special keyword arguments (such as timeout, port or
+        client) to pass to the p4 calls
+
+    :return: str or None if the revision has no content
+    """
+    spec, expected = _resolve(spec, **kwargs)
+
+    if not spec:
+        return None
+
+    ref_path = _ref_path(spec, kwargs.get('port', variables.get_port()))
+    object_path = _read_ref(ref_path)
+
+    if object_path and os.path.exists(object_path):
+        _touch(object_path)
+        return object_path
+
+    object_path = _print_to_cache(spec, expected, **kwargs)
+
+    if not object_path:
+        return None
+
+    _write_atomically(ref_path, os.path.basename(object_path).encode('utf8'))
+
+    # -- We only scan the cache when it may have grown beyond its limit
+    if _tracked_size() > variables.get_content_cache_max_bytes():
+        evict(keep=object_path)
+
+    return object_path
+
+
+# ------------------------------------------------------------------------------
+def evict(max_bytes=None, keep=None):
+    """
+    Removes the least recently used content until the cache is within the
+    given size.
+
+    :param max_bytes: The size to reduce the cache to. If not given then
+        xpf.variables.get_content_cache_max_bytes() is used
+    :type max_bytes: int
+
+    :param keep: The path of content which must not be removed, typically
+        the content which has just been stored
+    :type keep: str
+
+    :return: None
+    """
+    if max_bytes is None:
+        max_bytes = variables.get_content_cache_max_bytes()
+
+    objects = list()
+    total = 0
+
+    for object_path in _iter_objects():
+        try:
+            stat = os.stat(object_path)
+
+        except OSError:
+            continue
+
+        objects.append((stat.st_mtime, stat.st_size, object_path))
+        total += stat.st_size
+
+    if total > max_bytes:
+
+        # -- Remove the oldest first. Any references to removed content are
+        # -- simply treated as misses when next read
+        for _, size, object_path in sorted(objects):
+            if object_path == keep:
+                continue
+
+            try:
+                # -- p4 writes files read only, which Windows will not remove
+                os.chmod(object_path, 0o600)
+                os.remove(object_path)
+
+            except OSError:
+                continue
+
+            total -= size
+
+            if total <= max_bytes:
+                break
+
+    with _SIZES_LOCK:
+        _SIZES[variables.get_content_cache_dir()] = total
+
+
+# ------------------------------------------------------------------------------
+def size():
+    """
+    Returns the total size (in bytes) of the content held in the cache.
+
+    :return: int
+    """
+    total = 0
+
+    for object_path in _iter_objects():
+        try:
+            total += os.path.getsize(object_path)
+
+        except OSError:
+            pass
+
+    return total
+
+
+# ------------------------------------------------------------------------------
+def clear():
+    """
+    Removes everything from the cache.
+
+    :return: None
+    """
+    shutil.rmtree(variables.get_content_cache_dir(), ignore_errors=True)
+
+    with _SIZES_LOCK:
+        _SIZES.pop(variables.get_content_cache_dir(), None)
+
+
+# ------------------------------------------------------------------------------
+def _resolve(spec, **kwargs):
+    """
+    Private function which resolves a file spec to a depot path with an
+    explicit revision number. Specs which already hold a revision number are
+    returned as they are, anything else is resolved with fstat.
+
+    :param spec: The file spec to resolve
+    :type spec: str
+
+    :return: tuple(str, dict) of the resolved spec along with the fstat
+        record it was resolved from (holding its type, size and digest), or
+        None for specs which already held a revision number. The spec is
+        None if it does not refer to a revision with content.
+    """
+    if _REVISION_SPEC.match(spec):
+        return spec, None
+
+    kwargs.pop('marshal', None)
+
+    # -- The size and digest are asked for here so the printed content
+    # -- can be checked without another call
+    records = direct.fstat(
+        '-Ol',
+        '-T',
+        'depotFile,headRev,headAction,headType,fileSize,digest',
+        spec,
+        **kwargs
+    )
+
+    records = [record for record in records or [] if 'headRev' in record]
+
+    if len(records) != 1:
+        return None, None
+
+    if records[0].get('headAction') in _DELETED_ACTIONS:
+        return None, None
+
+    return '%s#%s' % (records[0]['depotFile'], records[0]['headRev']), records[0]
+
+
+# ------------------------------------------------------------------------------
+def _print_to_cache(spec, expected=None, **kwargs):
+    """
+    Private function which prints the given revision into the cache,
+    returning the path of the stored content.
+
+    :param spec: The file spec with an explicit revision
+    :type spec: str
+
+    :param expected: Optionally the fstat record of the revision, holding
+        the headType, fileSize and digest the content is checked against
+    :type expected: dict
+
+    :return: str or None if nothing was printed
+    """
+    temp_dir = _directory('temp')
+    handle, temp_path = tempfile.mkstemp(dir=temp_dir)
+    os.close(handle)
+
+    # -- We only want a unique name, p4 creates the file itself
+    os.remove(temp_path)
+
+    try:
+        kwargs.pop('marshal', None)
+
+        # -- We call through the connection directly, as the failsafe
+        # -- would give us an empty list if the call failed. The print is
+        # -- not quiet, so it reports the type and size of the revision
+        results = connection.safe_run(
+            'print',
+            '-o',
+            temp_path,
+            spec,
+            **kwargs
+        )
+
+        # -- A print which timed out, was killed or reported an error may
+        # -- have left a partial file behind, which must never be stored
+        if results is None or not os.path.exists(temp_path):
+            return None
+
+        for record in results:
+            if not isinstance(record, dict) or record.get('code') == 'error':
+                return None
+
+        # -- Anything the fstat did not give us is taken from the print
+        expected = dict(expected or {})
+
+        for record in results:
+            if 'type' in record:
+                expected.setdefault('headType', record['type'])
+
+            if 'fileSize' in record:
+                expected.setdefault('fileSize', record['fileSize'])
+
+        digest, md5_digest = _hash_file(temp_path)
+
+        if not _verify(temp_path, md5_digest, expected):
+            return None
+
+        object_path = os.path.join(_directory('objects', digest[:2]), digest)
+
+        if os.path.exists(object_path):
+            _touch(object_path)
+
+        else:
+            _replace(temp_path, object_path)
+            _add_size(os.path.getsize(object_path))
+
+        return object_path
+
+    finally:
+        if os.path.exists(temp_path):
+            try:
+                os.chmod(temp_path, 0o600)
+                os.remove(temp_path)
+
+            except OSError:
+                pass
+
+
+# ------------------------------------------------------------------------------
+def _verify(path, md5_digest, expected):
+    """
+    Private function which checks the printed content of a revision against
+    the size and digest the server reported for it. Text revisions may have
+    had their line endings translated or keywords expanded when printed, so
+    those are not checked.
+
+    :param path: The file the revision was printed to
+    :type path: str
+
+    :param md5_digest: The md5 digest of the printed file
+    :type md5_digest: str
+
+    :param expected: The headType, fileSize and digest reported for the
+        revision, any of which may be missing
+    :type expected: dict
+
+    :return: bool
+    """
+    if not expected.get('headType', '').split('+')[0].endswith('binary'):
+        return True
+
+    if 'fileSize' in expected:
+        if int(expected['fileSize']) != os.path.getsize(path):
+            return False
+
+    if 'digest' in expected:
+        if expected['digest'].lower() != md5_digest:
+            return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def _ref_path(spec, port):
+    """
+    Private function which returns the path of the reference file for the
+    given revision on the given server.
+
+    :param spec: The file spec with an explicit revision
+    :type spec: str
+
+    :param port: The server the revision is held on
+    :type port: str
+
+    :return: str
+    """
+    key = hashlib.sha1(
+        ('%s|%s' % (port or '', spec)).encode('utf8'),
+    ).hexdigest()
+
+    return os.path.join(variables.get_content_cache_dir(), 'refs', key[:2], key)
+
+
+# ------------------------------------------------------------------------------
+def _read_ref(ref_path):
+    """
+    Private function which returns the path of the content the given
+    reference refers to, or None if the reference does not exist.
+
+    :param ref_path: The path of the reference file
+    :type ref_path: str
+
+    :return: str or None
+    """
+    try:
+        with open(ref_path, 'rb') as stream:
+            digest = stream.read().decode('utf8').strip()
+
+    except (IOError, OSError):
+        return None
+
+    if not digest:
+        return None
+
+    return os.path.join(
+        variables.get_content_cache_dir(),
+        'objects',
+        digest[:2],
+        digest,
+    )
+
+
+# ------------------------------------------------------------------------------
+def _write_atomically(path, data):
+    """
+    Private function which writes the given data to the given path, such
+    that readers only ever see the complete file.
+
+    :param path: The path to write to
+    :type path: str
+
+    :param data: The data to write
+    :type data: bytes
+
+    :return: None
+    """
+    directory = os.path.dirname(path)
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+
+        except OSError:
+            pass
+
+    handle, temp_path = tempfile.mkstemp(dir=_directory('temp'))
+
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            stream.write(data)
+
+        _replace(temp_path, path)
+
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# ------------------------------------------------------------------------------
+def _replace(source, destination):
+    """
+    Private function which renames the source file over the destination.
+    Under Python 2 on Windows a rename cannot replace an existing file, in
+    which case the existing file is removed first.
+
+    :param source: The file to rename
+    :type source: str
+
+    :param destination: The path to rename it to
+    :type destination: str
+
+    :return: None
+    """
+    directory = os.path.dirname(destination)
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+
+        except OSError:
+            pass
+
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+        return
+
+    try:
+        os.rename(source, destination)
+
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+
+        os.rename(source, destination)
+
+
+# ------------------------------------------------------------------------------
+def _directory(*names):
+    """
+    Private function which returns the path of a directory within the cache,
+    creating it if it does not exist.
+
+    :return: str
+    """
+    directory = os.path.join(variables.get_content_cache_dir(), *names)
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+
+        except OSError:
+            # -- Another process may have created it at the same time
+            if not os.path.isdir(directory):
+                raise
+
+    return directory
+
+
+# ------------------------------------------------------------------------------
+def _iter_objects():
+    """
+    Private generator which yields the path of every piece of content held
+    in the cache.
+
+    :return: generator(str, ...)
+    """
+    root = os.path.join(variables.get_content_cache_dir(), 'objects')
+
+    if not os.path.isdir(root):
+        return
+
+    for prefix in os.listdir(root):
+        directory = os.path.join(root, prefix)
+
+        if not os.path.isdir(directory):
+            continue
+
+        for name in os.listdir(directory):
+            yield os.path.join(directory, name)
+
+
+# ------------------------------------------------------------------------------
+def _tracked_size():
+    """
+    Private function which returns the size of the content held in the
+    cache, only scanning the cache the first time it is asked for.
+
+    :return: int
+    """
+    cache_dir = variables.get_content_cache_dir()
+
+    with _SIZES_LOCK:
+        if cache_dir in _SIZES:
+            return _SIZES[cache_dir]
+
+    total = size()
+
+    with _SIZES_LOCK:
+        return _SIZES.setdefault(cache_dir, total)
+
+
+# ------------------------------------------------------------------------------
+def _add_size(count):
+    """
+    Private function which adds newly stored content to the tracked size of
+    the cache. If the cache has not been counted yet there is nothing to do,
+    as the content will be included once it is.
+
+    :param count: The number of bytes stored
+    :type count: int
+
+    :return: None
+    """
+    cache_dir = variables.get_content_cache_dir()
+
+    with _SIZES_LOCK:
+        if cache_dir in _SIZES:
+            _SIZES[cache_dir] += count
+
+
+# ------------------------------------------------------------------------------
+def _hash_file(path):
+    """
+    Private function which returns the sha1 digest of the given file, which
+    it is stored by, along with its md5 digest, which p4 reports.
+
+    :param path: The file to hash
+    :type path: str
+
+    :return: tuple(str, str)
+    """
+    digest = hashlib.sha1()
+    md5_digest = hashlib.md5()
+
+    with open(path, 'rb') as stream:
+        while True:
+            chunk = stream.read(_CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            digest.update(chunk)
+            md5_digest.update(chunk)
+
+    return digest.hexdigest(), md5_digest.hexdigest()
+
+
+# ------------------------------------------------------------------------------
+def _touch(path):
+    """
+    Private function which marks the given content as recently used.
+
+    :param path: The content to mark
+    :type path: str
+
+    :return: None
+    """
+    try:
+        now = time.time()
+        os.utime(path, (now, now))
+
+    except OSError:
+        pass
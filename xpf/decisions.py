@@ -0,0 +1,403 @@
+"""
+This module holds the decisions made by the assist functions - which
+arguments to query with and what the records which come back mean - free
+of how the calls themselves are made. Both xpf.assist and xpf.aio.assist
+make their decisions through these functions, differing only in whether
+they run their calls directly or await them, so they always give the
+same answers.
+
+```python
+import xpf
+
+records = xpf.direct.fstat(*xpf.decisions.classify_arguments(files))
+operations = xpf.decisions.classify_files(files, records)
+
+operations['add']   # -- Files which need adding
+operations['edit']  # -- Files which need editing
+```
+"""
+import os
+
+from . import query
+from . import variables
+
+
+# -- Head actions which mean a file no longer exists at the head revision
+# -- and therefore needs to be added rather than edited
+DELETED_ACTIONS = (
+    'delete',
+    'move/delete',
+    'purge',
+    'archive',
+)
+
+
+# ------------------------------------------------------------------------------
+def normalise_path(filepath):
+    """
+    Normalises a local filepath so that it can be compared against paths
+    returned by perforce.
+
+    :param filepath: Local filepath to normalise
+    :type filepath: str
+
+    :return: str
+    """
+    return os.path.normcase(os.path.abspath(filepath))
+
+
+# ------------------------------------------------------------------------------
+def record_values(record, key):
+    """
+    Returns the list of values stored against the given key of a record.
+    Marshalled records store lists as numbered keys (depotFile0, depotFile1
+    etc), though this will also accept records where the key holds a list.
+
+    :param record: The record to read from
+    :type record: dict
+
+    :param key: The key to read, without any numeric suffix
+    :type key: str
+
+    :return: list
+    """
+    if key in record:
+        values = record[key]
+        return values if isinstance(values, list) else [values]
+
+    values = list()
+    while '%s%s' % (key, len(values)) in record:
+        values.append(record['%s%s' % (key, len(values))])
+
+    return values
+
+
+# ------------------------------------------------------------------------------
+def sync_arguments(files=None, description=None, force=False, revision=None):
+    """
+    Returns the arguments to sync the given files with.
+
+    :param files: Optional list of files to sync, or a single filepath
+    :type files: list(str, str, ...) or str
+
+    :param description: Optionally the describe record of a change, whose
+        files are synced along with the given files
+    :type description: dict
+
+    :param force: If true a force sync will occur
+    :type force: bool
+
+    :param revision: If given, the file(s) will be synced to this revision
+    :type revision: int
+
+    :return: list
+    """
+    if not files:
+        files = list()
+
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+
+    files = list(files)
+
+    if description:
+        files.extend(record_values(description, 'depotFile'))
+
+    if revision:
+        files = ['%s#%s' % (filepath, revision) for filepath in files]
+
+    if force:
+        return ['-f', files]
+
+    return [files]
+
+
+# ------------------------------------------------------------------------------
+def is_synced(results):
+    """
+    Returns True if the results of a sync report no errors other than files
+    already being up to date.
+
+    :param results: The results of the sync
+    :type results: list(dict, ...)
+
+    :return: bool
+    """
+    for result in results:
+        if result.get('code') == 'error' and 'up-to-date' not in result['data']:
+            return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def is_had(results):
+    """
+    Returns True if the results of a have call show every file is had.
+
+    :param results: The results of the have call
+    :type results: list(dict, ...)
+
+    :return: bool
+    """
+    if not results:
+        return False
+
+    for result in results:
+        if 'not on client' in str(result):
+            return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def editable_query(files):
+    """
+    Returns the query which tells whether each of the given files is
+    editable, only asking for the fields we need.
+
+    :param files: The files to check
+    :type files: list(str, str, ...)
+
+    :return: xpf.query.Query
+    """
+    return query.fstat(files).fields('depotFile', 'action')
+
+
+# ------------------------------------------------------------------------------
+def is_editable(records):
+    """
+    Returns True if the fstat records of files all show they are opened.
+
+    :param records: The fstat records from the editable_query
+    :type records: list(dict, ...)
+
+    :return: bool
+    """
+    for record in records:
+        if 'action' not in record:
+            return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def opened_change(records):
+    """
+    Returns the change a file is opened in from the results of an opened
+    call of that file.
+
+    :param records: The results of the opened call
+    :type records: list(dict, ...)
+
+    :return: str
+    """
+    return records[0]['change']
+
+
+# ------------------------------------------------------------------------------
+def workspace_query():
+    """
+    Returns the query of the workspaces usable by the current user and
+    host. The server filters by owner, whilst the host is checked locally
+    as clients cannot be filtered by host.
+
+    :return: xpf.query.Query
+    """
+    return query.clients().where(
+        'Owner',
+        variables.get_user(),
+    ).where(
+        'Host',
+        variables.get_host(),
+    ).fields(
+        'client',
+    )
+
+
+# ------------------------------------------------------------------------------
+def workspace_names(records):
+    """
+    Returns the workspace names from the records of the workspace_query.
+
+    :param records: The records of the workspace_query
+    :type records: list(dict, ...)
+
+    :return: list(str, str, ...)
+    """
+    return [
+        workspace['client']
+        for workspace in records
+    ]
+
+
+# ------------------------------------------------------------------------------
+def pending_changes_arguments():
+    """
+    Returns the arguments to list the current user's pending changes in the
+    current client, along with their full descriptions.
+
+    :return: list
+    """
+    return [
+        '-s',
+        'pending',
+        '-l',
+        '-u',
+        variables.get_user(),
+        '-c',
+        variables.get_client(),
+    ]
+
+
+# ------------------------------------------------------------------------------
+def find_change(changes, description):
+    """
+    Returns the change whose description matches the given description
+    (ignoring case and surrounding whitespace).
+
+    :param changes: The results of the pending_changes_arguments query
+    :type changes: list(dict, ...)
+
+    :param description: The description to look for
+    :type description: str
+
+    :return: int or None if no change matches
+    """
+    for change in changes or []:
+        if 'desc' in change:
+            if description.lower().strip() == change['desc'].lower().strip():
+                return int(change['change'])
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+def new_change_form(description):
+    """
+    Returns the form which creates a new change with the given description.
+
+    :param description: The description of the change
+    :type description: str
+
+    :return: dict
+    """
+    return {
+        'Change': 'new',
+        'Status': 'new',
+        'Description': str(description),
+    }
+
+
+# ------------------------------------------------------------------------------
+def created_change(results):
+    """
+    Returns the change created by a changelist call given the new_change_form.
+
+    :param results: The results of the changelist call
+    :type results: list(dict, ...)
+
+    :return: int or None if no change was created
+    """
+    if results:
+        return int(results[0]['data'].split()[1])
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+def classify_arguments(files):
+    """
+    Returns the fstat arguments which tell whether each of the given files
+    needs adding or editing, only asking for the fields we need.
+
+    :param files: The files to classify
+    :type files: list(str, str, ...)
+
+    :return: list
+    """
+    return ['-T', 'clientFile,headAction', files]
+
+
+# ------------------------------------------------------------------------------
+def classify_files(files, records):
+    """
+    Splits the given files into those which need adding and those which need
+    editing. Files which exist at the head revision are edited, whilst files
+    which have never been submitted (or are deleted at head) are added.
+
+    :param files: The local paths of the files
+    :type files: list(str, str, ...)
+
+    :param records: The fstat records given for the classify_arguments
+    :type records: list(dict, ...)
+
+    :return: dict(add=list, edit=list)
+    """
+    head_actions = dict()
+
+    for record in records:
+        if record.get('code', 'stat') != 'stat' or 'clientFile' not in record:
+            continue
+
+        head_actions[normalise_path(record['clientFile'])] = record.get('headAction')
+
+    operations = dict(
+        add=[],
+        edit=[],
+    )
+
+    for file_path in files:
+        head_action = head_actions.get(normalise_path(file_path))
+
+        if head_action and head_action not in DELETED_ACTIONS:
+            operations['edit'].append(file_path)
+
+        else:
+            operations['add'].append(file_path)
+
+    return operations
+
+
+# ------------------------------------------------------------------------------
+def change_local_files(description, view):
+    """
+    Returns the local paths of the files within a change, resolved through
+    the client view.
+
+    :param description: The describe record of the change
+    :type description: dict
+
+    :param view: The client view, or None if it is not known
+    :type view: xpf.views.ClientView
+
+    :return: list(tuple(str, str), ...) of the depot path of each file
+        along with its local path, or None where the view cannot map it
+    """
+    return [
+        (depot_file, view.depot_to_local(depot_file) if view else None)
+        for depot_file in record_values(description, 'depotFile')
+    ]
+
+
+# ------------------------------------------------------------------------------
+def all_in_change(local_files, files):
+    """
+    Returns True if every file within a change is one of the given files,
+    meaning the change can be submitted as it is.
+
+    :param local_files: The local paths of the files within the change
+    :type local_files: list(str, ...)
+
+    :param files: The files being submitted
+    :type files: list(str, ...)
+
+    :return: bool
+    """
+    normalised_files = set(normalise_path(filepath) for filepath in files)
+
+    for local_file in local_files:
+        if normalise_path(local_file) not in normalised_files:
+            return False
+
+    return True
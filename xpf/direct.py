@@ -35,6 +35,31 @@ You can pass the following special keywords to any of these calls:
         If you're working in a multi-workspace environment its advisable to 
         utilise p4config as that mechanism allows this to be automatically
         resolved within perforce.
+
+    :on_record: A callable which is given each record as soon as it is read,
+        allowing progress to be reported (or work started) whilst long
+        running commands are still executing.
+
+    :on_error: A callable which is given each record which has an error code
+        as soon as it is read.
+
+    :on_progress: A callable which is given the number of records read so
+        far each time a record is read.
+
+    :compact: If True the records are returned as an xpf.records.CompactResult
+        which shares field names, directories and integer values between
+        records. This uses considerably less memory for large results whilst
+        still allowing each record to be read like a dictionary.
+
+    :as_table: If True the records are returned as an xpf.tables.Table, which
+        holds each field as a column. Numeric fields (such as fileSize or
+        headTime) are held as typed arrays (or NumPy arrays when available)
+        allowing for fast aggregation over large results.
+
+    :stream: If True a generator is returned which yields each record as
+        soon as perforce emits it, rather than a list of all the records
+        once the call completes. In this mode the timeout applies to how long
+        we wait for each record. The same can be achieved by calling iter_run.
         
 """
 from . import failsafe
@@ -44,9 +69,18 @@ from . import connection
 # ------------------------------------------------------------------------------
 @failsafe.return_list
 def run(*args, **kwargs):
+    if kwargs.pop('stream', False):
+        return iter_run(*args, **kwargs)
+
     return connection.safe_run(*args, **kwargs)
 
 
+# ------------------------------------------------------------------------------
+@failsafe.return_iter
+def iter_run(*args, **kwargs):
+    return connection.iter_run(*args, **kwargs)
+
+
 # ------------------------------------------------------------------------------
 @failsafe.return_list
 def add(*args, **kwargs):
@@ -101,3 +101,39 @@ def return_string(func):
             return ''
 
     return wrapper
+
+
+# ------------------------------------------------------------------------------
+def return_iter(func):
+    def wrapper(*args, **kwargs):
+        if not connection.is_accessible():
+            return iter([])
+
+        return _failsafe_iter(func, args, kwargs)
+
+    return wrapper
+
+
+# ------------------------------------------------------------------------------
+def _failsafe_iter(func, args, kwargs):
+    """
+    Private generator which yields from the generator returned by the given
+    function, ending the iteration (rather than raising) if an error occurs.
+    """
+    iterator = None
+
+    try:
+        iterator = func(*args, **kwargs)
+
+        for item in iterator:
+            yield item
+
+    except GeneratorExit:
+        raise
+
+    except BaseException:
+        print(str(sys.exc_info()))
+
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()
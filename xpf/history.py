@@ -0,0 +1,448 @@
+"""
+This module allows long histories (changes, file revisions and jobs) to be
+walked a page at a time rather than fetched all at once. Each page is asked
+for using a cursor taken from the end of the previous page, so only a page
+or two is ever held in memory and the first records are available as soon
+as the first page returns.
+
+Whilst the records of one page are being processed the next page is
+fetched in the background. Iteration can be stopped at any point, either by
+breaking out of the loop or by giving a limit:
+
+```python
+import xpf
+
+for change in xpf.history.iter_changes('-s', 'submitted', '//depot/...'):
+    if int(change['time']) < cutoff:
+        break
+
+for revision in xpf.history.iter_filelog('//depot/file.txt', limit=50):
+    print(revision['rev'], revision['desc'])
+
+for job in xpf.history.iter_jobs('-e', 'Status=open', page_size=100):
+    print(job['Job'])
+```
+
+Every function accepts the following keyword arguments, with any others
+(such as timeout, port or client) given to each p4 call:
+
+    :page_size: The number of records to ask for in each call
+    :limit: The maximum number of records to yield in total
+    :prefetch: If False the next page is only fetched once the current
+        page has been consumed
+
+Arguments which cannot be paged raise a ValueError straight away. If the
+server is not accessible nothing is yielded, but if a page fails to be
+fetched part way through a RuntimeError is raised rather than the history
+silently appearing to end.
+"""
+import re
+import threading
+
+from . import query
+from . import commands
+from . import connection
+
+
+# -- The number of records asked for in each page if not specified
+PAGE_SIZE = 500
+
+# -- Flags which we control ourselves, or which change the order records
+# -- are returned in, and so cannot be given
+_RESERVED_FLAGS = frozenset(['-m', '-r'])
+
+# -- Matches the numbered fields of a filelog record, such as rev3 or
+# -- how3,0 (the first integration of the fourth revision)
+_REVISION_FIELD = re.compile(
+    r'^(?P<name>[^0-9,]+)(?P<index>[0-9]+)(?:,(?P<sub_index>[0-9]+))?\Z',
+)
+
+
+# ------------------------------------------------------------------------------
+def iter_changes(*args, **kwargs):
+    """
+    Yields changes, newest first, a page at a time. Any flags (such as -s
+    submitted or -u user) and paths are given as they would be to
+    xpf.direct.changes, though paths may not hold revisions as the
+    pages are asked for using a revision (@change) of each path.
+
+    :return: generator(dict, ...)
+    """
+    page_size, limit, prefetch = _paging_options(kwargs)
+    _, flags, paths = _split('changes', args)
+
+    if any('#' in path or '@' in path for path in paths):
+        raise ValueError('Paths given to iter_changes cannot hold revisions')
+
+    # --------------------------------------------------------------------------
+    def fetch(cursor, size):
+        page_paths = paths
+
+        # -- Each page starts from the change before the last one we saw
+        if cursor is not None:
+            page_paths = [
+                '%s@%s' % (path, cursor)
+                for path in paths or ['//...']
+            ]
+
+        records = _fetch('changes', flags + ['-m', size] + page_paths, kwargs)
+        records = [record for record in records if 'change' in record]
+
+        next_cursor = None
+
+        if len(records) >= size:
+            next_cursor = int(records[-1]['change']) - 1
+
+        return records, next_cursor if next_cursor else None
+
+    return _iter_pages(fetch, page_size, limit, prefetch)
+
+
+# ------------------------------------------------------------------------------
+def iter_filelog(*args, **kwargs):
+    """
+    Yields the revisions of a single file, newest first, a page at a time.
+    Any flags (such as -l or -h) are given as they would be to
+    xpf.direct.filelog. The file may hold a revision (such as #10 or @1234)
+    to start from.
+
+    Rather than yielding filelog records (which hold every revision as
+    numbered fields) this yields a dictionary per revision, holding the
+    depotFile along with fields such as rev, change, action and desc.
+    Integration fields (how, file, srev and erev) are given as lists.
+
+    :return: generator(dict, ...)
+    """
+    page_size, limit, prefetch = _paging_options(kwargs)
+    _, flags, paths = _split('filelog', args)
+
+    if len(paths) != 1:
+        raise ValueError('iter_filelog requires a single file')
+
+    path = paths[0]
+
+    if any(wildcard in path for wildcard in ('...', '*', '%%')):
+        raise ValueError('iter_filelog requires a single file : %s' % path)
+
+    # --------------------------------------------------------------------------
+    def fetch(cursor, size):
+        spec = path
+
+        # -- Each page starts from the revision before the last one we saw
+        if cursor is not None:
+            spec = '%s#%s' % cursor
+
+        records = _fetch('filelog', flags + ['-m', size, spec], kwargs)
+        records = [record for record in records if 'depotFile' in record]
+
+        if not records:
+            return [], None
+
+        # -- Any further records are of other files, such as those
+        # -- followed by -i
+        revisions = _split_revisions(records[0])
+        next_cursor = None
+
+        if len(revisions) >= size:
+            last_revision = int(revisions[-1]['rev'])
+
+            if last_revision > 1:
+                next_cursor = (records[0]['depotFile'], last_revision - 1)
+
+        return revisions, next_cursor
+
+    return _iter_pages(fetch, page_size, limit, prefetch)
+
+
+# ------------------------------------------------------------------------------
+def iter_jobs(*args, **kwargs):
+    """
+    Yields jobs, in order of their name, a page at a time. Any flags (such
+    as -e to filter the jobs or -l) and paths are given as they would be to
+    xpf.direct.jobs.
+
+    :return: generator(dict, ...)
+    """
+    page_size, limit, prefetch = _paging_options(kwargs)
+    _, flags, paths = _split('jobs', args)
+
+    # -- Our own filter is combined with any filter given
+    user_filter = None
+
+    if '-e' in flags:
+        idx = flags.index('-e')
+        user_filter = flags[idx + 1]
+        flags = flags[:idx] + flags[idx + 2:]
+
+    # --------------------------------------------------------------------------
+    def fetch(cursor, size):
+        expressions = list()
+
+        if user_filter:
+            expressions.append('(%s)' % user_filter)
+
+        # -- Each page starts from the job after the last one we saw
+        if cursor is not None:
+            expressions.append(query.expression('Job', cursor, '>'))
+
+        page_flags = list(flags)
+
+        if expressions:
+            page_flags.extend(['-e', ' & '.join(expressions)])
+
+        records = _fetch('jobs', page_flags + ['-m', size] + paths, kwargs)
+        records = [record for record in records if 'Job' in record]
+
+        next_cursor = None
+
+        if len(records) >= size:
+            next_cursor = records[-1]['Job']
+
+        return records, next_cursor
+
+    return _iter_pages(fetch, page_size, limit, prefetch)
+
+
+# ------------------------------------------------------------------------------
+def _iter_pages(fetch, page_size, limit, prefetch):
+    """
+    Private function which returns a generator yielding the records of each
+    page in turn, fetching the next page in the background whilst the
+    current page is consumed. If the server is not accessible an empty
+    iterator is returned.
+
+    :param fetch: Called with a cursor (None for the first page) and the
+        number of records to ask for, returning the records of the page and
+        the cursor of the next page (None if there are no more)
+    :type fetch: callable
+
+    :param page_size: The number of records to ask for in each page
+    :type page_size: int
+
+    :param limit: The maximum number of records to yield, None for no limit
+    :type limit: int
+
+    :param prefetch: Whether to fetch the next page in the background
+    :type prefetch: bool
+
+    :return: generator(dict, ...)
+    """
+    if not connection.is_accessible():
+        return iter([])
+
+    return _pages(fetch, page_size, limit, prefetch)
+
+
+# ------------------------------------------------------------------------------
+def _pages(fetch, page_size, limit, prefetch):
+    """
+    Private generator which does the work of _iter_pages.
+
+    :return: generator(dict, ...)
+    """
+    page = _Page(fetch, None, _size(page_size, limit))
+    page.run()
+
+    remaining = limit
+
+    while True:
+        # -- A page which failed is raised here, in the consumer, rather
+        # -- than looking like the end of the history
+        if page.error is not None:
+            raise page.error
+
+        records, cursor = page.result
+
+        if remaining is not None:
+            records = records[:remaining]
+            remaining -= len(records)
+
+            if remaining <= 0:
+                cursor = None
+
+        page = None
+
+        if cursor is not None:
+            page = _Page(fetch, cursor, _size(page_size, remaining))
+
+            if prefetch:
+                page.start()
+
+        for record in records:
+            yield record
+
+        if page is None:
+            return
+
+        # -- If we were not prefetching we fetch the page now
+        if prefetch:
+            page.join()
+
+        else:
+            page.run()
+
+
+# ------------------------------------------------------------------------------
+class _Page(threading.Thread):
+    """
+    Private class which fetches a single page, either in the background or
+    when run directly. If the iteration is stopped whilst a page is being
+    fetched in the background its records are simply discarded. If the
+    fetch fails the error is held so it can be raised to the consumer.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, fetch, cursor, size):
+        super(_Page, self).__init__()
+
+        # -- We never want a page nobody is waiting for to hold the
+        # -- interpreter open
+        self.daemon = True
+
+        self.fetch = fetch
+        self.cursor = cursor
+        self.size = size
+
+        self.result = ([], None)
+        self.error = None
+
+    # --------------------------------------------------------------------------
+    def run(self):
+        try:
+            self.result = self.fetch(self.cursor, self.size)
+
+        except BaseException as error:
+            self.error = error
+
+
+# ------------------------------------------------------------------------------
+def _fetch(command, args, kwargs):
+    """
+    Private function which runs a single page of a history query.
+
+    :param command: The p4 command to run
+    :type command: str
+
+    :param args: The arguments to give the command
+    :type args: list
+
+    :param kwargs: The keyword arguments to give the call
+    :type kwargs: dict
+
+    :return: list(dict, ...)
+    """
+    # -- A failed page must not be mistaken for an empty page, which
+    # -- would end the history early
+    records = connection.checked_run(command, *args, **kwargs)
+
+    if records is None:
+        raise RuntimeError(
+            'Failed to fetch a page of %s : %s' % (
+                command,
+                ' '.join(str(arg) for arg in args),
+            ),
+        )
+
+    return records
+
+
+# ------------------------------------------------------------------------------
+def _paging_options(kwargs):
+    """
+    Private function which pops the paging options from the given keyword
+    arguments.
+
+    :return: tuple(page_size, limit, prefetch)
+    """
+    page_size = max(1, int(kwargs.pop('page_size', PAGE_SIZE)))
+    limit = kwargs.pop('limit', None)
+    prefetch = kwargs.pop('prefetch', True)
+
+    return page_size, limit, prefetch
+
+
+# ------------------------------------------------------------------------------
+def _size(page_size, remaining):
+    """
+    Private function which returns the number of records to ask for in a
+    page, never asking for more than we have left to yield.
+
+    :return: int
+    """
+    if remaining is None:
+        return page_size
+
+    return max(1, min(page_size, remaining))
+
+
+# ------------------------------------------------------------------------------
+def _split(command, args):
+    """
+    Private function which splits the given arguments into flags and paths,
+    rejecting any flags which paging cannot work with.
+
+    :return: tuple(command, flags, paths)
+    """
+    flat = [command]
+
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            flat.extend(str(item) for item in arg)
+
+        else:
+            flat.append(str(arg))
+
+    command, flags, paths = commands.split_command(flat)
+
+    for flag in flags:
+        if flag in _RESERVED_FLAGS:
+            raise ValueError('%s cannot be given when paging' % flag)
+
+    return command, flags, paths
+
+
+# ------------------------------------------------------------------------------
+def _split_revisions(record):
+    """
+    Private function which splits a filelog record, which holds every
+    revision as numbered fields, into a dictionary per revision.
+
+    :param record: The filelog record
+    :type record: dict
+
+    :return: list(dict, ...)
+    """
+    revisions = dict()
+    shared = dict()
+
+    for key, value in record.items():
+        match = _REVISION_FIELD.match(key)
+
+        if not match:
+            shared[key] = value
+            continue
+
+        revision = revisions.setdefault(int(match.group('index')), dict())
+
+        if match.group('sub_index') is None:
+            revision[match.group('name')] = value
+
+        else:
+            revision.setdefault(match.group('name'), list()).append(
+                (int(match.group('sub_index')), value),
+            )
+
+    results = list()
+
+    for index in sorted(revisions):
+        revision = dict(shared)
+
+        for key, value in revisions[index].items():
+            if isinstance(value, list):
+                value = [item for _, item in sorted(value)]
+
+            revision[key] = value
+
+        results.append(revision)
+
+    return results
@@ -0,0 +1,337 @@
+"""
+This module handles the decoding of the records perforce returns when
+running with -G. Under Python 3 marshal gives us dictionaries of bytes
+which need converting to strings, and given that a single call can return
+millions of records this is written with performance in mind:
+
+    * The Python version is only checked once, at import time
+    * Field names are decoded and interned once, then re-used
+    * Values of fields which are heavily repeated (such as headAction or
+      headType) are decoded once and the same string is then shared
+    * Under Python 3, marshal.load is very slow when reading from a pipe
+      as it makes a call to the pipe for every value, so instead we read
+      the output in large chunks and decode each record from memory
+"""
+import io
+import sys
+import marshal
+
+
+# -- The fields whose values are typically drawn from a small set, and
+# -- are therefore worth caching rather than decoding each time
+CACHED_FIELDS = frozenset(
+    [
+        'action',
+        'change',
+        'client',
+        'code',
+        'func',
+        'haveRev',
+        'headAction',
+        'headChange',
+        'headRev',
+        'headType',
+        'isMapped',
+        'otherOpen',
+        'ourLock',
+        'rev',
+        'shelved',
+        'status',
+        'type',
+        'user',
+    ]
+)
+
+# -- The maximum number of field names and values we will hold. These are
+# -- deliberately generous, but ensure odd results (such as those with
+# -- thousands of numbered keys) cannot grow the caches indefinitely
+_MAX_KEYS = 16384
+_MAX_VALUES = 16384
+
+# -- Maps the raw field name to a tuple of the decoded field name and
+# -- whether the values of that field should be cached
+_KEYS = dict()
+
+# -- Maps raw values of cached fields to their decoded value
+_VALUES = dict()
+
+
+# ------------------------------------------------------------------------------
+def clear_caches():
+    """
+    Clears the cached field names and values.
+
+    :return: None
+    """
+    _KEYS.clear()
+    _VALUES.clear()
+
+
+# ------------------------------------------------------------------------------
+def _decode_record_py2(record):
+    """
+    Private function used to decode records under Python 2. Marshal already
+    gives us strings, so there is nothing to do.
+
+    :param record: The record read by marshal
+    :type record: dict
+
+    :return: dict
+    """
+    return record
+
+
+# ------------------------------------------------------------------------------
+def _decode_record_py3(record, _keys=_KEYS, _values=_VALUES, _bytes=bytes):
+    """
+    Private function used to decode records under Python 3, converting any
+    bytes keys and values into strings.
+
+    :param record: The record read by marshal
+    :type record: dict
+
+    :return: dict
+    """
+    decoded = dict()
+
+    for key, value in record.items():
+        entry = _keys.get(key)
+
+        if entry is None:
+            entry = _decode_key(key)
+
+        key, cached = entry
+
+        if value.__class__ is _bytes:
+            if cached:
+                decoded_value = _values.get(value)
+
+                if decoded_value is None:
+                    decoded_value = value.decode('utf8')
+
+                    if len(_values) < _MAX_VALUES:
+                        _values[value] = decoded_value
+
+                value = decoded_value
+
+            else:
+                value = value.decode('utf8')
+
+        decoded[key] = value
+
+    return decoded
+
+
+# ------------------------------------------------------------------------------
+def _decode_key(key):
+    """
+    Private function which decodes and interns a field name, storing it
+    for re-use.
+
+    :param key: The raw field name
+
+    :return: tuple(str, bool)
+    """
+    if isinstance(key, bytes):
+        decoded_key = sys.intern(key.decode('utf8'))
+
+    else:
+        decoded_key = key
+
+    entry = (decoded_key, decoded_key in CACHED_FIELDS)
+
+    if len(_KEYS) < _MAX_KEYS:
+        _KEYS[key] = entry
+
+    return entry
+
+
+# ------------------------------------------------------------------------------
+def iter_records(stream, chunk_size=65536):
+    """
+    Reads the marshalled records from the given stream (typically the
+    stdout of a p4 process), yielding each decoded record as soon as it
+    has been fully read.
+
+    :param stream: The binary stream to read from
+    :param chunk_size: The maximum number of bytes to read at once
+    :type chunk_size: int
+
+    :return: generator(dict, ...)
+    """
+    # -- Python 2 marshal reads directly from the file, so it does not
+    # -- benefit from us reading in chunks
+    if sys.version_info.major < 3:
+        try:
+            while True:
+                yield marshal.load(stream)
+
+        except EOFError:
+            return
+
+    read = getattr(stream, 'read1', stream.read)
+    decoder = StreamDecoder()
+
+    while True:
+        chunk = read(chunk_size)
+
+        if not chunk:
+            break
+
+        for record in decoder.feed(chunk):
+            yield record
+
+    for record in decoder.close():
+        yield record
+
+
+# ------------------------------------------------------------------------------
+class StreamDecoder(object):
+    """
+    Incrementally decodes marshalled records from chunks of bytes, allowing
+    records to be decoded as output arrives regardless of how that output
+    is split up.
+
+    Each record is read with marshal.loads. As that does not tell us how many
+    bytes were consumed we re-marshal the record (which gives back identical
+    bytes for the simple dictionaries p4 emits) and verify it against the
+    data. If that ever differs we fall back to reading the record through a
+    file object, which is slower but always exact.
+
+    Pending bytes are accumulated in a bytearray. When a record is only
+    partially available we wait until at least twice as many bytes are
+    pending before trying again, so a single very large record is decoded
+    in a handful of attempts rather than once per chunk.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self):
+        self._buffer = bytearray()
+
+        # -- The number of pending bytes needed before we next attempt
+        # -- to decode a record
+        self._required = 0
+
+    # --------------------------------------------------------------------------
+    @property
+    def pending(self):
+        """
+        The number of bytes which have been fed but not yet decoded.
+
+        :return: int
+        """
+        return len(self._buffer)
+
+    # --------------------------------------------------------------------------
+    def feed(self, data):
+        """
+        Adds the given bytes to the decoder and returns all the records which
+        are now complete.
+
+        :param data: The bytes to add
+        :type data: bytes
+
+        :return: list(dict, ...)
+        """
+        self._buffer += data
+
+        if len(self._buffer) < self._required:
+            return list()
+
+        return self._decode()
+
+    # --------------------------------------------------------------------------
+    def close(self):
+        """
+        Called once there is no more data, returning any records which are
+        still to be decoded. If the data ended part way through a record a
+        ValueError is raised rather than that record being silently lost.
+
+        :return: list(dict, ...)
+        """
+        records = self._decode()
+
+        if self.pending:
+            raise ValueError(
+                'Output ended part way through a record (%s bytes remain)' % (
+                    self.pending,
+                ),
+            )
+
+        return records
+
+    # --------------------------------------------------------------------------
+    def _decode(self):
+        """
+        Decodes every complete record which is pending, removing their bytes
+        from the buffer.
+
+        :return: list(dict, ...)
+        """
+        records = list()
+        buffer = self._buffer
+        size = len(buffer)
+        position = 0
+
+        loads = marshal.loads
+        dumps = marshal.dumps
+        decode = decode_record
+
+        view = memoryview(buffer)
+
+        try:
+            while position < size:
+                try:
+                    record = loads(view[position:])
+
+                except EOFError:
+                    # -- We do not have a complete record yet. Rather than
+                    # -- trying again on every chunk we wait for the pending
+                    # -- data to double, keeping large records linear
+                    self._required = (size - position) * 2
+                    break
+
+                encoded = dumps(record, 0)
+                end = position + len(encoded)
+
+                if view[position:end] != encoded:
+                    end = position + self._measure(view[position:])
+
+                records.append(decode(record))
+                position = end
+
+            else:
+                self._required = 0
+
+        finally:
+            view.release()
+
+        # -- Deleting from the front of a bytearray does not copy the
+        # -- remaining bytes, so this is cheap however much is pending
+        del buffer[:position]
+
+        return records
+
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _measure(data):
+        """
+        Returns the number of bytes occupied by the first record in the
+        given data by reading it through a file object.
+
+        :param data: The data to read from
+
+        :return: int
+        """
+        stream = io.BytesIO(data)
+        marshal.load(stream)
+
+        return stream.tell()
+
+
+# -- Decide which decoder to use once, rather than for every record
+if sys.version_info.major < 3:
+    decode_record = _decode_record_py2
+
+else:
+    decode_record = _decode_record_py3
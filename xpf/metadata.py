@@ -0,0 +1,387 @@
+"""
+This module holds a permanent cache of the results of queries which can
+never change, stored in an SQLite database so it is shared between
+processes and sessions. This is particularly useful for tools which
+repeatedly describe the same submitted changes.
+
+The queries which are considered immutable are:
+
+    * describe of changes which are submitted (shelved descriptions are
+      never cached)
+    * filelog and annotate where every file is given an explicit revision
+      (#3) or submitted change (@1234)
+
+Note that filelog also reports later integrations made from the given
+revisions (such as 'branch into' records), which a cached result will not
+include.
+
+Only results without errors are stored. What these queries return depends
+on the protections of the user, so results are stored per user as well as
+per server. The cache is off by default:
+
+```python
+import xpf
+
+xpf.variables.set_use_metadata_cache(True)
+
+xpf.direct.describe(1234)  # -- Asks the server
+xpf.direct.describe(1234)  # -- Answered from the cache, in any process
+```
+
+If the sqlite3 module is not available the cache is never used.
+"""
+import os
+import re
+import sys
+import marshal
+import hashlib
+import threading
+
+try:
+    import sqlite3
+
+except ImportError:
+    sqlite3 = None
+
+from . import commands
+from . import variables
+
+
+# -- Returned by get when there is no entry for a key
+MISS = object()
+
+# -- Matches file specs which name an explicit revision or change
+_FIXED_REVISION = re.compile(r'(?:#(?P<rev>[0-9]+)|@(?P<change>[0-9]+))\Z')
+
+# -- The flags which mean a describe is not of submitted content
+_MUTABLE_DESCRIBE_FLAGS = frozenset(['-S'])
+
+# -- Calls given any of these keyword arguments are never cached
+_UNCACHED_KWARGS = (
+    'as_table',
+    'compact',
+    'form',
+    'on_error',
+    'on_progress',
+    'on_record',
+    'output',
+)
+
+# -- Each thread has its own connection to the database
+_LOCAL = threading.local()
+
+# -- The most recent submitted change we know of, keyed by server. Changes
+# -- beyond this could still have content submitted to them
+_LATEST_CHANGES = dict()
+
+
+# ------------------------------------------------------------------------------
+def is_available():
+    """
+    Returns True if the metadata cache can be used in this environment.
+
+    :return: bool
+    """
+    return sqlite3 is not None
+
+
+# ------------------------------------------------------------------------------
+def make_key(args, kwargs, runner):
+    """
+    Returns the key the results of the given call are stored against, or
+    None if the call is not known to be immutable.
+
+    :param args: The flattened arguments of the call, starting with the
+        command
+    :type args: list(str, ...)
+
+    :param kwargs: The keyword arguments of the call
+    :type kwargs: dict
+
+    :param runner: The function used to ask the server for the latest
+        submitted change, should we need to. This is given the arguments,
+        keyword arguments, timeout and return type of the call and returns
+        its results
+    :type runner: callable
+
+    :return: str or None
+    """
+    if not args or sqlite3 is None:
+        return None
+
+    for key in _UNCACHED_KWARGS:
+        if kwargs.get(key):
+            return None
+
+    if not kwargs.get('marshal', True):
+        return None
+
+    port = kwargs.get('port', variables.get_port())
+    try:
+        _, flags, paths = commands.split_command(list(args))
+
+    except ValueError:
+        return None
+
+    if not paths:
+        return None
+
+    if args[0] == 'describe':
+        if _MUTABLE_DESCRIBE_FLAGS.intersection(flags):
+            return None
+
+        if not all(path.isdigit() for path in paths):
+            return None
+
+    elif args[0] in ('filelog', 'annotate'):
+        if not all(_is_fixed(path, port, kwargs, runner) for path in paths):
+            return None
+
+    else:
+        return None
+
+    # -- Local paths are resolved through the client, so the client forms
+    # -- part of the key
+    client = ''
+
+    if not all(path.startswith('//') or path.isdigit() for path in paths):
+        client = kwargs.get('client', variables.get_client()) or ''
+
+    # -- What a describe or filelog returns depends on the protections of
+    # -- the user, so results are never shared between users
+    user = kwargs.get('user', variables.get_user()) or ''
+
+    return hashlib.sha1(
+        repr((port or '', user, client, tuple(args))).encode('utf8'),
+    ).hexdigest()
+
+
+# ------------------------------------------------------------------------------
+def get(key):
+    """
+    Returns the results stored against the given key, or MISS if there are
+    none.
+
+    :param key: The key, as given by make_key
+    :type key: str
+
+    :return: list(dict, ...) or MISS
+    """
+    try:
+        row = _connection().execute(
+            'SELECT value FROM results WHERE key = ?',
+            (key,),
+        ).fetchone()
+
+    except sqlite3.Error:
+        print(str(sys.exc_info()))
+        return MISS
+
+    if row is None:
+        return MISS
+
+    return marshal.loads(bytes(row[0]))
+
+
+# ------------------------------------------------------------------------------
+def put(key, args, results):
+    """
+    Stores the results of a call, provided they are complete and describe
+    something which can no longer change.
+
+    :param key: The key, as given by make_key
+    :type key: str
+
+    :param args: The flattened arguments of the call
+    :type args: list(str, ...)
+
+    :param results: The results of the call
+    :type results: list(dict, ...)
+
+    :return: bool, True if the results were stored
+    """
+    if not isinstance(results, list) or not results:
+        return False
+
+    for record in results:
+        if not isinstance(record, dict) or record.get('code') == 'error':
+            return False
+
+        # -- Pending changes can still be altered
+        if args[0] == 'describe' and record.get('status') != 'submitted':
+            return False
+
+    try:
+        with _connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO results (key, command, value) '
+                'VALUES (?, ?, ?)',
+                (key, args[0], _blob(marshal.dumps(results))),
+            )
+
+    except sqlite3.Error:
+        print(str(sys.exc_info()))
+        return False
+
+    return True
+
+
+# ------------------------------------------------------------------------------
+def clear():
+    """
+    Removes everything from the metadata cache.
+
+    :return: None
+    """
+    with _connection() as connection:
+        connection.execute('DELETE FROM results')
+
+
+# ------------------------------------------------------------------------------
+def count():
+    """
+    Returns the number of results held in the metadata cache.
+
+    :return: int
+    """
+    return _connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+# ------------------------------------------------------------------------------
+def _is_fixed(path, port, kwargs, runner):
+    """
+    Private function to determine whether a file spec names a revision whose
+    history can no longer change. Explicit revisions always can, whilst a
+    change is only fixed if it is no later than the latest submitted change.
+
+    :param path: The file spec to test
+    :type path: str
+
+    :param port: The server the spec refers to
+    :type port: str
+
+    :param kwargs: The keyword arguments of the call, used for any query
+        of the latest change
+    :type kwargs: dict
+
+    :param runner: The function used to run the query of the latest change
+    :type runner: callable
+
+    :return: bool
+    """
+    match = _FIXED_REVISION.search(path)
+
+    if not match or not match.start():
+        return False
+
+    if match.group('rev'):
+        return True
+
+    change = int(match.group('change'))
+
+    if change <= _LATEST_CHANGES.get(port, 0):
+        return True
+
+    return change <= _latest_change(port, kwargs, runner)
+
+
+# ------------------------------------------------------------------------------
+def _latest_change(port, kwargs, runner):
+    """
+    Private function which asks the server for the most recently submitted
+    change.
+
+    :param port: The server to ask
+    :type port: str
+
+    :param kwargs: The keyword arguments of the call
+    :type kwargs: dict
+
+    :param runner: The function used to run the query
+    :type runner: callable
+
+    :return: int
+    """
+    records = runner(
+        ['changes', '-m1', '-s', 'submitted'],
+        dict(
+            port=port,
+            client=kwargs.get('client', variables.get_client()),
+            user=kwargs.get('user', variables.get_user()),
+        ),
+        kwargs.get('timeout', variables.get_timeout()),
+        None,
+    )
+
+    try:
+        latest = int(records[0]['change'])
+
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0
+
+    _LATEST_CHANGES[port] = latest
+    return latest
+
+
+# ------------------------------------------------------------------------------
+def _connection():
+    """
+    Private function which returns the database connection for the current
+    thread, creating the database if it does not exist.
+
+    :return: sqlite3.Connection
+    """
+    path = variables.get_metadata_cache_path()
+    connection = getattr(_LOCAL, 'connection', None)
+
+    if connection is not None and _LOCAL.path == path:
+        return connection
+
+    directory = os.path.dirname(path)
+
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+
+        except OSError:
+            pass
+
+    connection = sqlite3.connect(path, timeout=10)
+
+    # -- Write ahead logging allows other processes to read whilst
+    # -- we're writing
+    try:
+        connection.execute('PRAGMA journal_mode=WAL')
+
+    except sqlite3.Error:
+        pass
+
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS results ('
+        'key TEXT PRIMARY KEY, '
+        'command TEXT, '
+        'value BLOB)'
+    )
+    connection.commit()
+
+    _LOCAL.connection = connection
+    _LOCAL.path = path
+
+    return connection
+
+
+# ------------------------------------------------------------------------------
+def _blob(data):
+    """
+    Private function which wraps bytes so that sqlite stores them as a blob
+    under both Python 2 and Python 3.
+
+    :param data: The data to wrap
+    :type data: bytes
+
+    :return: The wrapped data
+    """
+    if sys.version_info.major < 3:
+        return buffer(data)  # noqa: F821
+
+    return data
@@ -0,0 +1,457 @@
+"""
+This module holds an in-memory snapshot of the files opened by a client,
+indexed by depot path, local path and change. The opened files are queried
+once (p4 opened -C client) and from then on questions such as "which change
+is this file in" or "which files are in change N" are simple lookups:
+
+```python
+import xpf
+
+index = xpf.opened.get_index()
+
+index.change_of('/usr/my_files/file.txt')  # -- '1234' or 'default'
+index.files_in(1234)                       # -- ['//depot/my_files/file.txt']
+```
+
+Any command run through xpf which may alter files (such as edit, add,
+reopen, revert or submit) marks the files it touched as out of date, and
+only those files are queried again the next time the index is read. Files
+opened or reverted outside of xpf are picked up by calling refresh().
+
+The assist functions changelist and submit_files use the index when
+xpf.variables.get_use_opened_index() is True. If the opened files cannot be
+queried they ask the server instead, and reading the index directly raises
+a RuntimeError rather than reporting files as not opened.
+"""
+import os
+import threading
+
+from . import views
+from . import commands
+from . import variables
+from . import connection
+
+
+# -- The indexes which have been created, keyed by port and client
+_INDEXES = dict()
+_INDEXES_LOCK = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+def get_index(client=None, port=None):
+    """
+    Returns the OpenedIndex for the given client, creating it if it has not
+    been requested before. The opened files are not queried until the index
+    is first read.
+
+    :param client: The client to get the index for. If not given the
+        currently active client is used.
+    :type client: str
+
+    :param port: The server the client belongs to. If not given the
+        currently active port is used.
+    :type port: str
+
+    :return: OpenedIndex or None if the server is not accessible
+    """
+    # -- This also ensures the active client and port are known
+    if not connection.is_accessible():
+        return None
+
+    client = client or variables.get_client()
+    port = port or variables.get_port()
+    key = (port, client)
+
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = OpenedIndex(client=client, port=port)
+
+        return _INDEXES[key]
+
+
+# ------------------------------------------------------------------------------
+def clear_cache():
+    """
+    Removes all the indexes, forcing the opened files to be queried again
+    the next time they are requested.
+
+    :return: None
+    """
+    with _INDEXES_LOCK:
+        _INDEXES.clear()
+
+
+# ------------------------------------------------------------------------------
+def on_write(args, results):
+    """
+    The write hook registered with xpf.connection, which marks the files
+    affected by a command as out of date in every index.
+
+    :param args: The flattened arguments of the command, starting with the
+        command itself, or None if they are not known
+    :type args: list(str, ...)
+
+    :param results: The results of the command
+
+    :return: None
+    """
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+
+    for index in indexes:
+        index.mark_written(args, results)
+
+
+# ------------------------------------------------------------------------------
+class OpenedIndex(object):
+    """
+    The files opened by a client, indexed by depot path, local path and
+    change.
+
+    :param client: The client whose opened files are indexed
+    :type client: str
+
+    :param port: The server the client belongs to
+    :type port: str
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, client, port):
+        self.client = client
+        self.port = port
+
+        # -- The opened records keyed by depot path, along with the depot
+        # -- paths keyed by normalised local path and by change
+        self._records = dict()
+        self._by_local = dict()
+        self._by_change = dict()
+
+        # -- Paths (and the prefixes of paths) which have been altered by
+        # -- our own commands and need to be queried again
+        self._pending_paths = set()
+        self._pending_prefixes = set()
+
+        # -- Set when the whole index needs to be queried again
+        self._stale = True
+
+        self._lock = threading.RLock()
+
+    # --------------------------------------------------------------------------
+    def record(self, path):
+        """
+        Returns the opened record of the given file, as p4 opened gives it
+        but with the clientFile given as a local path.
+
+        If the opened files cannot be queried a RuntimeError is raised, as
+        is the case for every other query of the index.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: dict or None if the file is not opened
+        """
+        with self._lock:
+            self._require_current()
+            record = self._records.get(self._depot_path(path))
+
+        return dict(record) if record else None
+
+    # --------------------------------------------------------------------------
+    def is_opened(self, path):
+        """
+        Returns True if the given file is opened by the client.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: bool
+        """
+        return self.record(path) is not None
+
+    # --------------------------------------------------------------------------
+    def change_of(self, path):
+        """
+        Returns the change the given file is opened in.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: str ('default' or the change number) or None if the file is
+            not opened
+        """
+        return (self.record(path) or {}).get('change')
+
+    # --------------------------------------------------------------------------
+    def files_in(self, change, local=False):
+        """
+        Returns the files opened in the given change.
+
+        :param change: The change number, or 'default'
+        :type change: int or str
+
+        :param local: If True the local paths of the files are returned
+            rather than their depot paths
+        :type local: bool
+
+        :return: list(str, ...)
+        """
+        with self._lock:
+            self._require_current()
+
+            depot_paths = sorted(self._by_change.get(str(change), ()))
+
+            if not local:
+                return depot_paths
+
+            return [
+                self._records[depot_path].get('clientFile')
+                for depot_path in depot_paths
+            ]
+
+    # --------------------------------------------------------------------------
+    def changes(self):
+        """
+        Returns the changes which have files opened in them.
+
+        :return: list(str, ...)
+        """
+        with self._lock:
+            self._require_current()
+            return sorted(self._by_change)
+
+    # --------------------------------------------------------------------------
+    def refresh(self):
+        """
+        Queries all of the opened files again, picking up any files opened
+        or reverted outside of xpf.
+
+        :return: True if the index was refreshed
+        """
+        with self._lock:
+            records = self._opened()
+
+            if records is None:
+                return False
+
+            self._records.clear()
+            self._by_local.clear()
+            self._by_change.clear()
+
+            self._add(records)
+
+            self._stale = False
+            self._pending_paths.clear()
+            self._pending_prefixes.clear()
+
+            return True
+
+    # --------------------------------------------------------------------------
+    def ensure_current(self):
+        """
+        Queries all the opened files if we have not done so yet, or just the
+        files which our own commands have altered.
+
+        :return: True if the index is up to date, False if the server could
+            not be asked, in which case the index must not be relied upon
+        """
+        with self._lock:
+            return self._ensure_current()
+
+    # --------------------------------------------------------------------------
+    def mark_written(self, args, results):
+        """
+        Marks the files affected by a command as out of date, so they are
+        queried again the next time the index is read.
+
+        :param args: The flattened arguments of the command, starting with
+            the command itself, or None if they are not known
+        :type args: list(str, ...)
+
+        :param results: The results of the command
+
+        :return: None
+        """
+        affected = commands.affected_paths(args, results)
+
+        with self._lock:
+            if affected is None:
+                self._stale = True
+                return
+
+            self._pending_paths.update(affected[0])
+            self._pending_prefixes.update(affected[1])
+
+    # --------------------------------------------------------------------------
+    def _ensure_current(self):
+        """
+        Queries all the opened files if we have not done so yet, or just the
+        files which our own commands have altered.
+
+        :return: True if the index is up to date
+        """
+        if self._stale:
+            return self.refresh()
+
+        if not self._pending_paths and not self._pending_prefixes:
+            return True
+
+        paths = list(self._pending_paths)
+        prefixes = list(self._pending_prefixes)
+
+        records = self._opened(paths + [prefix + '...' for prefix in prefixes])
+
+        # -- If the server could not be reached we leave them pending
+        if records is None:
+            return False
+
+        for path in paths:
+            self._remove(self._depot_path(path))
+
+        for prefix in prefixes:
+            if prefix.startswith('//'):
+                depot_paths = [
+                    depot_path
+                    for depot_path in self._records
+                    if depot_path.startswith(prefix)
+                ]
+
+            else:
+                prefix = _normalise(prefix) + os.sep
+
+                depot_paths = [
+                    depot_path
+                    for local_path, depot_path in self._by_local.items()
+                    if local_path.startswith(prefix)
+                ]
+
+            for depot_path in depot_paths:
+                self._remove(depot_path)
+
+        self._add(records)
+
+        self._pending_paths.difference_update(paths)
+        self._pending_prefixes.difference_update(prefixes)
+
+        return True
+
+    # --------------------------------------------------------------------------
+    def _require_current(self):
+        """
+        Brings the index up to date, raising a RuntimeError if it cannot
+        be, so a failed query is never mistaken for there being no opened
+        files.
+
+        :return: None
+        """
+        if not self._ensure_current():
+            raise RuntimeError(
+                'The opened files of %s could not be queried' % self.client
+            )
+
+    # --------------------------------------------------------------------------
+    def _opened(self, paths=None):
+        """
+        Returns the opened records of the client, optionally limited to the
+        given files.
+
+        :return: list(dict, ...) or None if the server could not be asked
+        """
+        args = ['opened', '-C', self.client]
+
+        if paths:
+            args.append(paths)
+
+        # -- A failed call must not be mistaken for there being no opened
+        # -- files, which would empty the index
+        return connection.checked_run(
+            *args,
+            port=self.port,
+            client=self.client
+        )
+
+    # --------------------------------------------------------------------------
+    def _add(self, records):
+        """
+        Adds the given opened records to the index, translating their client
+        paths to local paths.
+
+        :return: None
+        """
+        view = views.get_view(client=self.client, port=self.port)
+
+        for record in records:
+            if not isinstance(record, dict) or 'depotFile' not in record:
+                continue
+
+            record = dict(record)
+            client_file = record.get('clientFile')
+
+            if client_file and client_file.startswith('//'):
+                client_file = view.client_to_local(client_file) if view else None
+
+            record['clientFile'] = client_file
+
+            depot_path = record['depotFile']
+            change = record.get('change', 'default')
+
+            self._remove(depot_path)
+            self._records[depot_path] = record
+            self._by_change.setdefault(change, set()).add(depot_path)
+
+            if client_file:
+                self._by_local[_normalise(client_file)] = depot_path
+
+    # --------------------------------------------------------------------------
+    def _remove(self, depot_path):
+        """
+        Removes a file from the index, if it is there.
+
+        :return: None
+        """
+        record = self._records.pop(depot_path, None)
+
+        if not record:
+            return
+
+        change = record.get('change', 'default')
+        depot_paths = self._by_change.get(change)
+
+        if depot_paths is not None:
+            depot_paths.discard(depot_path)
+
+            if not depot_paths:
+                del self._by_change[change]
+
+        if record.get('clientFile'):
+            self._by_local.pop(_normalise(record['clientFile']), None)
+
+    # --------------------------------------------------------------------------
+    def _depot_path(self, path):
+        """
+        Returns the depot path of the given depot or local path, as far as
+        the index knows it.
+
+        :return: str or None
+        """
+        if path.startswith('//'):
+            return path
+
+        return self._by_local.get(_normalise(path))
+
+
+# ------------------------------------------------------------------------------
+def _normalise(path):
+    """
+    Private function which normalises a local path so that paths given by
+    the caller can be compared with those p4 reports.
+
+    :param path: The path to normalise
+    :type path: str
+
+    :return: str
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+# -- Ensure the index is told about our own writes
+connection.add_write_hook(on_write)
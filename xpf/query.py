@@ -0,0 +1,409 @@
+"""
+This module allows queries to be built up such that the server only sends
+back the records and fields which are needed, rather than everything being
+fetched and then filtered in Python.
+
+```python
+import xpf
+
+# -- The depot path and revision of the first 100 binary files which are
+# -- not deleted at head
+records = xpf.query.fstat(
+    '//depot/...',
+).where(
+    'headType', 'binary',
+).where_not(
+    'headAction', 'delete',
+).fields(
+    'depotFile', 'headRev',
+).limit(100).run()
+```
+
+How much of a query can be given to the server depends on the command:
+
+    * fstat supports filters (-F), field selection (-T) and limits (-m)
+    * changes supports filters on user, client and status (-u, -c and -s)
+      along with limits (-m)
+    * clients supports filters on Owner, client (a name pattern) and
+      Stream (-u, -e and -S) along with limits (-m)
+
+Anything the server cannot do is applied to the records once they are
+returned, so every query gives the same records regardless of command.
+"""
+import re
+
+from . import direct
+
+
+# -- The comparisons which can be used within a filter
+OPERATORS = ('=', '>', '<', '>=', '<=')
+
+# -- The commands which accept a filter expression (-F) and a list of
+# -- fields to return (-T)
+_FILTERED_COMMANDS = frozenset(['fstat'])
+
+# -- For other commands, the fields which can be filtered on by the server
+# -- along with the flag which does so
+_FIELD_FLAGS = {
+    'changes': {
+        'client': '-c',
+        'status': '-s',
+        'user': '-u',
+    },
+    'clients': {
+        'client': '-e',
+        'Owner': '-u',
+        'Stream': '-S',
+    },
+}
+
+# -- Characters which have a meaning within a filter expression and must
+# -- be escaped within values
+_SPECIAL_CHARACTERS = '\\&|()^=<> '
+
+
+# ------------------------------------------------------------------------------
+def fstat(*paths):
+    """
+    Returns a query of the fstat records of the given files.
+
+    :param paths: The files to query, lists are accepted as with xpf.direct
+
+    :return: Query
+    """
+    return Query('fstat', *paths)
+
+
+# ------------------------------------------------------------------------------
+def changes(*paths):
+    """
+    Returns a query of the changes affecting the given files, or all changes
+    if no files are given.
+
+    :param paths: The files to query, lists are accepted as with xpf.direct
+
+    :return: Query
+    """
+    return Query('changes', *paths)
+
+
+# ------------------------------------------------------------------------------
+def clients():
+    """
+    Returns a query of the clients (workspaces) on the server.
+
+    :return: Query
+    """
+    return Query('clients')
+
+
+# ------------------------------------------------------------------------------
+def expression(field, value, operator='=', negate=False):
+    """
+    Returns a single comparison as part of a p4 filter expression (as used
+    by fstat -F and jobs -e), escaping any special characters in the value.
+
+    :param field: The name of the field
+    :type field: str
+
+    :param value: The value to compare against
+    :type value: str or int
+
+    :param operator: One of xpf.query.OPERATORS
+    :type operator: str
+
+    :param negate: If True the comparison is negated
+    :type negate: bool
+
+    :return: str
+    """
+    value = ''.join(
+        '\\' + character if character in _SPECIAL_CHARACTERS else character
+        for character in str(value)
+    )
+
+    return '%s%s%s%s' % (
+        '^' if negate else '',
+        field,
+        operator,
+        value,
+    )
+
+
+# ------------------------------------------------------------------------------
+class Query(object):
+    """
+    A query of a single command which can be narrowed down to the records
+    and fields that are needed. Each method returns the query itself so
+    calls can be chained.
+
+    :param command: The p4 command to run
+    :type command: str
+
+    :param paths: The files to run the command over
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, command, *paths):
+        self.command = command
+        self.paths = paths
+
+        self._conditions = list()
+        self._fields = list()
+        self._limit = None
+
+    # --------------------------------------------------------------------------
+    def where(self, field, value, operator='='):
+        """
+        Only returns records where the given field compares to the value.
+        Values compared with = may hold * wildcards.
+
+        :param field: The name of the field, such as headType
+        :type field: str
+
+        :param value: The value to compare against
+        :type value: str or int
+
+        :param operator: One of xpf.query.OPERATORS
+        :type operator: str
+
+        :return: Query
+        """
+        self._conditions.append(_Condition(field, operator, value, False))
+        return self
+
+    # --------------------------------------------------------------------------
+    def where_not(self, field, value, operator='='):
+        """
+        Only returns records where the given field does not compare to the
+        value.
+
+        :param field: The name of the field, such as headAction
+        :type field: str
+
+        :param value: The value to compare against
+        :type value: str or int
+
+        :param operator: One of xpf.query.OPERATORS
+        :type operator: str
+
+        :return: Query
+        """
+        self._conditions.append(_Condition(field, operator, value, True))
+        return self
+
+    # --------------------------------------------------------------------------
+    def fields(self, *names):
+        """
+        Only returns the given fields of each record.
+
+        :param names: The names of the fields, such as depotFile
+
+        :return: Query
+        """
+        self._fields.extend(names)
+        return self
+
+    # --------------------------------------------------------------------------
+    def limit(self, count):
+        """
+        Returns no more than the given number of records.
+
+        :param count: The maximum number of records
+        :type count: int
+
+        :return: Query
+        """
+        self._limit = int(count)
+        return self
+
+    # --------------------------------------------------------------------------
+    def arguments(self):
+        """
+        Returns the arguments given to the command (after the command
+        itself) to run this query.
+
+        :return: list
+        """
+        return self._plan()[0]
+
+    # --------------------------------------------------------------------------
+    def run(self, **kwargs):
+        """
+        Runs the query, returning the matching records.
+
+        :param kwargs: Any special keyword arguments (such as timeout, port
+            or client) to pass to the p4 call
+
+        :return: list(dict, ...)
+        """
+        results = direct.run(self.command, *self.arguments(), **kwargs)
+
+        return self.filter(results or [])
+
+    # --------------------------------------------------------------------------
+    def filter(self, results):
+        """
+        Applies the parts of the query which the server cannot do to the
+        records it returned. This allows the query to be run through any
+        means (such as xpf.aio) by running the command with the arguments
+        and passing the records through this.
+
+        :param results: The records returned by the command when run with
+            the arguments of this query
+        :type results: list(dict, ...)
+
+        :return: list(dict, ...)
+        """
+        conditions = self._plan()[1]
+
+        # -- Anything the server could not do we do ourselves
+        if conditions:
+            results = [
+                record
+                for record in results
+                if all(condition.matches(record) for condition in conditions)
+            ]
+
+            if self._limit is not None:
+                results = results[:self._limit]
+
+        if self._fields and self.command not in _FILTERED_COMMANDS:
+            fields = ['code'] + self._fields
+
+            results = [
+                dict(
+                    (field, record[field])
+                    for field in fields
+                    if field in record
+                )
+                for record in results
+            ]
+
+        return results
+
+    # --------------------------------------------------------------------------
+    def _plan(self):
+        """
+        Private method which splits the query into the arguments which ask
+        the server to do as much as it can, and the conditions which need to
+        be checked once the records are returned.
+
+        :return: tuple(arguments, conditions)
+        """
+        args = list()
+        remaining = list()
+
+        if self.command in _FILTERED_COMMANDS:
+            if self._conditions:
+                args.extend(
+                    [
+                        '-F',
+                        ' & '.join(
+                            condition.expression()
+                            for condition in self._conditions
+                        ),
+                    ]
+                )
+
+            if self._fields:
+                args.extend(['-T', ','.join(self._fields)])
+
+        else:
+            field_flags = _FIELD_FLAGS.get(self.command, dict())
+            used_flags = set()
+
+            for condition in self._conditions:
+                flag = field_flags.get(condition.field)
+
+                # -- Flags can only ask for a single exact value
+                if (flag is None
+                        or flag in used_flags
+                        or condition.negate
+                        or condition.operator != '='):
+                    remaining.append(condition)
+                    continue
+
+                args.extend([flag, str(condition.value)])
+                used_flags.add(flag)
+
+                # -- Only the name pattern of a client supports wildcards
+                # -- so we check the others ourselves
+                if '*' in str(condition.value) and flag != '-e':
+                    remaining.append(condition)
+
+        # -- We can only limit the records on the server if it is
+        # -- doing all the filtering
+        if self._limit is not None and not remaining:
+            args.extend(['-m', self._limit])
+
+        args.extend(self.paths)
+
+        return args, remaining
+
+
+# ------------------------------------------------------------------------------
+class _Condition(object):
+    """
+    Private class which holds a single comparison of a field.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, field, operator, value, negate):
+        if operator not in OPERATORS:
+            raise ValueError('Unknown operator : %s' % operator)
+
+        self.field = field
+        self.operator = operator
+        self.value = value
+        self.negate = negate
+
+    # --------------------------------------------------------------------------
+    def expression(self):
+        """
+        Returns this condition as part of a p4 filter expression (-F).
+
+        :return: str
+        """
+        return expression(self.field, self.value, self.operator, self.negate)
+
+    # --------------------------------------------------------------------------
+    def matches(self, record):
+        """
+        Returns True if the given record satisfies this condition.
+
+        :param record: The record to check
+        :type record: dict
+
+        :return: bool
+        """
+        if self.field not in record:
+            return self.negate
+
+        actual = record[self.field]
+        expected = str(self.value)
+
+        if self.operator == '=':
+            pattern = '.*'.join(re.escape(part) for part in expected.split('*'))
+            return bool(re.match(pattern + r'\Z', actual, re.S)) != self.negate
+
+        # -- Numbers (such as change numbers) are compared numerically
+        try:
+            actual, expected = int(actual), int(expected)
+
+        except ValueError:
+            pass
+
+        if self.operator == '>':
+            result = actual > expected
+
+        elif self.operator == '<':
+            result = actual < expected
+
+        elif self.operator == '>=':
+            result = actual >= expected
+
+        else:
+            result = actual <= expected
+
+        return result != self.negate
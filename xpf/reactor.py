@@ -0,0 +1,464 @@
+"""
+This module holds a reactor which services the pipes of many p4 processes
+from a single thread. Rather than each call having its own thread blocked
+reading the output of its process, every in-flight process has its pipes
+registered with one selector and the reactor thread reads (and writes)
+whichever pipes are ready.
+
+This means the number of threads stays constant regardless of how many
+calls are in flight, which matters when hundreds of calls are made at once.
+
+The reactor is opt-in and is used by xpf.connection when enabled through
+xpf.variables.set_use_reactor(True). It relies on the selectors module and
+on being able to select over pipes, so it is only supported under Python 3
+on posix platforms. Everywhere else calls are run on their own threads.
+
+Nothing handed to the reactor runs user code. Calls which are streamed,
+write to an output or have callbacks are always given their own thread by
+xpf.connection, as a slow callback (or one which makes calls of its own)
+would otherwise stall every other process the reactor is servicing.
+
+Anything handed to the reactor (a channel) is expected to provide:
+
+    * process: The subprocess.Popen instance whose pipes are serviced
+    * timeout: The number of seconds the channel may run for, or None
+    * next_input(): Returns the next bytes to write to the stdin of the
+        process, or empty bytes once there is nothing more to write
+    * feed(data): Called with each chunk of bytes read from the stdout
+    * expire(): Called if the channel is still running once its timeout
+        has passed
+    * fail(error): Called with the exception raised if the channel could
+        not be registered or its output could not be handled
+    * close(): Called once the stdout has closed and the process has exited
+"""
+import os
+import sys
+import time
+import errno
+import heapq
+import itertools
+import threading
+
+try:
+    import selectors
+
+except ImportError:
+    selectors = None
+
+
+# -- The maximum number of bytes we read from a pipe at once
+_CHUNK_SIZE = 65536
+
+# -- How often (in seconds) we check on processes which have closed their
+# -- output but not yet exited
+_REAP_INTERVAL = 0.01
+
+# -- The reactor shared by all calls, created when first needed
+_REACTOR = None
+_REACTOR_LOCK = threading.Lock()
+
+# -- The errors which mean a non-blocking pipe is not ready
+_NOT_READY = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+# -- Monotonic time is not available under Python 2, but then neither is
+# -- the reactor
+now = getattr(time, 'monotonic', time.time)
+
+
+# ------------------------------------------------------------------------------
+def is_supported():
+    """
+    Returns True if the reactor can be used on this platform.
+
+    :return: bool
+    """
+    return (
+        selectors is not None
+        and os.name != 'nt'
+        and hasattr(os, 'set_blocking')
+    )
+
+
+# ------------------------------------------------------------------------------
+def get_reactor():
+    """
+    Returns the reactor shared by all calls, starting it if this is the first
+    time it has been asked for.
+
+    :return: Reactor
+    """
+    global _REACTOR
+
+    with _REACTOR_LOCK:
+        if _REACTOR is None:
+            _REACTOR = Reactor()
+            _REACTOR.start()
+
+        return _REACTOR
+
+
+# ------------------------------------------------------------------------------
+class Reactor(object):
+    """
+    Services the pipes of any number of p4 processes from a single thread,
+    enforcing the timeout of each from a heap of deadlines.
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+
+        # -- Channels are added from other threads, so they are placed here
+        # -- and the reactor is woken through a pipe to pick them up
+        self._pending = list()
+        self._lock = threading.Lock()
+
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ, None)
+
+        # -- Heap of (deadline, sequence, entry), the sequence ensures
+        # -- entries themselves are never compared
+        self._deadlines = list()
+        self._sequence = itertools.count()
+
+        # -- Entries whose output has closed, waiting on their process
+        self._reaping = list()
+
+        self._thread = None
+
+    # --------------------------------------------------------------------------
+    def start(self):
+        """
+        Starts the reactor thread.
+
+        :return: None
+        """
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # --------------------------------------------------------------------------
+    def add(self, channel):
+        """
+        Hands a channel to the reactor. Its pipes are serviced from the next
+        iteration of the reactor onwards.
+
+        :param channel: The channel to add
+
+        :return: None
+        """
+        with self._lock:
+            self._pending.append(channel)
+
+        try:
+            os.write(self._wake_write, b'x')
+
+        except OSError:
+            # -- The wake pipe is already full, so the reactor is
+            # -- guaranteed to wake anyway
+            pass
+
+    # --------------------------------------------------------------------------
+    def _loop(self):
+        while True:
+            try:
+                self._step()
+
+            except BaseException:
+                print(str(sys.exc_info()))
+
+    # --------------------------------------------------------------------------
+    def _step(self):
+        """
+        Runs a single iteration of the reactor.
+
+        :return: None
+        """
+        self._add_pending()
+
+        for key, mask in self._selector.select(self._select_timeout()):
+            if key.data is None:
+                self._drain_wake()
+                continue
+
+            entry, reading = key.data
+
+            if reading:
+                self._read(entry)
+
+            else:
+                self._write(entry)
+
+        self._expire()
+        self._reap()
+
+    # --------------------------------------------------------------------------
+    def _select_timeout(self):
+        """
+        Returns how long we can wait on the selector before there is
+        something else for us to do.
+
+        :return: float or None
+        """
+        if self._reaping:
+            return _REAP_INTERVAL
+
+        if self._deadlines:
+            return max(0, self._deadlines[0][0] - now())
+
+        return None
+
+    # --------------------------------------------------------------------------
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_read, _CHUNK_SIZE):
+                pass
+
+        except OSError:
+            pass
+
+    # --------------------------------------------------------------------------
+    def _add_pending(self):
+        """
+        Registers the pipes of all the channels which have been added since
+        the last iteration.
+
+        :return: None
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = list()
+
+        for channel in pending:
+            entry = _Entry(channel)
+
+            try:
+                self._register(entry)
+
+            except BaseException:
+                print(str(sys.exc_info()))
+                channel.fail(sys.exc_info()[1])
+                self._finish(entry)
+
+    # --------------------------------------------------------------------------
+    def _register(self, entry):
+        """
+        Registers the pipes of the given entry with the selector and adds
+        its deadline to the heap.
+
+        :param entry: The entry to register
+        :type entry: _Entry
+
+        :return: None
+        """
+        process = entry.channel.process
+
+        os.set_blocking(process.stdout.fileno(), False)
+        self._selector.register(
+            process.stdout.fileno(),
+            selectors.EVENT_READ,
+            (entry, True),
+        )
+        entry.stdout = process.stdout
+
+        # -- Only keep the input open if there is something to write
+        entry.buffer = entry.channel.next_input()
+
+        if entry.buffer:
+            os.set_blocking(process.stdin.fileno(), False)
+            self._selector.register(
+                process.stdin.fileno(),
+                selectors.EVENT_WRITE,
+                (entry, False),
+            )
+            entry.stdin = process.stdin
+
+        else:
+            _close(process.stdin)
+
+        if entry.channel.timeout is not None:
+            heapq.heappush(
+                self._deadlines,
+                (now() + entry.channel.timeout, next(self._sequence), entry),
+            )
+
+    # --------------------------------------------------------------------------
+    def _read(self, entry):
+        """
+        Reads whatever output is available for the given entry, passing it
+        to its channel.
+
+        :param entry: The entry whose output is ready
+        :type entry: _Entry
+
+        :return: None
+        """
+        try:
+            data = os.read(entry.stdout.fileno(), _CHUNK_SIZE)
+
+        except OSError as error:
+            if error.errno in _NOT_READY:
+                return
+
+            data = b''
+
+        if not data:
+            self._finish(entry)
+            return
+
+        try:
+            entry.channel.feed(data)
+
+        except BaseException:
+            print(str(sys.exc_info()))
+            entry.channel.fail(sys.exc_info()[1])
+
+    # --------------------------------------------------------------------------
+    def _write(self, entry):
+        """
+        Writes as much of the pending input as the stdin of the given entry
+        will accept, closing it once all the input has been written.
+
+        :param entry: The entry whose input is ready
+        :type entry: _Entry
+
+        :return: None
+        """
+        try:
+            if not entry.buffer:
+                entry.buffer = entry.channel.next_input()
+
+            if entry.buffer:
+                written = os.write(entry.stdin.fileno(), entry.buffer)
+                entry.buffer = entry.buffer[written:]
+                return
+
+        except OSError as error:
+            if error.errno in _NOT_READY:
+                return
+
+        except BaseException:
+            print(str(sys.exc_info()))
+
+        # -- Either we have nothing left to write or the process
+        # -- has stopped reading
+        self._close_stdin(entry)
+
+    # --------------------------------------------------------------------------
+    def _close_stdin(self, entry):
+        if entry.stdin is None:
+            return
+
+        self._unregister(entry.stdin)
+        _close(entry.stdin)
+        entry.stdin = None
+
+    # --------------------------------------------------------------------------
+    def _unregister(self, pipe):
+        try:
+            self._selector.unregister(pipe.fileno())
+
+        except (KeyError, ValueError):
+            pass
+
+    # --------------------------------------------------------------------------
+    def _finish(self, entry):
+        """
+        Stops servicing the pipes of the given entry, which is then reaped
+        once its process has exited.
+
+        :param entry: The entry whose output has closed
+        :type entry: _Entry
+
+        :return: None
+        """
+        self._close_stdin(entry)
+
+        if entry.stdout is not None:
+            self._unregister(entry.stdout)
+            _close(entry.stdout)
+            entry.stdout = None
+
+        entry.finished = True
+        self._reaping.append(entry)
+
+    # --------------------------------------------------------------------------
+    def _expire(self):
+        """
+        Expires every entry whose deadline has passed.
+
+        :return: None
+        """
+        current = now()
+
+        while self._deadlines and self._deadlines[0][0] <= current:
+            entry = heapq.heappop(self._deadlines)[2]
+
+            if not entry.finished:
+                entry.channel.expire()
+
+    # --------------------------------------------------------------------------
+    def _reap(self):
+        """
+        Closes every entry whose process has exited.
+
+        :return: None
+        """
+        if not self._reaping:
+            return
+
+        reaping = list()
+
+        for entry in self._reaping:
+            if entry.channel.process.poll() is None:
+                reaping.append(entry)
+                continue
+
+            try:
+                entry.channel.close()
+
+            except BaseException:
+                print(str(sys.exc_info()))
+
+        self._reaping = reaping
+
+
+# ------------------------------------------------------------------------------
+class _Entry(object):
+    """
+    Private class holding the reactors state for a single channel.
+    """
+
+    __slots__ = (
+        'channel',
+        'stdout',
+        'stdin',
+        'buffer',
+        'finished',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, channel):
+        self.channel = channel
+        self.stdout = None
+        self.stdin = None
+        self.buffer = b''
+        self.finished = False
+
+
+# ------------------------------------------------------------------------------
+def _close(pipe):
+    """
+    Private function which closes a pipe, ignoring any errors.
+
+    :param pipe: The pipe to close
+
+    :return: None
+    """
+    try:
+        pipe.close()
+
+    except (IOError, OSError):
+        pass
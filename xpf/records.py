@@ -0,0 +1,473 @@
+"""
+This module holds a compact representation for large result sets. Rather
+than holding a dictionary per record, records which share the same set of
+fields share a single schema and their values are stored in columns:
+
+    * Values which are plain integers (such as headRev, headTime or
+      fileSize) are stored in typed arrays rather than as strings
+    * Paths (such as depotFile or clientFile) have their directory stored
+      once and shared between all the records within that directory
+    * All other values are stored as references in a list
+
+Each record is exposed through a light weight read-only view which behaves
+like a dictionary, so callers access fields exactly as they would with a
+regular result.
+
+You can request a compact result from any xpf.direct call:
+
+```python
+import xpf
+
+results = xpf.direct.fstat('//depot/...', compact=True)
+
+for record in results:
+    print(record['depotFile'], record.get('headRev'))
+```
+"""
+import re
+from array import array
+
+
+# -- The fields whose values are paths, and which benefit from having their
+# -- directories shared between records
+PATH_FIELDS = frozenset(
+    [
+        'clientFile',
+        'depotFile',
+        'fromFile',
+        'movedFile',
+        'path',
+        'resolveFromFile',
+        'toFile',
+    ]
+)
+
+# -- Integers are stored in signed 64 bit arrays. Python 2 has no 64 bit
+# -- typecode, so there we use the platform's long, which may be smaller
+try:
+    _INT_TYPECODE = array('q').typecode
+
+except ValueError:
+    _INT_TYPECODE = 'l'
+
+_INT_BITS = array(_INT_TYPECODE).itemsize * 8
+
+# -- We only consider strings short enough to always fit within the array.
+# -- We also only consider strings which round trip through int (so no
+# -- leading zeros, signs or whitespace)
+_INT_STRING = re.compile(
+    r'(?:0|[1-9][0-9]{0,%s})\Z' % (18 if _INT_BITS >= 64 else 8),
+)
+
+
+# ------------------------------------------------------------------------------
+class CompactResult(object):
+    """
+    A read-only sequence of records which stores the records compactly. New
+    records can be added with append, which is how results are collected as
+    they are read from p4.
+
+    :param records: Optional iterable of dictionaries to populate from
+    :type records: iterable
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, records=None):
+
+        # -- Every unique set of fields has a schema
+        self._schemas = list()
+        self._schema_ids = dict()
+
+        # -- For each record we store which schema it uses and its index
+        # -- within that schema
+        self._row_schemas = array('I')
+        self._row_indices = array('I')
+
+        # -- Directory prefixes shared between all the path columns
+        self._prefixes = list()
+        self._prefix_ids = dict()
+
+        for record in records or []:
+            self.append(record)
+
+    # --------------------------------------------------------------------------
+    def append(self, record):
+        """
+        Adds a record to the result set.
+
+        :param record: The record to add
+        :type record: dict
+
+        :return: None
+        """
+        keys = tuple(record)
+        schema_id = self._schema_ids.get(keys)
+
+        if schema_id is None:
+            schema_id = len(self._schemas)
+            self._schemas.append(_Schema(keys, self))
+            self._schema_ids[keys] = schema_id
+
+        schema = self._schemas[schema_id]
+
+        self._row_schemas.append(schema_id)
+        self._row_indices.append(schema.append(record))
+
+    # --------------------------------------------------------------------------
+    def extend(self, records):
+        """
+        Adds all the given records to the result set.
+
+        :param records: The records to add
+        :type records: iterable
+
+        :return: None
+        """
+        for record in records:
+            self.append(record)
+
+    # --------------------------------------------------------------------------
+    def to_list(self):
+        """
+        Returns all the records as a list of regular dictionaries.
+
+        :return: list(dict, ...)
+        """
+        return [record.to_dict() for record in self]
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._row_schemas)
+
+    # --------------------------------------------------------------------------
+    def __bool__(self):
+        return bool(self._row_schemas)
+
+    __nonzero__ = __bool__
+
+    # --------------------------------------------------------------------------
+    def __iter__(self):
+        schemas = self._schemas
+
+        for schema_id, index in zip(self._row_schemas, self._row_indices):
+            yield CompactRecord(schemas[schema_id], index)
+
+    # --------------------------------------------------------------------------
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[idx] for idx in range(*item.indices(len(self)))]
+
+        return CompactRecord(
+            self._schemas[self._row_schemas[item]],
+            self._row_indices[item],
+        )
+
+    # --------------------------------------------------------------------------
+    def __repr__(self):
+        return '<CompactResult: %s records>' % len(self)
+
+    # --------------------------------------------------------------------------
+    def _prefix_id(self, prefix):
+        """
+        Returns the id of the given directory prefix, registering it if it
+        has not been seen before.
+
+        :param prefix: The directory prefix
+        :type prefix: str
+
+        :return: int
+        """
+        prefix_id = self._prefix_ids.get(prefix)
+
+        if prefix_id is None:
+            prefix_id = len(self._prefixes)
+            self._prefixes.append(prefix)
+            self._prefix_ids[prefix] = prefix_id
+
+        return prefix_id
+
+
+# ------------------------------------------------------------------------------
+class CompactRecord(object):
+    """
+    A read-only, dictionary-like view of a single record within a
+    CompactResult.
+    """
+
+    __slots__ = (
+        '_schema',
+        '_index',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, schema, index):
+        self._schema = schema
+        self._index = index
+
+    # --------------------------------------------------------------------------
+    def get(self, key, default=None):
+        column = self._schema.columns.get(key)
+
+        if column is None:
+            return default
+
+        return column.get(self._index)
+
+    # --------------------------------------------------------------------------
+    def keys(self):
+        return list(self._schema.keys)
+
+    # --------------------------------------------------------------------------
+    def values(self):
+        return [self[key] for key in self._schema.keys]
+
+    # --------------------------------------------------------------------------
+    def items(self):
+        return [(key, self[key]) for key in self._schema.keys]
+
+    # --------------------------------------------------------------------------
+    def to_dict(self):
+        """
+        Returns the record as a regular dictionary.
+
+        :return: dict
+        """
+        return dict(self.items())
+
+    # --------------------------------------------------------------------------
+    def __getitem__(self, key):
+        return self._schema.columns[key].get(self._index)
+
+    # --------------------------------------------------------------------------
+    def __contains__(self, key):
+        return key in self._schema.columns
+
+    # --------------------------------------------------------------------------
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._schema.keys)
+
+    # --------------------------------------------------------------------------
+    def __eq__(self, other):
+        if isinstance(other, CompactRecord):
+            other = other.to_dict()
+
+        return self.to_dict() == other
+
+    # --------------------------------------------------------------------------
+    def __ne__(self, other):
+        return not self == other
+
+    # --------------------------------------------------------------------------
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+# ------------------------------------------------------------------------------
+class _Schema(object):
+    """
+    Private class which holds the columns of all the records sharing the
+    same set of fields.
+    """
+
+    __slots__ = (
+        'keys',
+        'columns',
+        'count',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, keys, result):
+        self.keys = keys
+        self.count = 0
+        self.columns = dict(
+            (
+                key,
+                _PathColumn(result) if key in PATH_FIELDS else _ValueColumn(),
+            )
+            for key in keys
+        )
+
+    # --------------------------------------------------------------------------
+    def append(self, record):
+        """
+        Adds the values of the given record to the columns, returning the
+        index of the record within this schema.
+
+        :param record: The record to add
+        :type record: dict
+
+        :return: int
+        """
+        columns = self.columns
+
+        for key, value in record.items():
+            columns[key].append(value)
+
+        self.count += 1
+        return self.count - 1
+
+
+# ------------------------------------------------------------------------------
+class _ValueColumn(object):
+    """
+    Private class which stores the values of a single field. Whilst every
+    value is an integer (or a string holding a plain integer) the values
+    are held in a typed array, otherwise they are held in a list.
+    """
+
+    __slots__ = (
+        '_values',
+        '_kind',
+    )
+
+    # -- The kinds of values a column can hold
+    _STRINGS = 0
+    _INT_STRINGS = 1
+    _INTS = 2
+
+    # --------------------------------------------------------------------------
+    def __init__(self):
+        self._values = None
+        self._kind = None
+
+    # --------------------------------------------------------------------------
+    def append(self, value):
+        kind = self._kind
+
+        if kind == self._INT_STRINGS:
+            if is_int_string(value):
+                self._values.append(int(value))
+                return
+
+            self._to_objects()
+
+        elif kind == self._INTS:
+            if value.__class__ is int and _fits(value):
+                self._values.append(value)
+                return
+
+            self._to_objects()
+
+        elif kind is None:
+            if is_int_string(value):
+                self._kind = self._INT_STRINGS
+                self._values = array(_INT_TYPECODE, [int(value)])
+                return
+
+            if value.__class__ is int and _fits(value):
+                self._kind = self._INTS
+                self._values = array(_INT_TYPECODE, [value])
+                return
+
+            self._kind = self._STRINGS
+            self._values = list()
+
+        self._values.append(value)
+
+    # --------------------------------------------------------------------------
+    def get(self, index):
+        value = self._values[index]
+
+        if self._kind == self._INT_STRINGS:
+            return str(value)
+
+        return value
+
+    # --------------------------------------------------------------------------
+    def _to_objects(self):
+        """
+        Converts the column from a typed array to a list of the original
+        values, which happens when a value is given which the array cannot
+        represent.
+        """
+        if self._kind == self._INT_STRINGS:
+            self._values = [str(value) for value in self._values]
+
+        else:
+            self._values = list(self._values)
+
+        self._kind = self._STRINGS
+
+
+# ------------------------------------------------------------------------------
+class _PathColumn(object):
+    """
+    Private class which stores paths, sharing the directory of each path
+    between all the records of the result.
+    """
+
+    __slots__ = (
+        '_result',
+        '_prefixes',
+        '_names',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, result):
+        self._result = result
+        self._prefixes = array('I')
+        self._names = list()
+
+    # --------------------------------------------------------------------------
+    def append(self, value):
+        if isinstance(value, str):
+            split_idx = value.rfind('/') + 1
+
+            if not split_idx:
+                split_idx = value.rfind('\\') + 1
+
+        else:
+            split_idx = 0
+
+        # -- Prefix zero is reserved for values which have no prefix, which
+        # -- also allows us to store values which are not strings
+        if split_idx:
+            prefix_id = self._result._prefix_id(value[:split_idx]) + 1
+            value = value[split_idx:]
+
+        else:
+            prefix_id = 0
+
+        self._prefixes.append(prefix_id)
+        self._names.append(value)
+
+    # --------------------------------------------------------------------------
+    def get(self, index):
+        prefix_id = self._prefixes[index]
+
+        if not prefix_id:
+            return self._names[index]
+
+        return self._result._prefixes[prefix_id - 1] + self._names[index]
+
+
+# ------------------------------------------------------------------------------
+def is_int_string(value):
+    """
+    Determines whether a value is a string holding a plain, non-negative
+    integer which can be stored in an array and converted back to exactly
+    the same string. This is shared by xpf.tables.
+
+    :param value: The value to test
+
+    :return: bool
+    """
+    return value.__class__ is str and _INT_STRING.match(value) is not None
+
+
+# ------------------------------------------------------------------------------
+def _fits(value):
+    """
+    Private function which determines whether an integer fits within our
+    integer arrays.
+
+    :param value: The integer to test
+    :type value: int
+
+    :return: bool
+    """
+    return -(2 ** (_INT_BITS - 1)) <= value < 2 ** (_INT_BITS - 1)
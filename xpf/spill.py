@@ -0,0 +1,360 @@
+"""
+This module allows very large results to be held on disk rather than in
+memory. Whilst a call is running its records are collected in memory as
+usual, but once their estimated size exceeds the memory budget (see
+xpf.variables.set_result_memory_budget) every record is written to a
+temporary file instead, along with the offset at which each record starts.
+
+Spilling is opt-in, as no budget is set by default. Once a budget is set,
+the caller is given a SpilledResult rather than a list for any call which
+exceeds it. This is a sequence which supports len, iteration, indexing,
+slicing, comparison, concatenation (giving a list), in, index and count,
+reading each record back from a memory map of the file as it is accessed.
+Records can also be appended or extended, which writes them to the end of
+the file:
+
+```python
+import xpf
+
+xpf.variables.set_result_memory_budget(256 * 1024 * 1024)
+
+results = xpf.direct.fstat('//depot/...')
+
+print(len(results), results[0]['depotFile'], results[-1]['depotFile'])
+
+for record in results:
+    print(record['depotFile'])
+```
+
+Results which fit within the budget are returned as a regular list, so
+callers only see a SpilledResult when a call would otherwise have risked
+exhausting memory. It is not a list though, so anything which needs one
+(such as isinstance checks, json.dump or altering records in place) must
+call to_list(), which reads every record back into memory. The temporary
+file is removed once the SpilledResult is no longer referenced.
+"""
+import mmap
+import marshal
+import functools
+import tempfile
+from array import array
+
+try:
+    from collections.abc import Sequence
+
+except ImportError:
+    from collections import Sequence
+
+
+# -- The estimated overhead (in bytes) of each record and field
+_RECORD_OVERHEAD = 64
+_FIELD_OVERHEAD = 16
+
+# -- Offsets are held in a 64 bit array so that files over 2GB can be
+# -- addressed. Python 2 has no such array, so there we use a list
+try:
+    array('q')
+    _new_offsets = functools.partial(array, 'q')
+
+except ValueError:
+    _new_offsets = list
+
+
+# ------------------------------------------------------------------------------
+def estimate_size(record):
+    """
+    Estimates the memory used by a single record.
+
+    :param record: The record to estimate the size of
+    :type record: dict
+
+    :return: int
+    """
+    size = _RECORD_OVERHEAD
+
+    if not isinstance(record, dict):
+        return size + len(record)
+
+    for key, value in record.items():
+        size += _FIELD_OVERHEAD + len(key)
+
+        if isinstance(value, str):
+            size += len(value)
+
+    return size
+
+
+# ------------------------------------------------------------------------------
+class Collector(object):
+    """
+    Collects the records of a call, holding them in memory until their
+    estimated size exceeds the given budget, after which they are written
+    to a temporary file.
+
+    :param budget: The estimated size (in bytes) the records may take up in
+        memory before they are written to disk
+    :type budget: int
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, budget):
+        self.budget = budget
+
+        self._records = list()
+        self._size = 0
+
+        # -- Only created once the budget has been exceeded
+        self._file = None
+        self._offsets = None
+        self._position = 0
+
+    # --------------------------------------------------------------------------
+    def append(self, record):
+        """
+        Adds a record to the results.
+
+        :param record: The record to add
+        :type record: dict
+
+        :return: None
+        """
+        if self._file is not None:
+            self._write(record)
+            return
+
+        self._records.append(record)
+        self._size += estimate_size(record)
+
+        if self._size > self.budget:
+            self._spill()
+
+    # --------------------------------------------------------------------------
+    def finish(self):
+        """
+        Returns the collected records, as a list if they fitted within the
+        budget or as a SpilledResult if they did not. No further records
+        should be appended once this has been called.
+
+        :return: list(dict, ...) or SpilledResult
+        """
+        if self._file is None:
+            return self._records
+
+        # -- The end of the last record is stored so that every record can
+        # -- be read as the span between two offsets
+        self._offsets.append(self._position)
+        self._file.flush()
+
+        return SpilledResult(self._file, self._offsets)
+
+    # --------------------------------------------------------------------------
+    def _spill(self):
+        """
+        Moves every record collected so far out to a temporary file.
+
+        :return: None
+        """
+        self._file = tempfile.TemporaryFile(prefix='xpf_')
+        self._offsets = _new_offsets()
+
+        for record in self._records:
+            self._write(record)
+
+        self._records = list()
+        self._size = 0
+
+    # --------------------------------------------------------------------------
+    def _write(self, record):
+        """
+        Writes a single record to the end of the temporary file.
+
+        :return: None
+        """
+        data = marshal.dumps(record)
+
+        self._offsets.append(self._position)
+        self._file.write(data)
+        self._position += len(data)
+
+
+# ------------------------------------------------------------------------------
+class SpilledResult(Sequence):
+    """
+    A sequence of records held within a temporary file. Records are read
+    back from a memory map of the file as they are accessed, so only the
+    records being used are ever held in memory.
+
+    :param file_: The temporary file the records were written to
+    :type file_: file
+
+    :param offsets: The offset each record starts at, followed by the offset
+        at which the last record ends
+    :type offsets: array or list
+    """
+
+    # -- Like a list, this cannot be hashed
+    __hash__ = None
+
+    # --------------------------------------------------------------------------
+    def __init__(self, file_, offsets):
+        self._file = file_
+        self._offsets = offsets
+        self._map = None
+
+        self._open_map()
+
+    # --------------------------------------------------------------------------
+    def to_list(self):
+        """
+        Returns all the records as a list. Note that this reads every record
+        back into memory.
+
+        :return: list(dict, ...)
+        """
+        return list(self)
+
+    # --------------------------------------------------------------------------
+    def copy(self):
+        """
+        Returns a shallow copy of the records as a list, as list.copy does.
+        Note that this reads every record back into memory.
+
+        :return: list(dict, ...)
+        """
+        return self.to_list()
+
+    # --------------------------------------------------------------------------
+    def append(self, record):
+        """
+        Adds a record to the end of the results, writing it to the file.
+
+        :param record: The record to add
+        :type record: dict
+
+        :return: None
+        """
+        self.extend([record])
+
+    # --------------------------------------------------------------------------
+    def extend(self, records):
+        """
+        Adds the given records to the end of the results, writing them to
+        the file.
+
+        :param records: The records to add
+
+        :return: None
+        """
+        records = [marshal.dumps(record) for record in records]
+
+        if not records:
+            return
+
+        position = self._offsets[-1]
+        self._file.seek(position)
+
+        for data in records:
+            self._file.write(data)
+            position += len(data)
+            self._offsets.append(position)
+
+        self._file.flush()
+        self._open_map()
+
+    # --------------------------------------------------------------------------
+    def _open_map(self):
+        """
+        Private method which maps the file into memory, replacing any
+        previous map as the file may have grown.
+
+        :return: None
+        """
+        if self._map is not None:
+            self._map.close()
+
+        self._map = mmap.mmap(
+            self._file.fileno(),
+            0,
+            access=mmap.ACCESS_READ,
+        )
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    # --------------------------------------------------------------------------
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    # --------------------------------------------------------------------------
+    def __iter__(self):
+        map_ = self._map
+        offsets = self._offsets
+
+        for idx in range(len(offsets) - 1):
+            yield marshal.loads(map_[offsets[idx]:offsets[idx + 1]])
+
+    # --------------------------------------------------------------------------
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[idx] for idx in range(*item.indices(len(self)))]
+
+        count = len(self)
+
+        if item < 0:
+            item += count
+
+        if not 0 <= item < count:
+            raise IndexError('SpilledResult index out of range')
+
+        return marshal.loads(
+            self._map[self._offsets[item]:self._offsets[item + 1]],
+        )
+
+    # --------------------------------------------------------------------------
+    def __add__(self, other):
+        if not isinstance(other, (list, SpilledResult)):
+            return NotImplemented
+
+        return self.to_list() + list(other)
+
+    # --------------------------------------------------------------------------
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+
+        return other + self.to_list()
+
+    # --------------------------------------------------------------------------
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    # --------------------------------------------------------------------------
+    def __eq__(self, other):
+        if not isinstance(other, (list, SpilledResult)):
+            return NotImplemented
+
+        if len(self) != len(other):
+            return False
+
+        for record, other_record in zip(self, other):
+            if record != other_record:
+                return False
+
+        return True
+
+    # --------------------------------------------------------------------------
+    def __ne__(self, other):
+        result = self.__eq__(other)
+
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    # --------------------------------------------------------------------------
+    def __repr__(self):
+        return '<SpilledResult: %s records>' % len(self)
@@ -0,0 +1,388 @@
+"""
+This module holds a columnar representation of results. This is useful
+when results are pulled only to compute sums, sorts or filters over
+numeric fields such as fileSize, headTime or change.
+
+Numeric fields are decoded straight into typed arrays as the records are
+read. If NumPy is available columns are returned as NumPy arrays, allowing
+aggregations to be vectorised:
+
+```python
+import xpf
+
+table = xpf.direct.sizes('//depot/...', as_table=True)
+
+total_size = sum(table.column('fileSize'))
+newest = max(table.column('headTime'))
+```
+
+Existing results can also be converted with xpf.tables.as_table(results).
+"""
+from array import array
+
+from .records import is_int_string
+
+try:
+    import numpy
+
+except ImportError:
+    numpy = None
+
+
+# -- The fields which are always numeric, and therefore stored in typed
+# -- arrays rather than as strings
+NUMERIC_FIELDS = frozenset(
+    [
+        'change',
+        'dirCount',
+        'fileCount',
+        'fileSize',
+        'haveRev',
+        'headChange',
+        'headModTime',
+        'headRev',
+        'headTime',
+        'rev',
+        'time',
+    ]
+)
+
+# -- The value held within numeric columns for records which do not have
+# -- the field. This is zero so it does not affect sums, but as it cannot be
+# -- told apart from a real zero use Table.present to know which records
+# -- have the field
+MISSING = 0
+
+# -- The typecode of numeric columns. Python 2 has no 64 bit typecode so
+# -- there we use the platform's long, and any value which does not fit
+# -- turns the column into a regular column
+try:
+    _INT_TYPECODE = array('q').typecode
+
+except ValueError:
+    _INT_TYPECODE = 'l'
+
+
+# ------------------------------------------------------------------------------
+def as_table(records, numeric_fields=None):
+    """
+    Converts the given records into a Table.
+
+    :param records: The records to convert, typically the result of an
+        xpf.direct call
+    :type records: list(dict, ...)
+
+    :param numeric_fields: Optional fields to treat as numeric, in addition
+        to xpf.tables.NUMERIC_FIELDS
+    :type numeric_fields: list(str, ...)
+
+    :return: Table
+    """
+    table = Table(numeric_fields=numeric_fields)
+
+    for record in records or []:
+        table.append(record)
+
+    return table
+
+
+# ------------------------------------------------------------------------------
+class Table(object):
+    """
+    Holds records as a set of named columns. Numeric columns are held in
+    typed arrays (with records missing the field given xpf.tables.MISSING,
+    and tracked separately so they can be told apart from real values) and
+    all other columns are held in lists (with records missing the field
+    given None).
+
+    Indexing the table with a field name gives the column, whilst indexing
+    it with an integer (or a slice) gives the row (or rows) as dictionaries,
+    just as indexing a regular result would.
+
+    :param numeric_fields: Optional fields to treat as numeric, in addition
+        to xpf.tables.NUMERIC_FIELDS
+    :type numeric_fields: list(str, ...)
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, numeric_fields=None):
+        self.numeric_fields = NUMERIC_FIELDS.union(numeric_fields or [])
+
+        self._columns = dict()
+        self._count = 0
+
+    # --------------------------------------------------------------------------
+    def append(self, record):
+        """
+        Adds a record to the table.
+
+        :param record: The record to add
+        :type record: dict
+
+        :return: None
+        """
+        columns = self._columns
+
+        for key, value in record.items():
+            column = columns.get(key)
+
+            if column is None:
+                column = self._add_column(key)
+
+            column.append(value)
+
+        self._count += 1
+
+        # -- Any columns this record does not have need padding
+        if len(record) != len(columns):
+            for column in columns.values():
+                if len(column) < self._count:
+                    column.append_missing()
+
+    # --------------------------------------------------------------------------
+    def column(self, name):
+        """
+        Returns all the values of the given column. Numeric columns are
+        returned as NumPy integer arrays if NumPy is available, otherwise as
+        array.array instances. All other columns are returned as lists.
+
+        If any records do not have a numeric field the NumPy array is a
+        masked array with those records masked out, so they are ignored by
+        aggregations. Without NumPy they hold xpf.tables.MISSING, see
+        present.
+
+        :param name: The field name of the column
+        :type name: str
+
+        :return: numpy.ndarray, array.array or list
+        """
+        return self._columns[name].values()
+
+    # --------------------------------------------------------------------------
+    def columns(self):
+        """
+        Returns the names of all the columns within the table.
+
+        :return: list(str, ...)
+        """
+        return list(self._columns)
+
+    # --------------------------------------------------------------------------
+    def present(self, name):
+        """
+        Returns, for each row, whether the record had the given field.
+
+        :param name: The field name of the column
+        :type name: str
+
+        :return: list(bool, ...)
+        """
+        return self._columns[name].present()
+
+    # --------------------------------------------------------------------------
+    def is_numeric(self, name):
+        """
+        Returns True if the given column is held as a numeric column.
+
+        :param name: The field name of the column
+        :type name: str
+
+        :return: bool
+        """
+        return self._columns[name].numeric
+
+    # --------------------------------------------------------------------------
+    def row(self, index):
+        """
+        Returns a single row of the table as a dictionary. Fields which the
+        record did not have are omitted, and numeric fields are returned as
+        integers.
+
+        :param index: The index of the row
+        :type index: int
+
+        :return: dict
+        """
+        row = dict()
+
+        for name, column in self._columns.items():
+            value = column.get(index)
+
+            if value is not None:
+                row[name] = value
+
+        return row
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return self._count
+
+    # --------------------------------------------------------------------------
+    def __bool__(self):
+        return bool(self._count)
+
+    __nonzero__ = __bool__
+
+    # --------------------------------------------------------------------------
+    def __contains__(self, name):
+        return name in self._columns
+
+    # --------------------------------------------------------------------------
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.row(idx) for idx in range(*item.indices(self._count))]
+
+        if isinstance(item, int):
+            if item < 0:
+                item += self._count
+
+            if not 0 <= item < self._count:
+                raise IndexError('Table row index out of range')
+
+            return self.row(item)
+
+        return self.column(item)
+
+    # --------------------------------------------------------------------------
+    def __iter__(self):
+        for index in range(self._count):
+            yield self.row(index)
+
+    # --------------------------------------------------------------------------
+    def __repr__(self):
+        return '<Table: %s rows, %s columns>' % (self._count, len(self._columns))
+
+    # --------------------------------------------------------------------------
+    def _add_column(self, name):
+        """
+        Adds a new column, padding it for all the records which have already
+        been added.
+
+        :param name: The field name of the column
+        :type name: str
+
+        :return: _Column
+        """
+        column = _Column(name in self.numeric_fields)
+
+        for _ in range(self._count):
+            column.append_missing()
+
+        self._columns[name] = column
+        return column
+
+
+# ------------------------------------------------------------------------------
+class _Column(object):
+    """
+    Private class holding the values of a single column. Numeric columns
+    which are given a value that is not an integer are converted to regular
+    columns so that no data is lost.
+    """
+
+    __slots__ = (
+        'numeric',
+        '_values',
+        '_present',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self._values = array(_INT_TYPECODE) if numeric else list()
+
+        # -- Whether each value of a numeric column is present, which is only
+        # -- created once a value is missing
+        self._present = None
+
+    # --------------------------------------------------------------------------
+    def append(self, value):
+        if self.numeric:
+            # -- Strings are only held as integers if they convert back to
+            # -- exactly the same string, so "007" or "-0" are never altered
+            if value.__class__ is int or is_int_string(value):
+                try:
+                    self._values.append(int(value))
+
+                except OverflowError:
+                    pass
+
+                else:
+                    if self._present is not None:
+                        self._present.append(1)
+
+                    return
+
+            self._to_list()
+
+        self._values.append(value)
+
+    # --------------------------------------------------------------------------
+    def append_missing(self):
+        if not self.numeric:
+            self._values.append(None)
+            return
+
+        if self._present is None:
+            self._present = bytearray(b'\x01') * len(self._values)
+
+        self._values.append(MISSING)
+        self._present.append(0)
+
+    # --------------------------------------------------------------------------
+    def get(self, index):
+        value = self._values[index]
+
+        if self._present is not None and not self._present[index]:
+            return None
+
+        return value
+
+    # --------------------------------------------------------------------------
+    def present(self):
+        if not self.numeric:
+            return [value is not None for value in self._values]
+
+        if self._present is None:
+            return [True] * len(self._values)
+
+        return [bool(flag) for flag in self._present]
+
+    # --------------------------------------------------------------------------
+    def values(self):
+        if not self.numeric:
+            return self._values
+
+        if numpy is not None:
+            values = numpy.frombuffer(
+                self._values,
+                dtype='i%s' % self._values.itemsize,
+            ).copy()
+
+            if self._present is None:
+                return values
+
+            return numpy.ma.masked_array(
+                values,
+                mask=numpy.frombuffer(bytes(self._present), dtype=numpy.uint8) == 0,
+            )
+
+        return array(_INT_TYPECODE, self._values)
+
+    # --------------------------------------------------------------------------
+    def _to_list(self):
+        """
+        Converts a numeric column into a regular column.
+        """
+        present = self._present or bytearray(b'\x01') * len(self._values)
+
+        self._values = [
+            str(value) if flag else None
+            for value, flag in zip(self._values, present)
+        ]
+        self._present = None
+        self.numeric = False
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._values)
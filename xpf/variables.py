@@ -6,6 +6,8 @@ The utilisation of getters/setters is to ensure no single module caches
 the result of a variable after its changed. Variables should only be
 accessed via the functions and never directly.
 """
+import os
+
 # -- This is what we use to track whether our server is accessible.
 # -- A value of -1 means the status test has not been performed. True means
 # -- the server is accessible and False means the server is not accesible.
@@ -30,6 +32,65 @@ _DEBUG = False
 # -- Stores the currently active host as defined in p4 set
 _HOST = None
 
+# -- When the file arguments given to a call exceed either of these limits
+# -- (number of arguments or total characters) they are passed to p4 as an
+# -- argument file rather than on the command line
+_ARG_INPUT_COUNT = 200
+_ARG_INPUT_SIZE = 8192
+
+# -- If true calls are serviced by a single shared reactor thread rather
+# -- than each having a thread of their own (where the platform allows)
+_USE_REACTOR = False
+
+# -- The time (in seconds) small read only queries are gathered for so that
+# -- those made at the same time can be combined. Zero disables this.
+_COALESCE_WINDOW = 0
+
+# -- If true, identical read only calls made whilst one is already running
+# -- wait on the running call rather than starting another
+_SINGLE_FLIGHT = False
+
+# -- If true the results of read only calls are cached (see xpf.cache)
+# -- within the given number of entries and estimated size in bytes
+_USE_CACHE = False
+_CACHE_MAX_ENTRIES = 1024
+_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# -- The directory file content is cached within (see xpf.content) and the
+# -- maximum size (in bytes) that content may take up
+_CONTENT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.xpf', 'content')
+_CONTENT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# -- If true the results of queries which can never change are stored
+# -- permanently in the given database (see xpf.metadata)
+_USE_METADATA_CACHE = False
+_METADATA_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'),
+    '.xpf',
+    'metadata.sqlite3',
+)
+
+# -- If true the assist queries of have, opened and changelist state are
+# -- answered from a local index of the workspace (see xpf.workspace). The
+# -- timeout is used when building or refreshing that index, and each index
+# -- is held within the given directory
+_USE_WORKSPACE_INDEX = False
+_WORKSPACE_INDEX_TIMEOUT = 300
+_WORKSPACE_INDEX_DIR = os.path.join(
+    os.path.expanduser('~'),
+    '.xpf',
+    'workspaces',
+)
+
+# -- If true the assist queries of which change files are opened in are
+# -- answered from an in-memory index of the opened files (see xpf.opened)
+_USE_OPENED_INDEX = False
+
+# -- The estimated size (in bytes) the records of a single call may take up
+# -- in memory before they are written to a temporary file instead (see
+# -- xpf.spill). None holds every result in memory
+_RESULT_MEMORY_BUDGET = None
+
 
 # ------------------------------------------------------------------------------
 def get_server_status():
@@ -106,3 +167,190 @@ def get_host():
 def set_host(value):
     global _HOST
     _HOST = value
+
+
+# ------------------------------------------------------------------------------
+def get_arg_input_count():
+    return _ARG_INPUT_COUNT
+
+
+# ------------------------------------------------------------------------------
+def set_arg_input_count(value):
+    global _ARG_INPUT_COUNT
+    _ARG_INPUT_COUNT = value
+
+
+# ------------------------------------------------------------------------------
+def get_arg_input_size():
+    return _ARG_INPUT_SIZE
+
+
+# ------------------------------------------------------------------------------
+def set_arg_input_size(value):
+    global _ARG_INPUT_SIZE
+    _ARG_INPUT_SIZE = value
+
+
+# ------------------------------------------------------------------------------
+def get_use_reactor():
+    return _USE_REACTOR
+
+
+# ------------------------------------------------------------------------------
+def set_use_reactor(value):
+    global _USE_REACTOR
+    _USE_REACTOR = value
+
+
+# ------------------------------------------------------------------------------
+def get_coalesce_window():
+    return _COALESCE_WINDOW
+
+
+# ------------------------------------------------------------------------------
+def set_coalesce_window(value):
+    global _COALESCE_WINDOW
+    _COALESCE_WINDOW = value
+
+
+# ------------------------------------------------------------------------------
+def get_single_flight():
+    return _SINGLE_FLIGHT
+
+
+# ------------------------------------------------------------------------------
+def set_single_flight(value):
+    global _SINGLE_FLIGHT
+    _SINGLE_FLIGHT = value
+
+
+# ------------------------------------------------------------------------------
+def get_use_cache():
+    return _USE_CACHE
+
+
+# ------------------------------------------------------------------------------
+def set_use_cache(value):
+    global _USE_CACHE
+    _USE_CACHE = value
+
+
+# ------------------------------------------------------------------------------
+def get_cache_max_entries():
+    return _CACHE_MAX_ENTRIES
+
+
+# ------------------------------------------------------------------------------
+def set_cache_max_entries(value):
+    global _CACHE_MAX_ENTRIES
+    _CACHE_MAX_ENTRIES = value
+
+
+# ------------------------------------------------------------------------------
+def get_cache_max_bytes():
+    return _CACHE_MAX_BYTES
+
+
+# ------------------------------------------------------------------------------
+def set_cache_max_bytes(value):
+    global _CACHE_MAX_BYTES
+    _CACHE_MAX_BYTES = value
+
+
+# ------------------------------------------------------------------------------
+def get_content_cache_dir():
+    return _CONTENT_CACHE_DIR
+
+
+# ------------------------------------------------------------------------------
+def set_content_cache_dir(value):
+    global _CONTENT_CACHE_DIR
+    _CONTENT_CACHE_DIR = value
+
+
+# ------------------------------------------------------------------------------
+def get_content_cache_max_bytes():
+    return _CONTENT_CACHE_MAX_BYTES
+
+
+# ------------------------------------------------------------------------------
+def set_content_cache_max_bytes(value):
+    global _CONTENT_CACHE_MAX_BYTES
+    _CONTENT_CACHE_MAX_BYTES = value
+
+
+# ------------------------------------------------------------------------------
+def get_use_metadata_cache():
+    return _USE_METADATA_CACHE
+
+
+# ------------------------------------------------------------------------------
+def set_use_metadata_cache(value):
+    global _USE_METADATA_CACHE
+    _USE_METADATA_CACHE = value
+
+
+# ------------------------------------------------------------------------------
+def get_metadata_cache_path():
+    return _METADATA_CACHE_PATH
+
+
+# ------------------------------------------------------------------------------
+def set_metadata_cache_path(value):
+    global _METADATA_CACHE_PATH
+    _METADATA_CACHE_PATH = value
+
+
+# ------------------------------------------------------------------------------
+def get_use_workspace_index():
+    return _USE_WORKSPACE_INDEX
+
+
+# ------------------------------------------------------------------------------
+def set_use_workspace_index(value):
+    global _USE_WORKSPACE_INDEX
+    _USE_WORKSPACE_INDEX = value
+
+
+# ------------------------------------------------------------------------------
+def get_workspace_index_timeout():
+    return _WORKSPACE_INDEX_TIMEOUT
+
+
+# ------------------------------------------------------------------------------
+def set_workspace_index_timeout(value):
+    global _WORKSPACE_INDEX_TIMEOUT
+    _WORKSPACE_INDEX_TIMEOUT = value
+
+
+# ------------------------------------------------------------------------------
+def get_workspace_index_dir():
+    return _WORKSPACE_INDEX_DIR
+
+
+# ------------------------------------------------------------------------------
+def set_workspace_index_dir(value):
+    global _WORKSPACE_INDEX_DIR
+    _WORKSPACE_INDEX_DIR = value
+
+
+# ------------------------------------------------------------------------------
+def get_use_opened_index():
+    return _USE_OPENED_INDEX
+
+
+# ------------------------------------------------------------------------------
+def set_use_opened_index(value):
+    global _USE_OPENED_INDEX
+    _USE_OPENED_INDEX = value
+
+
+# ------------------------------------------------------------------------------
+def get_result_memory_budget():
+    return _RESULT_MEMORY_BUDGET
+
+
+# ------------------------------------------------------------------------------
+def set_result_memory_budget(value):
+    global _RESULT_MEMORY_BUDGET
+    _RESULT_MEMORY_BUDGET = value
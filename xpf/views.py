@@ -0,0 +1,538 @@
+"""
+This module allows paths to be translated between depot, client and local
+syntax using the view of a client spec. The client spec is only queried
+once and then cached, meaning translations happen entirely in-process
+rather than needing a ``p4 where`` call per path.
+
+The view lines follow the same rules as perforce:
+
+    * ``...`` matches anything (including directory separators)
+    * ``*`` matches anything within a single directory
+    * ``%%1`` to ``%%9`` are positional wildcards within a single directory
+    * ``-`` prefixed lines exclude the paths they match
+    * ``+`` prefixed lines overlay (rather than replace) earlier lines
+    * ``&`` prefixed lines allow a depot path to map to multiple client paths
+    * Later lines take precedence over earlier lines
+
+```python
+import xpf
+
+view = xpf.views.get_view()
+
+local_path = view.depot_to_local('//depot/project/file.txt')
+depot_path = view.local_to_depot(local_path)
+```
+"""
+import os
+import re
+import threading
+
+from . import direct
+from . import variables
+
+
+# -- Client views are cached by port and client name
+_VIEWS = dict()
+_VIEWS_LOCK = threading.Lock()
+
+# -- Characters which perforce escapes within depot and client paths
+_ESCAPES = (
+    ('%', '%25'),
+    ('@', '%40'),
+    ('#', '%23'),
+    ('*', '%2A'),
+)
+
+# -- Matches each path within a view line, allowing for quoted paths
+_VIEW_TOKEN = re.compile(r'[-+&]?"[^"]*"|\S+')
+
+# -- Matches the wildcards within a view path
+_WILDCARD = re.compile(r'\.\.\.|\*|%%[1-9]')
+
+
+# ------------------------------------------------------------------------------
+def get_view(client=None, port=None, force=False, case_sensitive=None):
+    """
+    Returns the ClientView for the given client. The client spec is only
+    queried the first time it is requested, after which the cached view
+    is returned.
+
+    :param client: The client to get the view for. If not given the
+        currently active client is used.
+    :type client: str
+
+    :param port: The server to query. If not given the currently active
+        port is used.
+    :type port: str
+
+    :param force: If True the client spec will be re-queried even if
+        it has been cached.
+    :type force: bool
+
+    :param case_sensitive: Whether paths should be compared case sensitively.
+        If not given this defaults to False on Windows and True elsewhere.
+    :type case_sensitive: bool
+
+    :return: ClientView or None if the client spec could not be retrieved
+    """
+    client = client or variables.get_client()
+    port = port or variables.get_port()
+    key = (port, client)
+
+    if not force:
+        with _VIEWS_LOCK:
+            if key in _VIEWS:
+                return _VIEWS[key]
+
+    kwargs = dict()
+
+    if port:
+        kwargs['port'] = port
+
+    spec = direct.client('-o', client, **kwargs) if client else direct.client('-o', **kwargs)
+
+    if not spec or 'Root' not in spec[0]:
+        return None
+
+    view = ClientView(spec[0], case_sensitive=case_sensitive)
+
+    with _VIEWS_LOCK:
+        _VIEWS[key] = view
+
+    return view
+
+
+# ------------------------------------------------------------------------------
+def cached_view(client=None, port=None):
+    """
+    Returns the ClientView for the given client only if it has already been
+    cached. This will never query the server.
+
+    :param client: The client to get the view for. If not given the
+        currently active client is used.
+    :type client: str
+
+    :param port: The server the view was queried from. If not given the
+        currently active port is used.
+    :type port: str
+
+    :return: ClientView or None
+    """
+    key = (port or variables.get_port(), client or variables.get_client())
+
+    with _VIEWS_LOCK:
+        return _VIEWS.get(key)
+
+
+# ------------------------------------------------------------------------------
+def clear_cache():
+    """
+    Removes all the cached client views, forcing them to be re-queried
+    the next time they are requested.
+
+    :return: None
+    """
+    with _VIEWS_LOCK:
+        _VIEWS.clear()
+
+
+# ------------------------------------------------------------------------------
+def escape(path):
+    """
+    Escapes the characters within a local path which perforce requires to
+    be escaped in depot and client syntax.
+
+    :param path: Path to escape
+    :type path: str
+
+    :return: str
+    """
+    for character, escaped in _ESCAPES:
+        path = path.replace(character, escaped)
+
+    return path
+
+
+# ------------------------------------------------------------------------------
+def unescape(path):
+    """
+    Reverses the escaping of a depot or client path.
+
+    :param path: Path to unescape
+    :type path: str
+
+    :return: str
+    """
+    for character, escaped in reversed(_ESCAPES):
+        path = path.replace(escaped, character)
+        path = path.replace(escaped.lower(), character)
+
+    return path
+
+
+# ------------------------------------------------------------------------------
+class ClientView(object):
+    """
+    Represents the view of a single client spec, allowing paths to be
+    translated between depot, client and local syntax.
+
+    :param spec: The client spec as returned by ``p4 -G client -o``
+    :type spec: dict
+
+    :param case_sensitive: Whether paths should be compared case sensitively.
+        If not given this defaults to False on Windows and True elsewhere.
+    :type case_sensitive: bool
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, spec, case_sensitive=None):
+
+        if case_sensitive is None:
+            case_sensitive = os.name != 'nt'
+
+        self.name = spec['Client']
+        self.root = spec['Root']
+        self.case_sensitive = case_sensitive
+
+        self._client_prefix = '//%s/' % self.name
+        self._local_root = os.path.join(os.path.normpath(self.root), '')
+
+        # -- View lines are stored as View0, View1 etc, though we also
+        # -- support them being given as a list
+        lines = spec.get('View')
+
+        if lines is None:
+            lines = list()
+            while 'View%s' % len(lines) in spec:
+                lines.append(spec['View%s' % len(lines)])
+
+        self.mappings = [
+            _Mapping(line, idx, case_sensitive)
+            for idx, line in enumerate(lines)
+        ]
+
+        # -- Build our prefix indices, which allow us to quickly find the
+        # -- mappings which could possibly match a given path
+        self._index = dict(
+            lhs=self._build_index('lhs'),
+            rhs=self._build_index('rhs'),
+        )
+
+    # --------------------------------------------------------------------------
+    def depot_to_client(self, depot_path):
+        """
+        Translates a depot path to client syntax.
+
+        :param depot_path: Path in depot syntax (//depot/...)
+        :type depot_path: str
+
+        :return: str or None if the path is not mapped
+        """
+        return self._translate(depot_path, 'lhs', 'rhs')
+
+    # --------------------------------------------------------------------------
+    def client_to_depot(self, client_path):
+        """
+        Translates a client path to depot syntax.
+
+        :param client_path: Path in client syntax (//client/...)
+        :type client_path: str
+
+        :return: str or None if the path is not mapped
+        """
+        return self._translate(client_path, 'rhs', 'lhs')
+
+    # --------------------------------------------------------------------------
+    def client_to_local(self, client_path):
+        """
+        Translates a client path to a local filepath.
+
+        :param client_path: Path in client syntax (//client/...)
+        :type client_path: str
+
+        :return: str or None if the path is not within this client
+        """
+        if not self._startswith(client_path, self._client_prefix):
+            return None
+
+        relative_path = unescape(client_path[len(self._client_prefix):])
+
+        return os.path.join(
+            self._local_root,
+            os.path.normpath(relative_path),
+        )
+
+    # --------------------------------------------------------------------------
+    def local_to_client(self, local_path):
+        """
+        Translates a local filepath to client syntax.
+
+        :param local_path: Local filepath
+        :type local_path: str
+
+        :return: str or None if the path is not under the client root
+        """
+        local_path = os.path.abspath(local_path)
+
+        if not self._startswith(local_path, self._local_root):
+            return None
+
+        relative_path = local_path[len(self._local_root):].replace(os.sep, '/')
+
+        return self._client_prefix + escape(relative_path)
+
+    # --------------------------------------------------------------------------
+    def depot_to_local(self, depot_path):
+        """
+        Translates a depot path to a local filepath.
+
+        :param depot_path: Path in depot syntax (//depot/...)
+        :type depot_path: str
+
+        :return: str or None if the path is not mapped
+        """
+        client_path = self.depot_to_client(depot_path)
+
+        if client_path is None:
+            return None
+
+        return self.client_to_local(client_path)
+
+    # --------------------------------------------------------------------------
+    def local_to_depot(self, local_path):
+        """
+        Translates a local filepath to depot syntax.
+
+        :param local_path: Local filepath
+        :type local_path: str
+
+        :return: str or None if the path is not mapped
+        """
+        client_path = self.local_to_client(local_path)
+
+        if client_path is None:
+            return None
+
+        return self.client_to_depot(client_path)
+
+    # --------------------------------------------------------------------------
+    def _translate(self, path, source, target):
+        """
+        Translates a path from one side of the view to the other.
+
+        :param path: The path to translate
+        :param source: The side of the mapping the path is in (lhs or rhs)
+        :param target: The side of the mapping to translate to (lhs or rhs)
+
+        :return: str or None
+        """
+        # -- Later lines take precedence, so we find the last line which
+        # -- matches the path
+        for idx in self._candidates(path, source):
+            mapping = self.mappings[idx]
+            match = mapping.match(source, path)
+
+            if not match:
+                continue
+
+            if mapping.exclude:
+                return None
+
+            result = mapping.fill(target, match)
+
+            # -- If any later line claims the path we have translated to
+            # -- then this line has been overridden for this path. Overlay
+            # -- lines do not override the depot side and ditto lines do not
+            # -- override the client side.
+            for later_idx in self._candidates(result, target):
+                if later_idx <= idx:
+                    break
+
+                later = self.mappings[later_idx]
+
+                if target == 'rhs' and later.overlay:
+                    continue
+
+                if target == 'lhs' and later.ditto:
+                    continue
+
+                if later.match(target, result):
+                    return None
+
+            return result
+
+        return None
+
+    # --------------------------------------------------------------------------
+    def _candidates(self, path, side):
+        """
+        Returns the indices of the mappings which could match the given path,
+        in descending order.
+
+        :param path: The path being looked up
+        :param side: The side of the mappings to look at (lhs or rhs)
+
+        :return: list(int, int, ...)
+        """
+        index = self._index[side]
+
+        if not self.case_sensitive:
+            path = path.lower()
+
+        candidates = list()
+        position = path.find('/')
+
+        while position != -1:
+            candidates.extend(index.get(path[:position + 1], ()))
+            position = path.find('/', position + 1)
+
+        candidates.sort(reverse=True)
+        return candidates
+
+    # --------------------------------------------------------------------------
+    def _build_index(self, side):
+        """
+        Builds a dictionary of the directory prefix of each mapping (up to
+        its first wildcard) to the mapping indices with that prefix.
+
+        :param side: The side of the mappings to index (lhs or rhs)
+
+        :return: dict
+        """
+        index = dict()
+
+        for mapping in self.mappings:
+            prefix = mapping.prefix(side)
+
+            if not self.case_sensitive:
+                prefix = prefix.lower()
+
+            index.setdefault(prefix, []).append(mapping.index)
+
+        return index
+
+    # --------------------------------------------------------------------------
+    def _startswith(self, path, prefix):
+        if self.case_sensitive:
+            return path.startswith(prefix)
+
+        return path.lower().startswith(prefix.lower())
+
+
+# ------------------------------------------------------------------------------
+class _Mapping(object):
+    """
+    Private class representing a single line of a view, compiled into
+    regular expressions for matching and templates for translating.
+    """
+
+    __slots__ = (
+        'index',
+        'exclude',
+        'overlay',
+        'ditto',
+        '_sides',
+    )
+
+    # --------------------------------------------------------------------------
+    def __init__(self, line, index, case_sensitive):
+
+        self.index = index
+
+        paths = [
+            token.replace('"', '')
+            for token in _VIEW_TOKEN.findall(line)
+        ]
+
+        # -- The mapping type is defined by the leading character of the
+        # -- depot side
+        lhs = paths[0]
+        rhs = paths[1] if len(paths) > 1 else paths[0]
+
+        modifier = lhs[0] if lhs[0] in '-+&' else ''
+        lhs = lhs.lstrip('-+&')
+
+        self.exclude = modifier == '-'
+        self.overlay = modifier == '+'
+        self.ditto = modifier == '&'
+
+        flags = 0 if case_sensitive else re.IGNORECASE
+
+        self._sides = dict(
+            lhs=_compile_side(lhs, flags),
+            rhs=_compile_side(rhs, flags),
+        )
+
+    # --------------------------------------------------------------------------
+    def prefix(self, side):
+        return self._sides[side][0]
+
+    # --------------------------------------------------------------------------
+    def match(self, side, path):
+        return self._sides[side][1].match(path)
+
+    # --------------------------------------------------------------------------
+    def fill(self, side, match):
+        groups = match.groupdict()
+        return ''.join(
+            groups.get(piece, '') if is_wildcard else piece
+            for is_wildcard, piece in self._sides[side][2]
+        )
+
+
+# ------------------------------------------------------------------------------
+def _compile_side(path, flags):
+    """
+    Private function which compiles one side of a view line.
+
+    :param path: The path pattern to compile
+    :param flags: Regular expression flags to compile with
+
+    :return: tuple(prefix, regex, template) where prefix is the literal
+        directory prefix of the path, regex matches paths against the
+        pattern and template is a list of (is_wildcard, piece) tuples
+        used to fill the pattern.
+    """
+    pattern = list()
+    template = list()
+    seen = set()
+    wildcard_count = 0
+    position = 0
+
+    for match in _WILDCARD.finditer(path):
+        literal = path[position:match.start()]
+        pattern.append(re.escape(literal))
+        template.append((False, literal))
+
+        token = match.group()
+
+        # -- Positional wildcards are paired by their number, all other
+        # -- wildcards are paired by the order they occur in
+        if token.startswith('%%'):
+            name = 'p%s' % token[2:]
+
+        else:
+            name = 'w%s' % wildcard_count
+            wildcard_count += 1
+
+        if name in seen:
+            pattern.append('(?P=%s)' % name)
+
+        else:
+            expression = '.*' if token == '...' else '[^/]*'
+            pattern.append('(?P<%s>%s)' % (name, expression))
+            seen.add(name)
+
+        template.append((True, name))
+        position = match.end()
+
+    literal = path[position:]
+    pattern.append(re.escape(literal) + r'\Z')
+    template.append((False, literal))
+
+    # -- The prefix is the literal directory which contains the first
+    # -- wildcard (or the path itself if there are no wildcards)
+    first_literal = template[0][1]
+    prefix = first_literal[:first_literal.rfind('/') + 1]
+
+    return prefix, re.compile(''.join(pattern), flags), template
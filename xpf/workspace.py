@@ -0,0 +1,741 @@
+"""
+This module holds a local index of the state of a workspace - the files it
+has, the files it has open and the head revision data of those files. The
+index is stored in an SQLite database within
+xpf.variables.get_workspace_index_dir(), so it persists between sessions, and questions such as "do I have this file" or
+"which change is this file open in" are answered without asking the server.
+
+The index is built in full the first time it is used, and from then on is
+refreshed incrementally. Only the files which have changed since the last
+change the index has seen (p4 changes -m1) are queried again (p4 fstat -c),
+along with the (typically small) list of opened files:
+
+```python
+import xpf
+
+index = xpf.workspace.get_index()
+
+index.have('/usr/my_files/file.txt')
+index.is_opened('/usr/my_files/file.txt')
+index.changelist('//depot/my_files/file.txt')
+
+# -- Pick up any changes made on the server since the index was built
+index.refresh()
+```
+
+Any command run through xpf which may alter files (such as sync, edit or
+submit) marks the files it touched as out of date, and these are queried
+again the next time the index is read. Changes made outside of xpf (such as
+syncing through P4V) are only picked up by a full refresh:
+
+```python
+index.refresh(full=True)
+```
+
+The assist functions have, is_editable and changelist answer from the index
+when xpf.variables.get_use_workspace_index() is True. If the index cannot be
+built or brought up to date (for instance because the server could not be
+reached) they ask the server instead, and reading the index directly raises
+a RuntimeError rather than giving answers from incomplete data.
+
+If the sqlite3 module is not available no index is ever given.
+"""
+import os
+import hashlib
+import threading
+
+try:
+    import sqlite3
+
+except ImportError:
+    sqlite3 = None
+
+from . import views
+from . import commands
+from . import variables
+from . import connection
+
+
+# -- The fstat fields held for each file
+_FIELDS = (
+    'depotFile',
+    'clientFile',
+    'haveRev',
+    'headRev',
+    'headAction',
+    'headChange',
+    'headType',
+    'action',
+    'change',
+)
+
+# -- The columns each field is stored in
+_COLUMNS = (
+    'depot_file',
+    'client_file',
+    'have_rev',
+    'head_rev',
+    'head_action',
+    'head_change',
+    'head_type',
+    'action',
+    'change',
+)
+
+# -- Changing this forces existing indexes to be rebuilt
+_SCHEMA_VERSION = '1'
+
+# -- The indexes which have been opened, keyed by port, client and host
+_INDEXES = dict()
+_INDEXES_LOCK = threading.Lock()
+
+
+# ------------------------------------------------------------------------------
+def get_index(client=None, port=None):
+    """
+    Returns the WorkspaceIndex for the given client, opening (but not yet
+    building) it if it has not been requested before.
+
+    :param client: The client to get the index for. If not given the
+        currently active client is used.
+    :type client: str
+
+    :param port: The server the client belongs to. If not given the
+        currently active port is used.
+    :type port: str
+
+    :return: WorkspaceIndex or None if the server is not accessible, the
+        client root could not be found or sqlite3 is not available
+    """
+    if sqlite3 is None:
+        return None
+
+    # -- This also ensures the active client and port are known
+    if not connection.is_accessible():
+        return None
+
+    client = client or variables.get_client()
+    port = port or variables.get_port()
+    host = variables.get_host()
+    key = (port, client, host)
+
+    with _INDEXES_LOCK:
+        if key in _INDEXES:
+            return _INDEXES[key]
+
+    view = views.get_view(client=client, port=port)
+
+    if not view or not os.path.isdir(view.root):
+        return None
+
+    # -- The index is kept out of the client root, where p4 reconcile would
+    # -- find it, and a root shared between clients or hosts would share
+    # -- a database
+    name = hashlib.sha1(
+        ('%s|%s|%s' % (port or '', client or '', host or '')).encode('utf8'),
+    ).hexdigest()
+
+    index = WorkspaceIndex(
+        os.path.join(variables.get_workspace_index_dir(), name + '.sqlite3'),
+        client=client,
+        port=port,
+        host=host,
+    )
+
+    with _INDEXES_LOCK:
+        return _INDEXES.setdefault(key, index)
+
+
+# ------------------------------------------------------------------------------
+def close_all():
+    """
+    Closes every index which has been opened. The indexes themselves remain
+    on disk and are re-opened the next time they are requested.
+
+    :return: None
+    """
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+        _INDEXES.clear()
+
+    for index in indexes:
+        index.close()
+
+
+# ------------------------------------------------------------------------------
+def on_write(args, results):
+    """
+    The write hook registered with xpf.connection, which marks the files
+    affected by a command as out of date in every open index.
+
+    :param args: The flattened arguments of the command, starting with the
+        command itself, or None if they are not known
+    :type args: list(str, ...)
+
+    :param results: The results of the command
+
+    :return: None
+    """
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+
+    for index in indexes:
+        index.mark_written(args, results)
+
+
+# ------------------------------------------------------------------------------
+class WorkspaceIndex(object):
+    """
+    A local index of the files a client has and has opened, along with the
+    head revision data of those files.
+
+    :param path: The path of the SQLite database holding the index
+    :type path: str
+
+    :param client: The client being indexed
+    :type client: str
+
+    :param port: The server the client belongs to
+    :type port: str
+
+    :param host: The host the client is used from
+    :type host: str
+    """
+
+    # --------------------------------------------------------------------------
+    def __init__(self, path, client, port, host=None):
+        self.path = path
+        self.client = client
+        self.port = port
+        self.host = host
+
+        # -- Paths (and the prefixes of paths) which have been altered by
+        # -- our own commands and need to be queried again
+        self._pending_paths = set()
+        self._pending_prefixes = set()
+
+        # -- Set when something has changed which we cannot attribute to
+        # -- specific files, meaning the index must be rebuilt
+        self._stale = False
+
+        self._lock = threading.RLock()
+        self._connection = None
+
+    # --------------------------------------------------------------------------
+    @property
+    def last_change(self):
+        """
+        The most recent submitted change the index has been refreshed
+        against, or None if the index has never been built.
+
+        :return: int or None
+        """
+        with self._lock:
+            value = self._get_state('last_change')
+
+        return int(value) if value is not None else None
+
+    # --------------------------------------------------------------------------
+    def record(self, path):
+        """
+        Returns the indexed fstat fields of the given file, in the same form
+        fstat gives them.
+
+        If the index cannot be built, or files our own commands have altered
+        cannot be queried again, a RuntimeError is raised rather than an
+        answer being given from data we know to be incomplete.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: dict or None if the file is neither had nor opened
+        """
+        with self._lock:
+            if not self._ensure_current():
+                raise RuntimeError(
+                    'The workspace index of %s could not be brought up to '
+                    'date' % self.client
+                )
+
+            if path.startswith('//'):
+                condition = 'depot_file = ?'
+                value = path
+
+            else:
+                condition = 'local_key = ?'
+                value = _normalise(path)
+
+            row = self._db().execute(
+                'SELECT %s FROM files WHERE %s' % (', '.join(_COLUMNS), condition),
+                (value,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(
+            (field, str(value))
+            for field, value in zip(_FIELDS, row)
+            if value is not None
+        )
+
+    # --------------------------------------------------------------------------
+    def have(self, path):
+        """
+        Returns True if the workspace has a revision of the given file.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: bool
+        """
+        return 'haveRev' in (self.record(path) or {})
+
+    # --------------------------------------------------------------------------
+    def have_revision(self, path):
+        """
+        Returns the revision of the given file which the workspace has.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: int or None if the file is not had
+        """
+        record = self.record(path) or {}
+
+        if 'haveRev' not in record:
+            return None
+
+        return int(record['haveRev'])
+
+    # --------------------------------------------------------------------------
+    def is_opened(self, path):
+        """
+        Returns True if the given file is opened in the workspace.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: bool
+        """
+        return 'action' in (self.record(path) or {})
+
+    # --------------------------------------------------------------------------
+    def changelist(self, path):
+        """
+        Returns the change the given file is opened in.
+
+        :param path: The depot or local path of the file
+        :type path: str
+
+        :return: str ('default' or the change number) or None if the file is
+            not opened
+        """
+        return (self.record(path) or {}).get('change')
+
+    # --------------------------------------------------------------------------
+    def refresh(self, full=False):
+        """
+        Brings the index up to date with the server. Unless a full refresh
+        is requested only the files changed since the last refresh, and the
+        opened files, are queried.
+
+        :param full: If True the index is rebuilt from scratch, picking up
+            any changes made outside of xpf
+        :type full: bool
+
+        :return: True if the index was refreshed
+        """
+        with self._lock:
+            last_change = self.last_change
+
+            if full or last_change is None or self._stale:
+                return self._rebuild()
+
+            latest = self._latest_change()
+
+            if latest is None:
+                return False
+
+            changed = list()
+
+            if latest > last_change:
+                changed = self._fstat('-Rh', '-c', last_change, self._client_path())
+
+            opened = self._fstat('-Ro', self._client_path())
+
+            if changed is None or opened is None:
+                return False
+
+            with self._db() as db:
+                self._upsert(db, changed)
+
+                # -- The opened state is replaced entirely, as files may
+                # -- have been opened or reverted outside of xpf
+                db.execute('UPDATE files SET action = NULL, change = NULL')
+                self._upsert(db, opened)
+                self._remove_untracked(db)
+                self._set_state(db, 'last_change', latest)
+
+            return True
+
+    # --------------------------------------------------------------------------
+    def ensure_current(self):
+        """
+        Builds the index if it has never been built, and queries any files
+        which our own commands have altered.
+
+        :return: True if the index is up to date, False if the server could
+            not be asked, in which case the index must not be relied upon
+        """
+        with self._lock:
+            return self._ensure_current()
+
+    # --------------------------------------------------------------------------
+    def mark_written(self, args, results):
+        """
+        Marks the files affected by a command as out of date, so they are
+        queried again the next time the index is read.
+
+        :param args: The flattened arguments of the command, starting with
+            the command itself, or None if they are not known
+        :type args: list(str, ...)
+
+        :param results: The results of the command
+
+        :return: None
+        """
+        affected = commands.affected_paths(args, results)
+
+        with self._lock:
+            if affected is None:
+                self._stale = True
+                return
+
+            self._pending_paths.update(affected[0])
+            self._pending_prefixes.update(affected[1])
+
+    # --------------------------------------------------------------------------
+    def close(self):
+        """
+        Closes the connection to the database.
+
+        :return: None
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # --------------------------------------------------------------------------
+    def _ensure_current(self):
+        """
+        Builds the index if it has never been built, and queries any files
+        which our own commands have altered.
+
+        :return: True if the index is up to date
+        """
+        if self._stale or self.last_change is None:
+            return self._rebuild()
+
+        if not self._pending_paths and not self._pending_prefixes:
+            return True
+
+        paths = list(self._pending_paths)
+        prefixes = list(self._pending_prefixes)
+
+        records = self._fstat(
+            list(paths) + [prefix + '...' for prefix in prefixes],
+        )
+
+        # -- If the server could not be reached we leave them pending
+        if records is None:
+            return False
+
+        with self._db() as db:
+            for path in paths:
+                if path.startswith('//'):
+                    db.execute('DELETE FROM files WHERE depot_file = ?', (path,))
+
+                else:
+                    db.execute(
+                        'DELETE FROM files WHERE local_key = ?',
+                        (_normalise(path),),
+                    )
+
+            for prefix in prefixes:
+                column = 'depot_file'
+
+                if not prefix.startswith('//'):
+                    column = 'local_key'
+                    prefix = _normalise(prefix) + os.sep
+
+                db.execute(
+                    'DELETE FROM files WHERE substr(%s, 1, ?) = ?' % column,
+                    (len(prefix), prefix),
+                )
+
+            self._upsert(db, records)
+            self._remove_untracked(db)
+
+        self._pending_paths.difference_update(paths)
+        self._pending_prefixes.difference_update(prefixes)
+
+        return True
+
+    # --------------------------------------------------------------------------
+    def _rebuild(self):
+        """
+        Rebuilds the index from scratch.
+
+        :return: True if the index was rebuilt
+        """
+        # -- The change is taken first so nothing submitted whilst we are
+        # -- building can be missed by the next refresh
+        latest = self._latest_change()
+
+        if latest is None:
+            return False
+
+        had = self._fstat('-Rh', self._client_path())
+        opened = self._fstat('-Ro', self._client_path())
+
+        if had is None or opened is None:
+            return False
+
+        with self._db() as db:
+            db.execute('DELETE FROM files')
+            self._upsert(db, had)
+            self._upsert(db, opened)
+            self._set_state(db, 'last_change', latest)
+
+        self._stale = False
+        self._pending_paths.clear()
+        self._pending_prefixes.clear()
+
+        return True
+
+    # --------------------------------------------------------------------------
+    def _latest_change(self):
+        """
+        Returns the most recent submitted change on the server.
+
+        :return: int or None if the server could not be asked
+        """
+        # -- A failed call must not be mistaken for a server which has no
+        # -- submitted changes
+        records = connection.checked_run(
+            'changes',
+            '-m1',
+            '-s',
+            'submitted',
+            port=self.port,
+            client=self.client,
+        )
+
+        if records is None:
+            return None
+
+        for record in records:
+            if 'change' in record:
+                return int(record['change'])
+
+        return 0
+
+    # --------------------------------------------------------------------------
+    def _fstat(self, *args):
+        """
+        Returns the indexed fields of the given files.
+
+        :return: list(dict, ...) or None if the server could not be asked
+        """
+        # -- A failed call must not be mistaken for there being no files,
+        # -- which would wipe the index
+        return connection.checked_run(
+            'fstat',
+            '-T',
+            ','.join(_FIELDS),
+            *args,
+            port=self.port,
+            client=self.client,
+            timeout=variables.get_workspace_index_timeout()
+        )
+
+    # --------------------------------------------------------------------------
+    def _client_path(self):
+        return '//%s/...' % self.client
+
+    # --------------------------------------------------------------------------
+    def _db(self):
+        """
+        Returns the connection to the database, creating the database if it
+        does not exist. An index built for a different client or server (or
+        an older version of xpf) is discarded.
+
+        :return: sqlite3.Connection
+        """
+        if self._connection is not None:
+            return self._connection
+
+        directory = os.path.dirname(self.path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+
+            except OSError:
+                pass
+
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+
+        except sqlite3.Error:
+            pass
+
+        with db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS state ('
+                'key TEXT PRIMARY KEY, '
+                'value TEXT)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'depot_file TEXT PRIMARY KEY, '
+                'local_key TEXT, '
+                'client_file TEXT, '
+                'have_rev INTEGER, '
+                'head_rev INTEGER, '
+                'head_action TEXT, '
+                'head_change INTEGER, '
+                'head_type TEXT, '
+                'action TEXT, '
+                'change TEXT)'
+            )
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS files_local_key '
+                'ON files (local_key)'
+            )
+
+            identity = '%s|%s|%s|%s' % (
+                _SCHEMA_VERSION,
+                self.port,
+                self.client,
+                self.host,
+            )
+            row = db.execute(
+                "SELECT value FROM state WHERE key = 'identity'",
+            ).fetchone()
+
+            if row is None or row[0] != identity:
+                db.execute('DELETE FROM files')
+                db.execute('DELETE FROM state')
+                self._set_state(db, 'identity', identity)
+
+        self._connection = db
+        return db
+
+    # --------------------------------------------------------------------------
+    def _get_state(self, key):
+        row = self._db().execute(
+            'SELECT value FROM state WHERE key = ?',
+            (key,),
+        ).fetchone()
+
+        return row[0] if row else None
+
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _set_state(db, key, value):
+        db.execute(
+            'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+            (key, str(value)),
+        )
+
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _upsert(db, records):
+        """
+        Stores the given fstat records, replacing any existing data for the
+        same files. Records of files which are neither had nor opened are
+        removed from the index.
+
+        :return: None
+        """
+        rows = list()
+        removed = list()
+
+        for record in records:
+            if not isinstance(record, dict) or 'depotFile' not in record:
+                continue
+
+            if 'haveRev' not in record and 'action' not in record:
+                removed.append((record['depotFile'],))
+                continue
+
+            local_key = None
+
+            if record.get('clientFile'):
+                local_key = _normalise(record['clientFile'])
+
+            rows.append(
+                (
+                    record['depotFile'],
+                    local_key,
+                    record.get('clientFile'),
+                    _to_int(record.get('haveRev')),
+                    _to_int(record.get('headRev')),
+                    record.get('headAction'),
+                    _to_int(record.get('headChange')),
+                    record.get('headType'),
+                    record.get('action'),
+                    record.get('change'),
+                )
+            )
+
+        db.executemany('DELETE FROM files WHERE depot_file = ?', removed)
+        db.executemany(
+            'INSERT OR REPLACE INTO files (depot_file, local_key, client_file, '
+            'have_rev, head_rev, head_action, head_change, head_type, action, '
+            'change) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def _remove_untracked(db):
+        db.execute('DELETE FROM files WHERE have_rev IS NULL AND action IS NULL')
+
+
+# ------------------------------------------------------------------------------
+def _normalise(path):
+    """
+    Private function which normalises a local path so that paths given by
+    the caller can be compared with those p4 reports.
+
+    :param path: The path to normalise
+    :type path: str
+
+    :return: str
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+# ------------------------------------------------------------------------------
+def _to_int(value):
+    """
+    Private function which converts a numeric field to an int, returning
+    None for anything which is not numeric (such as 'none').
+
+    :return: int or None
+    """
+    try:
+        return int(value)
+
+    except (TypeError, ValueError):
+        return None
+
+
+# -- Ensure the index is told about our own writes
+connection.add_write_hook(on_write)